@@ -1,34 +1,31 @@
 
-import urllib2
 import re
 from datetime import datetime, timedelta
 
+from sharppy.io.fetch import fetch, get_fetcher
+
 spc_base_url = "http://www.spc.noaa.gov/exper/soundings/"
 
 def _available_spc():
-    text = urllib2.urlopen(spc_base_url).read()
+    text = fetch(spc_base_url)
     matches = sorted(list(set(re.findall("([\d]{8})_OBS", text))))
     return [ datetime.strptime(m, '%y%m%d%H') for m in matches ]
 
 def _availableat_spc(dt):
     recent_url = "%s%s/" % (spc_base_url, dt.strftime('%y%m%d%H_OBS'))
-    text = urllib2.urlopen(recent_url).read()
+    text = fetch(recent_url)
     matches = re.findall("alt=\"([\w]{3}|[\d]{5})\"", text)
     return matches
 
 psu_base_url = "ftp://ftp.meteo.psu.edu/pub/bufkit/"
-psu_text = ""
-psu_time = None
 
-def _download_psu():
-    global psu_time, psu_text
-    now = datetime.utcnow()
-    if psu_time is None or psu_time < now - timedelta(minutes=5):
-        psu_time = now
+# How long (in seconds) to use the listings before checking the servers again. The PSU
+#   FTP listings can't be revalidated cheaply, so they're held longer.
+get_fetcher().setTTL(spc_base_url, 60)
+get_fetcher().setTTL(psu_base_url, 300)
 
-        url_obj = urllib2.urlopen(psu_base_url)
-        psu_text = url_obj.read()
-    return psu_text 
+def _download_psu():
+    return fetch(psu_base_url)
 
 def _availableat_psu(model, dt):
     if model == '4km nam': model = 'nam4km'
@@ -36,8 +33,7 @@ def _availableat_psu(model, dt):
 
     cycle = dt.hour
     url = "%s%s/%02d/" % (psu_base_url, model.upper(), cycle)
-    url_obj = urllib2.urlopen(url)
-    text = url_obj.read()
+    text = fetch(url)
     stns = re.findall("%s_(.+)\.buf" % _repl[model], text)
     return stns
 
@@ -3,6 +3,14 @@ import xml.etree.ElementTree as ET
 import glob
 from datetime import datetime, timedelta
 import urllib
+import threading
+import os
+import cPickle
+from multiprocessing.pool import ThreadPool
+
+# datetime.strptime() imports this lazily, which isn't thread-safe in Python 2, so make
+#   sure it's imported before the prefetcher threads start parsing dates.
+import _strptime
 
 import available
 
@@ -18,6 +26,89 @@ _decoder = {
 
 # TAS: Comment this file and available.py
 
+# How long to hold on to the results of availability checks before asking
+#   the server again
+AVAILABLE_TTL = timedelta(minutes=5)
+
+# Bump this if the layout of the binary point tables changes
+POINT_TABLE_VERSION = 1
+
+_point_tables = {}
+_point_lock = threading.Lock()
+
+def _readCSV(csv_file_name):
+    csv = []
+    csv_file = open(csv_file_name, 'r')
+    fields = [ f.lower() for f in csv_file.readline().strip().split(',') ]
+
+    for line in csv_file:
+        line_dict = dict( (f, v) for f, v in zip(fields, line.strip().split(',')))
+        line_dict['lat'] = float(line_dict['lat'])
+        line_dict['lon'] = float(line_dict['lon'])
+        line_dict['elev'] = int(line_dict['elev'])
+        csv.append(line_dict)
+
+    csv_file.close()
+    return fields, csv
+
+def loadPoints(csv_file_name):
+    '''
+    Load the points in a data source CSV file. The parsed points are saved
+    in a binary table next to the CSV file (<csv file>.pkl), which is used
+    instead of the CSV as long as the CSV hasn't changed since. Outlets
+    sharing a CSV file share the points.
+
+    Parameters
+    ----------
+    csv_file_name : string
+    The path to the CSV file
+
+    Returns
+    -------
+    A tuple of (list of field names, list of point dictionaries)
+    '''
+    csv_file_name = os.path.abspath(csv_file_name)
+    with _point_lock:
+        if csv_file_name in _point_tables:
+            return _point_tables[csv_file_name]
+
+        csv_stat = os.stat(csv_file_name)
+        csv_stamp = (POINT_TABLE_VERSION, csv_stat.st_mtime, csv_stat.st_size)
+        table_file_name = csv_file_name + '.pkl'
+
+        table = None
+        try:
+            table_file = open(table_file_name, 'rb')
+            stamp = cPickle.load(table_file)
+            if stamp == csv_stamp:
+                table = cPickle.load(table_file)
+            table_file.close()
+        except Exception:
+            # A missing or unreadable table (unpickling a damaged file can raise
+            #   almost anything) just means parsing the CSV file again.
+            table = None
+
+        if table is None:
+            table = _readCSV(csv_file_name)
+            # Write to a temporary file and move it into place, so another process
+            #   loading the points never sees a partially-written table.
+            tmp_name = "%s.%d.tmp" % (table_file_name, os.getpid())
+            try:
+                table_file = open(tmp_name, 'wb')
+                cPickle.dump(csv_stamp, table_file, cPickle.HIGHEST_PROTOCOL)
+                cPickle.dump(table, table_file, cPickle.HIGHEST_PROTOCOL)
+                table_file.close()
+                if os.name == 'nt' and os.path.exists(table_file_name):
+                    os.remove(table_file_name)
+                os.rename(tmp_name, table_file_name)
+            except (IOError, OSError):
+                # Can't write next to the CSV file (e.g. a read-only install), so just
+                #   parse the CSV file every time.
+                pass
+
+        _point_tables[csv_file_name] = table
+    return table
+
 def loadDataSources(ds_dir='../datasources'):
     files = glob.glob(ds_dir + '/*.xml')
     ds = {}
@@ -36,12 +127,161 @@ class Outlet(object):
         self._format = config.get('format')
         self._time = config.find('time')
         point_csv = config.find('points')
-        self._points = self._loadCSV("../datasources/" + point_csv.get("csv"))
+        self._csv_file_name = "../datasources/" + point_csv.get("csv")
+
+        # The points are loaded the first time they're needed.
+        self._points = None
+        self._load_lock = threading.Lock()
+
+        self._memo = {}
+        self._memo_pending = {}
+        self._memo_lock = threading.Lock()
+
+    def _loadPoints(self):
+        with self._load_lock:
+            if self._points is None:
+                self._csv_fields, points = loadPoints(self._csv_file_name)
+                self._buildIndexes(points)
+                self._points = points
+
+    def _buildIndexes(self, points):
+        # Lookup tables from the various station identifiers to the points. Some CSV files
+        #   have more than one point with the same srcid (e.g. two stations both called
+        #   c04), so the srcid table holds lists of points, in the order of the CSV file.
+        self._by_srcid = {}
+        self._by_icao = {}
+        self._by_wmo = {}
+        for pt in points:
+            self._by_srcid.setdefault(pt['srcid'], []).append(pt)
+            if pt.get('icao', '') != "":
+                self._by_icao.setdefault(pt['icao'].upper(), pt)
+            if pt.get('synop', '') != "":
+                self._by_wmo.setdefault(pt['synop'], pt)
+
+    def _memoize(self, key, func):
+        # Return the result of func(), reusing the result from an earlier call with the same
+        #   key if it hasn't expired yet (results expire AVAILABLE_TTL after they're computed,
+        #   unless the prefetcher says otherwise). If another thread is already computing the
+        #   result for this key, wait for it instead of asking the server twice.
+        while True:
+            with self._memo_lock:
+                if key in self._memo:
+                    expires, value = self._memo[key]
+                    if datetime.utcnow() < expires:
+                        return value
+
+                pending = self._memo_pending.get(key)
+                if pending is None:
+                    pending = threading.Event()
+                    self._memo_pending[key] = pending
+                    break
+            pending.wait()
+
+        try:
+            value = func()
+            self._memoStore(key, value, datetime.utcnow() + AVAILABLE_TTL)
+        finally:
+            with self._memo_lock:
+                del self._memo_pending[key]
+            pending.set()
+        return value
+
+    def _memoStore(self, key, value, expires):
+        with self._memo_lock:
+            self._memo[key] = (expires, value)
+
+    def invalidate(self, cycle=None):
+        '''
+        Forget the memoized availability results, so the next call asks the
+        server again.
+
+        Parameters
+        ----------
+        cycle : datetime object (optional)
+        Only forget the station availability for this cycle (the list of
+        available cycles is always forgotten). Default is to forget everything.
+        '''
+        with self._memo_lock:
+            if cycle is None:
+                self._memo = {}
+            else:
+                for key in self._memo.keys():
+                    if key[0] in [ 'available', 'times' ] or key[1:] == (cycle,):
+                        del self._memo[key]
+
+    def _hasAvailable(self):
+        return self._name.lower() in available.available and self._ds_name.lower() in available.available[self._name.lower()]
+
+    def _hasAvailableAt(self):
+        return self._name.lower() in available.availableat and self._ds_name.lower() in available.availableat[self._name.lower()]
+
+    def _getAvailable(self):
+        func = available.available[self._name.lower()][self._ds_name.lower()]
+        return self._memoize(('available',), func)
+
+    def _getAvailableSrcids(self, dt):
+        func = available.availableat[self._name.lower()][self._ds_name.lower()]
+        return self._memoize(('availableat', dt), lambda: func(dt))
+
+    def _getStations(self, srcids):
+        return [ pt for stn in srcids for pt in self._by_srcid.get(stn, []) ]
+
+    def getNextRefresh(self):
+        '''
+        Get the time at which the next cycle should become available (the
+        next cycle time plus the delay).
+        '''
+        now = datetime.utcnow()
+        delay = timedelta(hours=self.getDelay())
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        avail = [ today + timedelta(days=day, hours=hr) + delay for day in [ -1, 0, 1 ] for hr in self.getCycles() ]
+        return min(t for t in avail if t > now)
+
+    def prefetch(self, until):
+        '''
+        Ask the server which cycles are available, and which stations are
+        available for the most recent cycles, and hold on to the results
+        until the given time. Results from earlier calls are used until the
+        new ones are in.
+
+        Parameters
+        ----------
+        until : datetime object
+        The time until which to keep the results
+
+        Returns
+        -------
+        None
+        '''
+        if self._hasAvailable():
+            func = available.available[self._name.lower()][self._ds_name.lower()]
+            self._memoStore(('available',), func(), until)
 
-        for idx in xrange(len(self._points)):
-            self._points[idx]['lat'] = float(self._points[idx]['lat'])
-            self._points[idx]['lon'] = float(self._points[idx]['lon'])
-            self._points[idx]['elev'] = int(self._points[idx]['elev'])
+        times = self.getAvailableTimes()
+        self._memoStore(('times',), times, until)
+
+        self._loadPoints()
+        if self._hasAvailableAt() and len(times) > 0:
+            # Warm up the most recent cycle and the most recent synoptic (00/12 UTC) cycle,
+            #   which is what the GUI starts on.
+            warm = set([ max(times) ])
+            synoptic = [ t for t in times if t.hour in [ 0, 12 ] ]
+            if len(synoptic) > 0:
+                warm.add(max(synoptic))
+
+            func = available.availableat[self._name.lower()][self._ds_name.lower()]
+            for dt in warm:
+                srcids = func(dt)
+                self._memoStore(('availableat', dt), srcids, until)
+                self._memoStore(('srcids', dt), set(srcids), until)
+                self._memoStore(('stations', dt), self._getStations(srcids), until)
+
+        # Clean out the expired results
+        now = datetime.utcnow()
+        with self._memo_lock:
+            for key, (expires, value) in self._memo.items():
+                if expires <= now:
+                    del self._memo[key]
 
     def getForecastHours(self):
         times = []
@@ -66,8 +306,8 @@ class Outlet(object):
         return int(self._time.get('delay'))
 
     def getMostRecentCycle(self):
-        if self._name.lower() in available.available and self._ds_name.lower() in available.available[self._name.lower()]:
-            times = available.available[self._name.lower()][self._ds_name.lower()]()
+        if self._hasAvailable():
+            times = self._getAvailable()
             recent = max(times)
         else:
             now = datetime.utcnow()
@@ -110,27 +350,18 @@ class Outlet(object):
         if dt is None:
             dt = self.getMostRecentCycle()
 
-        if self._name.lower() in available.availableat and self._ds_name.lower() in available.availableat[self._name.lower()]:
-            avail = available.availableat[self._name.lower()][self._ds_name.lower()](dt)
-
-            stns_avail = []
-            points = self.getPoints()
-            srcids = [ p['srcid'] for p in points ]
-
-            for stn in avail:
-                try:
-                    idx = srcids.index(stn)
-                    stns_avail.append(points[idx])
-                except ValueError:
-                    pass
+        self._loadPoints()
+        if self._hasAvailableAt():
+            getStations = lambda: self._getStations(self._getAvailableSrcids(dt))
+            stns_avail = list(self._memoize(('stations', dt), getStations))
         else:
             stns_avail = self.getPoints()
 
         return stns_avail
 
     def getAvailableTimes(self, max_cycles=100):
-        if self._name.lower() in available.available and self._ds_name.lower() in available.available[self._name.lower()]:
-            times = available.available[self._name.lower()][self._ds_name.lower()]()
+        if self._hasAvailable():
+            times = self._getAvailable()
             if len(times) == 1:
                 times = self.getArchivedCycles(start=times[0], max_cycles=max_cycles)
         else:
@@ -147,33 +378,46 @@ class Outlet(object):
         return _decoder[self._format]
 
     def hasProfile(self, point, cycle):
-        times = self.getAvailableTimes()
+        times = self._memoize(('times',), self.getAvailableTimes)
         has_prof = cycle in times 
 
         if has_prof:
-            stns = self.getAvailableAtTime(dt=cycle)
-            has_prof = point in stns
+            self._loadPoints()
+            if self._hasAvailableAt():
+                stns = self._memoize(('srcids', cycle), lambda: set(self._getAvailableSrcids(cycle)))
+            else:
+                stns = self._by_srcid
+            has_prof = point['srcid'] in stns and point in self._by_srcid.get(point['srcid'], [])
         return has_prof
 
     def getPoints(self):
+        self._loadPoints()
         points = self._points
         return points
 
+    def getPoint(self, srcid=None, icao=None, wmo=None):
+        '''
+        Look up a point by its source id, ICAO identifier, or WMO number.
+
+        Returns
+        -------
+        The point dictionary, or None if there's no such point. If more
+        than one point has the identifier, the first one in the CSV file is
+        returned.
+        '''
+        self._loadPoints()
+        if srcid is not None:
+            return self._by_srcid.get(srcid, [ None ])[0]
+        elif icao is not None:
+            return self._by_icao.get(icao.upper())
+        elif wmo is not None:
+            return self._by_wmo.get(str(wmo))
+        return None
+
     def getFields(self):
+        self._loadPoints()
         return self._csv_fields
 
-    def _loadCSV(self, csv_file_name):
-        csv = []
-        csv_file = open(csv_file_name, 'r')
-        self._csv_fields = [ f.lower() for f in csv_file.readline().strip().split(',') ]
-
-        for line in csv_file:
-            line_dict = dict( (f, v) for f, v in zip(self._csv_fields, line.strip().split(',')))
-            csv.append(line_dict)
-
-        csv_file.close()
-        return csv
-
 class DataSource(object):
     def __init__(self, config):
         self._name = config.get('name')
@@ -235,14 +479,31 @@ class DataSource(object):
         points = self._get('getAvailableAtTime', outlet, flatten=False, dt=dt)
 
         flatten_pts = []
-        flatten_coords = []
+        flatten_coords = set()
         for pt_list in points:
             for pt in pt_list:
                 if (pt['lat'], pt['lon']) not in flatten_coords:
-                    flatten_coords.append((pt['lat'], pt['lon']))
+                    flatten_coords.add((pt['lat'], pt['lon']))
                     flatten_pts.append(pt)
         return flatten_pts
 
+    def getPoint(self, srcid=None, icao=None, wmo=None, outlet=None):
+        if outlet is not None:
+            return self._outlets[outlet].getPoint(srcid=srcid, icao=icao, wmo=wmo)
+
+        for out in self._outlets.itervalues():
+            point = out.getPoint(srcid=srcid, icao=icao, wmo=wmo)
+            if point is not None:
+                return point
+        return None
+
+    def invalidate(self, cycle=None, outlet=None):
+        if outlet is None:
+            for out in self._outlets.itervalues():
+                out.invalidate(cycle=cycle)
+        else:
+            self._outlets[outlet].invalidate(cycle=cycle)
+
     def getDecoder(self, stn, cycle_dt, outlet=None):
         outlet = self._getOutletWithProfile(stn, cycle_dt, outlet)
         decoder = self._outlets[outlet].getDecoder()
@@ -267,8 +528,75 @@ class DataSource(object):
     def isEnsemble(self):
         return self._ensemble
 
+class AvailabilityPrefetcher(object):
+    '''
+    Keeps the availability of every outlet of every data source warm in
+    the background, so the GUI never has to wait on the network to switch
+    models or cycles. All the outlets are queried concurrently when the
+    prefetcher starts, and each one is queried again when its next cycle
+    is due (according to the cycle and delay in the data source config),
+    or after max_interval, whichever is sooner.
+    '''
+    def __init__(self, data_sources, n_threads=8, max_interval=timedelta(minutes=15), retry_interval=timedelta(minutes=1)):
+        self._outlets = [ out for ds in data_sources.itervalues() for out in ds._outlets.itervalues() ]
+        self._n_threads = n_threads
+        self._max_interval = max_interval
+        self._retry_interval = retry_interval
+
+        self._next_refresh = dict( (out, datetime.utcnow()) for out in self._outlets )
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='AvailabilityPrefetcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def refreshNow(self):
+        '''
+        Query every outlet again right away.
+        '''
+        now = datetime.utcnow()
+        for out in self._outlets:
+            self._next_refresh[out] = now
+        self._wake.set()
+
+    def _refresh(self, outlet):
+        now = datetime.utcnow()
+        next_refresh = min(outlet.getNextRefresh(), now + self._max_interval)
+        try:
+            # Hang on to the results a little past the next refresh, so they're still good
+            #   while the refresh is running.
+            outlet.prefetch(next_refresh + AVAILABLE_TTL)
+        except Exception:
+            # Probably no network; try again soon.
+            next_refresh = now + self._retry_interval
+        self._next_refresh[outlet] = next_refresh
+
+    def _run(self):
+        pool = ThreadPool(self._n_threads)
+        while not self._stopped:
+            now = datetime.utcnow()
+            due = [ out for out in self._outlets if self._next_refresh[out] <= now ]
+            if len(due) > 0:
+                pool.map(self._refresh, due)
+
+            self._wake.clear()
+            wait = min(self._next_refresh.itervalues()) - datetime.utcnow()
+            wait = max(wait.days * 86400 + wait.seconds, 1)
+            self._wake.wait(wait)
+        pool.close()
+
 if __name__ == "__main__":
+    import time
+    start = time.time()
     ds = loadDataSources()
+    print "Loaded data sources in %.3f s" % (time.time() - start)
     ds = dict( (n, ds[n]) for n in ['Observed', 'GFS'] )
 
     for n, d in ds.iteritems():
@@ -1,4 +1,5 @@
 import sys, os
+import time
 import numpy as np
 import warnings
 
@@ -14,6 +15,8 @@ from sharppy.viz import SkewApp, MapWidget
 import sharppy.sharptab.profile as profile
 from sharppy.io.spc_decoder import SPCDecoder
 from sharppy.io.buf_decoder import BufDecoder
+from sharppy.io.decoder import CancelToken, Cancelled
+from sharppy.io.map_params import MAP_PARAMS, StationParams
 from sharppy.version import __version__, __version_name__
 from datasources import data_source
 
@@ -22,72 +25,149 @@ from PySide.QtGui import *
 import datetime as date
 import traceback
 from functools import wraps, partial
-import hashlib
 import cProfile
+import threading
+import itertools
+import Queue
 from os.path import expanduser
 
-class AsyncThreads(QObject):
-    def __init__(self):
-        super(AsyncThreads, self).__init__()
-        self.threads = {}
-        self.callbacks = {}
-        return
+class AsyncPool(QObject):
+    """
+    Runs functions on a fixed number of worker threads and hands the
+    results to callbacks on the GUI thread.
+
+    post() takes a few special keyword arguments that aren't passed on to
+    the function:
+    __priority__ : jobs with lower numbers run first (PRIORITY_INTERACTIVE
+        by default, PRIORITY_PREFETCH for background work)
+    __key__ : if a job with the same key is already queued or running
+        (and hasn't been cancelled), no new job is started and the callback
+        is attached to that job
+    __token__ : the CancelToken for the job (one is made if not given)
+    """
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_PREFETCH = 10
+
+    _finished = Signal(str, tuple)
+
+    def __init__(self, n_threads=4):
+        super(AsyncPool, self).__init__()
+        self._queue = Queue.PriorityQueue()
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._tasks = {}
+        self._keys = {}
+
+        self._finished.connect(self._finish)
+
+        self._workers = [ self._workerFactory() for idx in xrange(n_threads) ]
+        for worker in self._workers:
+            worker.start()
+
+        if QCoreApplication.instance() is not None:
+            QCoreApplication.instance().aboutToQuit.connect(self.stop)
 
     def post(self, func, callback, *args, **kwargs):
-        thd_id = self._genThreadId()
-
-        thd = self._threadFactory(func, thd_id, *args, **kwargs)
-        thd.finished.connect(self.finish)
-        thd.start()
-
-        self.threads[thd_id] = thd
+        priority = kwargs.pop('__priority__', AsyncPool.PRIORITY_INTERACTIVE)
+        key = kwargs.pop('__key__', None)
+        token = kwargs.pop('__token__', None)
+        if token is None:
+            token = CancelToken()
         if callback is None:
             callback = lambda x: x
-        self.callbacks[thd_id] = callback
-        return thd_id
 
-    def isFinished(self, thread_id):
-        return not (thread_id in self.threads)
+        with self._lock:
+            if key is not None and key in self._keys:
+                task_id = self._keys[key]
+                # A cancelled job is on its way out, so start a new one instead.
+                if not self._tasks[task_id]['token'].isCancelled():
+                    self._tasks[task_id]['callbacks'].append(callback)
+                    return task_id
+
+            seq = self._counter.next()
+            task_id = str(seq)
+            self._tasks[task_id] = { 'func':func, 'args':args, 'kwargs':kwargs, 'key':key,
+                'token':token, 'callbacks':[ callback ] }
+            if key is not None:
+                self._keys[key] = task_id
+
+        self._queue.put((priority, seq, task_id))
+        return task_id
+
+    def cancel(self, task_id):
+        """
+        Cancel a job. If it hasn't started yet, it won't be run. If it's
+        running, its cancel token is set. Either way, its callbacks won't
+        be called.
+        """
+        task = self._removeTask(task_id)
+        if task is not None:
+            task['token'].cancel()
 
-    def join(self, thread_id):
-        while not self.isFinished(thread_id):
+    def isFinished(self, task_id):
+        return not (task_id in self._tasks)
+
+    def join(self, task_id):
+        while not self.isFinished(task_id):
             QCoreApplication.processEvents()
 
-    @Slot(str, tuple)
-    def finish(self, thread_id, ret_val):
-        thd = self.threads[thread_id]
-        callback = self.callbacks[thread_id]
+    def stop(self):
+        for worker in self._workers:
+            self._queue.put((-1, -1, None))
+        for worker in self._workers:
+            worker.wait()
+
+    def _removeTask(self, task_id):
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            # The key may belong to a newer job by now (see post())
+            if task is not None and self._keys.get(task['key']) == task_id:
+                del self._keys[task['key']]
+        return task
+
+    def _work(self):
+        while True:
+            priority, seq, task_id = self._queue.get()
+            if task_id is None:
+                break
+
+            with self._lock:
+                task = self._tasks.get(task_id, None)
+            if task is None:
+                continue
+            if task['token'].isCancelled():
+                # Cancelled through its token before it got to run
+                self._removeTask(task_id)
+                continue
 
-        callback(ret_val)
+            try:
+                ret_val = task['func'](*task['args'], **task['kwargs'])
+            except Exception as e:
+                if debug and not isinstance(e, Cancelled):
+                    print traceback.format_exc()
+                ret_val = e
+            if type(ret_val) != tuple:
+                ret_val = (ret_val, )
 
-        del self.threads[thread_id]
-        del self.callbacks[thread_id]
+            self._finished.emit(task_id, ret_val)
 
-    def _genThreadId(self):
-        time_stamp = date.datetime.utcnow().isoformat()
-        return hashlib.md5(time_stamp).hexdigest()
+    @Slot(str, tuple)
+    def _finish(self, task_id, ret_val):
+        task = self._removeTask(task_id)
+        if task is None or task['token'].isCancelled():
+            return
 
-    def _threadFactory(self, func, thread_id, *args, **kwargs):
+        for callback in task['callbacks']:
+            callback(ret_val)
 
-        class AsyncThread(QThread):
-            finished = Signal(str, tuple)
+    def _workerFactory(self):
+        pool = self
 
-            def __init__(self):
-                super(AsyncThread, self).__init__()
-            
+        class AsyncWorker(QThread):
             def run(self):
-                try:
-                    ret_val = func(*args, **kwargs)
-                except Exception as e:
-                    if debug:
-                        print traceback.format_exc()
-                    ret_val = e
-                if type(ret_val) != tuple:
-                    ret_val = (ret_val, )
+                pool._work()
 
-                self.finished.emit(thread_id, ret_val)
-
-        return AsyncThread()
+        return AsyncWorker()
 
 class progress(QObject):
     _progress = Signal(int, int)
@@ -117,11 +197,16 @@ class progress(QObject):
         self._kwargs['__prog__'] = self._progress
         self._kwargs['__text__'] = self._text
 
+        self._token = CancelToken()
+        self._kwargs['__cancel__'] = self._token
+        self._kwargs['__token__'] = self._token
+
         self._progress_dialog = QProgressDialog()
         self._progress.connect(self.updateProgress)
         self._text.connect(self.updateText)
         self._progress_dialog.setMinimum(0)
         self._progress_dialog.setValue(0)
+        self._progress_dialog.canceled.connect(self.cancel)
 
         self._progress_dialog.open()
         self._isfinished = False
@@ -131,13 +216,19 @@ class progress(QObject):
             self._progress_dialog.close()
             self._ret_val = ret_val
 
-        self._async.post(self._func, finish, *self._args, **self._kwargs)
+        self._task_id = self._async.post(self._func, finish, *self._args, **self._kwargs)
 
         while not self._isfinished:
             QCoreApplication.processEvents()
 
         return self._ret_val
 
+    @Slot()
+    def cancel(self):
+        self._async.cancel(self._task_id)
+        self._isfinished = True
+        self._ret_val = (Cancelled(), )
+
     @Slot(int, int)
     def updateProgress(self, value, maximum):
         text = self._prog_text
@@ -161,7 +252,7 @@ class MainWindow(QWidget):
     date_format = "%Y-%m-%d %HZ"
     run_format = "%d %B %Y / %H%M UTC"
 
-    async = AsyncThreads()
+    async = AsyncPool()
 
     def __init__(self, **kwargs):
         """
@@ -172,7 +263,18 @@ class MainWindow(QWidget):
         """
 
         super(MainWindow, self).__init__(**kwargs)
+        ds_start = time.time()
         self.data_sources = data_source.loadDataSources()
+        if debug:
+            print "Loaded data sources in %.2f s" % (time.time() - ds_start)
+
+        ## check what's available from all the data sources in the background
+        self.prefetcher = data_source.AvailabilityPrefetcher(self.data_sources)
+        self.prefetcher.start()
+
+        ## computes the parameters for the map overlay in worker processes
+        self.station_params = StationParams()
+        app.aboutToQuit.connect(self.station_params.close)
 
         ## All of these variables get set/reset by the various menus in the GUI
 
@@ -229,6 +331,7 @@ class MainWindow(QWidget):
         self.model_dropdown = self.dropdown_menu(models)
         self.model_dropdown.setCurrentIndex(models.index(self.model))
         self.map_dropdown = self.dropdown_menu(['Northern Hemisphere', 'Tropics (Coming Soon!)', 'Southern Hemisphere (Coming Soon!)'])
+        self.param_dropdown = self.dropdown_menu(['Stations'] + MAP_PARAMS.keys())
         times = self.data_sources[self.model].getAvailableTimes()
         self.run_dropdown = self.dropdown_menu([ t.strftime(MainWindow.run_format) for t in times ])
         self.run_dropdown.setCurrentIndex(times.index(self.run))
@@ -236,12 +339,15 @@ class MainWindow(QWidget):
         ## connect the click actions to functions that do stuff
         self.model_dropdown.activated.connect(self.get_model)
         self.map_dropdown.activated.connect(self.get_map)
+        self.param_dropdown.activated.connect(self.get_param)
+        self.profile_list.itemSelectionChanged.connect(self.get_fhour)
         self.run_dropdown.activated.connect(self.get_run)
 
         ## Create text labels to describe the various menus
         self.type_label = QLabel("Select Sounding Source")
         self.date_label = QLabel("Select Forecast Time")
         self.map_label = QLabel("Select Map Area")
+        self.param_label = QLabel("Select Map Parameter")
         self.run_label = QLabel("Select Cycle")
         self.date_label.setDisabled(True)
 
@@ -258,6 +364,8 @@ class MainWindow(QWidget):
         ## add the elements to the right side of the GUI
         self.right_layout.addWidget(self.map_label)
         self.right_layout.addWidget(self.map_dropdown)
+        self.right_layout.addWidget(self.param_label)
+        self.right_layout.addWidget(self.param_dropdown)
         self.right_layout.addWidget(self.view)
 
         ## add the left and right sides to the main window
@@ -353,7 +461,7 @@ class MainWindow(QWidget):
         view : QWebView object
         """
 
-        view = MapWidget(self.data_sources[self.model], self.run, self.async, width=800, height=500)
+        view = MapWidget(self.data_sources[self.model], self.run, self.async, params=self.station_params, width=800, height=500)
         view.clicked.connect(self.map_link)
 
         return view
@@ -510,6 +618,23 @@ class MainWindow(QWidget):
         """
         pass
 
+    def get_param(self, index):
+        """
+        Get the user's selection for the map overlay
+        """
+        if index == 0:
+            self.view.setParameter(None)
+        else:
+            self.view.setParameter(self.param_dropdown.currentText())
+
+    def get_fhour(self):
+        """
+        Show the first selected forecast hour on the map overlay
+        """
+        rows = sorted( self.profile_list.indexFromItem(item).row() for item in self.profile_list.selectedItems() )
+        if len(rows) > 0:
+            self.view.setForecastHour(self.data_sources[self.model].getForecastHours()[rows[0]])
+
     def select_all(self):
         items = self.profile_list.count()
         if not self.select_flag:
@@ -547,7 +672,7 @@ class MainWindow(QWidget):
         if archive:
             model = "Archive"
             try:
-                profs, dates, stn_id = self.loadArchive()
+                profs, dates, stn_id, raw_profs = self.loadArchive()
                 disp_name = stn_id
                 prof_idx = range(len(dates))
             except Exception as e:
@@ -569,13 +694,17 @@ class MainWindow(QWidget):
             if self.data_sources[model].getForecastHours() == [ 0 ]:
                 prof_idx = [ 0 ]
 
-            ret = loadData(self.data_sources[model], self.loc, run, prof_idx)
+            ret = loadData(self.data_sources[model], self.loc, run, prof_idx,
+                __key__=(model, self.loc['srcid'], run, tuple(prof_idx)))
 
-            if isinstance(ret[0], Exception):
+            if isinstance(ret[0], Cancelled):
+                return
+            elif isinstance(ret[0], Exception):
                 exc = str(ret[0])
                 failure = True
             else:
-                profs, dates = ret
+                dec, profs, dates = ret
+                raw_profs = rawProfiles(dec, prof_idx)
 
             run = "%02dZ" % run.hour
             fhours = [ "F%03d" % fh for idx, fh in enumerate(self.data_sources[self.model].getForecastHours()) if idx in prof_idx ]
@@ -588,8 +717,13 @@ class MainWindow(QWidget):
             msgbox.setIcon(QMessageBox.Critical)
             msgbox.exec_()
         else:
+            if archive:
+                loader = None
+            else:
+                loader = lambda idx, dec=dec, indexes=prof_idx: dec.getProfile(indexes[idx])
+
             self.skew = SkewApp(profs, dates, model, location=disp_name,
-                run=run, idx=prof_idx, fhour=fhours)
+                run=run, idx=prof_idx, fhour=fhours, async=self.async, loader=loader, raw_profs=raw_profs)
             self.skew.show()
 
     def loadArchive(self):
@@ -608,11 +742,22 @@ class MainWindow(QWidget):
         prof = dec.getProfiles()
         dates = dec.getProfileTimes()
         stn_id = dec.getStnId()
+        raw_profs = rawProfiles(dec, range(len(dates)))
+
+        return prof, dates, stn_id, raw_profs
 
-        return prof, dates, stn_id
+def rawProfiles(dec, indexes):
+    """
+    Get the raw profiles at the given time indexes for the time-height
+    sections in SkewApp. Returns None for ensembles.
+    """
+    raw_profs = [ prof for mem_name, date, prof in dec.iterRawProfiles() ]
+    if len(raw_profs) != len(dec.getProfileTimes()):
+        return None
+    return [ raw_profs[idx] for idx in indexes ]
 
 @progress(MainWindow.async)
-def loadData(data_source, loc, run, indexes, __text__=None, __prog__=None):
+def loadData(data_source, loc, run, indexes, __text__=None, __prog__=None, __cancel__=None):
 
     if __text__ is not None:
         __text__.emit("Decoding File")
@@ -621,16 +766,25 @@ def loadData(data_source, loc, run, indexes, __text__=None, __prog__=None):
     decoder = data_source.getDecoder(loc, run)
     dec = decoder(url)
 
+    if __cancel__ is not None:
+        __cancel__.check()
+
     if __text__ is not None:
         __text__.emit("Creating Profiles")
 
+    ## Only the first profile is computed here, so the window can open
+    ## right away; SkewApp computes the rest as they're needed.
     dates = dec.getProfileTimes(indexes)
-    profs = dec.getProfiles(indexes, __prog__)
+    profs = dec.getProfiles(indexes[:1], __prog__, cancel=__cancel__)
+    profs += [ None ] * (len(indexes) - 1)
 
-    return profs, dates
+    return dec, profs, dates
 
 if __name__ == '__main__':
+    start = time.time()
     win = MainWindow()
     win.show()
     win.setFocus()
+    if debug:
+        print "SHARPpy window ready in %.2f s" % (time.time() - start)
     sys.exit(app.exec_())
@@ -3,4 +3,4 @@ import qc_tools
 #import buf_decoder
 #import spc_decoder
 
-__all__ = ['qc_tools', 'decoder', 'buf_decoder', 'spc_decoder']
+__all__ = ['qc_tools', 'fetch', 'stream', 'archive', 'index_store', 'map_params', 'decoder', 'buf_decoder', 'spc_decoder']
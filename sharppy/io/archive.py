@@ -0,0 +1,292 @@
+''' Columnar, memory-mapped sounding archive '''
+import numpy as np
+import numpy.ma as ma
+
+import os
+import csv
+import calendar
+from datetime import datetime
+
+import sharppy.sharptab.profile as profile
+from sharppy.sharptab import utils
+from sharppy.sharptab.constants import MISSING
+
+__all__ = ['Archive', 'ArchiveWriter', 'ARCHIVE_FIELDS']
+
+## The profile fields stored in the archive. Each one lives in its own
+## little-endian float64 file, with all the profiles concatenated end to end.
+ARCHIVE_FIELDS = ['pres', 'hght', 'tmpc', 'dwpc', 'u', 'v', 'omeg']
+
+_FIELD_DTYPE = '<f8'
+_OFFSET_DTYPE = '<i8'
+_INDEX_FILE = 'index.csv'
+_INDEX_FIELDS = ['station', 'member']
+
+def _column_file(path, name):
+    return os.path.join(path, name + '.dat')
+
+def _to_epoch(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+def _from_epoch(secs):
+    return datetime.utcfromtimestamp(int(secs))
+
+def _memmap(file_name, dtype):
+    # np.memmap refuses to map empty files, so hand back an empty array instead.
+    if os.path.getsize(file_name) == 0:
+        return np.zeros((0,), dtype=dtype)
+    return np.memmap(file_name, dtype=dtype, mode='r')
+
+class ArchiveWriter(object):
+    '''
+    Appends profiles to a SHARPpy archive directory. An archive is a
+    directory of flat columnar files:
+
+    <field>.dat : the concatenated data for each field in ARCHIVE_FIELDS
+    offsets.dat : the starting position of each profile in the field files
+        (plus the end of the last profile)
+    valid.dat : the valid time of each profile (seconds since 1970-01-01)
+    index.csv : the station and ensemble member of each profile (quoted
+        CSV, since station names can have commas)
+
+    Missing data are stored as sharppy.sharptab.constants.MISSING. If the
+    directory already holds an archive, new profiles are added to the end.
+    '''
+    def __init__(self, path):
+        self._path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        offset_name = _column_file(path, 'offsets')
+        new_archive = not os.path.exists(offset_name)
+
+        self._columns = dict( (f, open(_column_file(path, f), 'ab')) for f in ARCHIVE_FIELDS )
+        self._offsets = open(offset_name, 'ab')
+        self._valid = open(_column_file(path, 'valid'), 'ab')
+        ## Station names can have commas in them, so the index is quoted
+        self._index = open(os.path.join(path, _INDEX_FILE), 'ab')
+        self._index_csv = csv.writer(self._index, lineterminator='\n')
+
+        if new_archive:
+            self._end = 0
+            np.array([ self._end ], dtype=_OFFSET_DTYPE).tofile(self._offsets)
+            self._index_csv.writerow(_INDEX_FIELDS)
+        else:
+            self._end = int(_memmap(offset_name, _OFFSET_DTYPE)[-1])
+
+    def addProfile(self, prof, valid, station=None, member=''):
+        '''
+        Add a single profile to the archive.
+
+        Parameters
+        ----------
+        prof : Profile object
+        The profile to store (raw decoder profiles work fine)
+        valid : datetime object
+        The valid time of the profile
+        station : string (optional)
+        The station identifier. Defaults to the profile's location.
+        member : string (optional)
+        The ensemble member name, if any
+
+        Returns
+        -------
+        None
+        '''
+        if station is None:
+            station = prof.location
+
+        if prof.u is None:
+            u, v = utils.vec2comp(prof.wdir, prof.wspd)
+        else:
+            u, v = prof.u, prof.v
+
+        if prof.omeg is None:
+            omeg = ma.masked_all(prof.pres.shape)
+        else:
+            omeg = prof.omeg
+
+        data = { 'pres':prof.pres, 'hght':prof.hght, 'tmpc':prof.tmpc, 'dwpc':prof.dwpc,
+            'u':u, 'v':v, 'omeg':omeg }
+
+        for f in ARCHIVE_FIELDS:
+            col = ma.asanyarray(data[f], dtype=float).filled(MISSING)
+            col.astype(_FIELD_DTYPE).tofile(self._columns[f])
+
+        self._end += len(prof.pres)
+        np.array([ self._end ], dtype=_OFFSET_DTYPE).tofile(self._offsets)
+        np.array([ _to_epoch(valid) ], dtype=_OFFSET_DTYPE).tofile(self._valid)
+        self._index_csv.writerow([ station, member ])
+
+    def addDecoder(self, dec):
+        '''
+        Add every profile (and every ensemble member) from a decoder.
+
+        Parameters
+        ----------
+        dec : Decoder object
+        An already-constructed decoder (e.g. SPCDecoder or BufDecoder)
+
+        Returns
+        -------
+        The number of profiles added
+        '''
+        n_added = 0
+        stn_id = dec.getStnId()
+        for mem_name, valid, prof in dec.iterRawProfiles():
+            self.addProfile(prof, valid, station=stn_id, member=mem_name)
+            n_added += 1
+        return n_added
+
+    def close(self):
+        for col in self._columns.itervalues():
+            col.close()
+        self._offsets.close()
+        self._valid.close()
+        self._index.close()
+
+class Archive(object):
+    '''
+    Read-only access to a SHARPpy archive directory (see ArchiveWriter).
+
+    The field files are memory mapped, and the profiles handed back are
+    views into those maps, so a query only reads the bytes belonging to the
+    profiles it returns. The station/valid-time index is loaded up front.
+    '''
+    def __init__(self, path):
+        self._path = path
+        if not os.path.exists(_column_file(path, 'offsets')):
+            raise IOError("'%s' is not a SHARPpy archive" % path)
+
+        self._offsets = _memmap(_column_file(path, 'offsets'), _OFFSET_DTYPE)
+        self._valid = np.array(_memmap(_column_file(path, 'valid'), _OFFSET_DTYPE))
+        self._columns = dict( (f, _memmap(_column_file(path, f), _FIELD_DTYPE)) for f in ARCHIVE_FIELDS )
+
+        idx_file = open(os.path.join(path, _INDEX_FILE), 'rb')
+        idx_csv = csv.reader(idx_file)
+        idx_csv.next()
+        stations, members = [], []
+        for row in idx_csv:
+            if len(row) != len(_INDEX_FIELDS):
+                ## A partially-written last line
+                break
+            stations.append(row[0])
+            members.append(row[1])
+        idx_file.close()
+
+        ## Guard against a partially-written last profile
+        nprofs = min(len(self._offsets) - 1, len(self._valid), len(stations))
+        self._valid = self._valid[:nprofs]
+        self._stations = np.array(stations[:nprofs], dtype=object)
+        self._members = np.array(members[:nprofs], dtype=object)
+
+        self._by_station = {}
+        for row, stn in enumerate(self._stations):
+            self._by_station.setdefault(stn, []).append(row)
+        for stn, rows in self._by_station.iteritems():
+            rows = np.array(rows, dtype=int)
+            self._by_station[stn] = rows[np.argsort(self._valid[rows], kind='mergesort')]
+
+    def __len__(self):
+        return len(self._valid)
+
+    def getStations(self):
+        return sorted(self._by_station.keys())
+
+    def getMembers(self):
+        return sorted(set(self._members))
+
+    def query(self, station=None, start=None, end=None, member=None):
+        '''
+        Find the profiles matching the given criteria.
+
+        Parameters
+        ----------
+        station : string (optional)
+        Station identifier to match
+        start : datetime object (optional)
+        Earliest valid time to return (inclusive)
+        end : datetime object (optional)
+        Latest valid time to return (inclusive)
+        member : string (optional)
+        Ensemble member name to match
+
+        Returns
+        -------
+        A numpy array of row numbers, ordered by valid time
+        '''
+        if station is not None:
+            rows = self._by_station.get(station, np.zeros((0,), dtype=int))
+        else:
+            rows = np.argsort(self._valid, kind='mergesort')
+
+        valid = self._valid[rows]
+        keep = np.ones(rows.shape, dtype=bool)
+        if start is not None:
+            keep &= valid >= _to_epoch(start)
+        if end is not None:
+            keep &= valid <= _to_epoch(end)
+        if member is not None:
+            keep &= self._members[rows] == member
+        return rows[keep]
+
+    def getColumn(self, field, row):
+        '''
+        Get one field of one profile as a (zero-copy) view into the archive.
+        '''
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return self._columns[field][start:end]
+
+    def getProfile(self, row, prof_type='raw'):
+        '''
+        Build a profile from one row of the archive.
+
+        Parameters
+        ----------
+        row : int
+        The row number (from query())
+        prof_type : string (optional; default 'raw')
+        The kind of profile to construct (see sharppy.sharptab.profile.create_profile).
+        Raw profiles are views into the archive; 'default' or 'convective'
+        profiles compute their derived fields, which requires reading the data.
+
+        Returns
+        -------
+        A Profile object
+        '''
+        cols = dict( (f, self.getColumn(f, row)) for f in ARCHIVE_FIELDS )
+        return profile.create_profile(profile=prof_type, missing=MISSING, location=self._stations[row], **cols)
+
+    def getProfiles(self, rows, prof_type='raw'):
+        return [ self.getProfile(row, prof_type=prof_type) for row in rows ]
+
+    def getProfileTimes(self, rows):
+        return [ _from_epoch(self._valid[row]) for row in rows ]
+
+    def getStnIds(self, rows):
+        return list(self._stations[rows])
+
+    def getMemberNames(self, rows):
+        return list(self._members[rows])
+
+if __name__ == "__main__":
+    import sys
+    from sharppy.io.spc_decoder import SPCDecoder
+    from sharppy.io.buf_decoder import BufDecoder
+
+    if len(sys.argv) < 3:
+        print "Usage: python archive.py <archive directory> <sounding file> [<sounding file> ...]"
+        sys.exit(1)
+
+    writer = ArchiveWriter(sys.argv[1])
+    for file_name in sys.argv[2:]:
+        try:
+            dec = SPCDecoder(file_name)
+        except:
+            try:
+                dec = BufDecoder(file_name)
+            except:
+                print "Could not figure out the format of '%s'!" % file_name
+                continue
+        print "%s: %d profiles" % (file_name, writer.addDecoder(dec))
+    writer.close()
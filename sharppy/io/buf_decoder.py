@@ -11,90 +11,122 @@ class BufDecoder(Decoder):
         super(BufDecoder, self).__init__(file_name)
 
     def _parse(self, file_name):
-        file_data = self._downloadFile(file_name)
+        stream = self._openFile(file_name)
 
-        string = '\r\n\r\n\r\n'
-        members = np.array(file_data.split(string))
-        members = members[0:len(members)-1]
-        num_members = len(members)
         profiles = {}
         dates = None
 
-        for n, mem_txt in enumerate(members):
-            mem_name, mem_profs, mem_dates = self._parseMember(mem_txt)
+        for mem_name, mem_profs, mem_dates in self._iterMembers(stream):
             profiles[mem_name] = mem_profs
             dates = mem_dates
-        #f.close()
+        stream.close()
 
         return profiles, dates
 
+    def _iterMembers(self, lines):
+        # Members are separated by two blank lines ('\r\n\r\n\r\n'). Each member is
+        # parsed as its lines come in, so only one record's worth of text is held
+        # in memory at a time.
+        member = None
+        n_blank = 0
+        for line in lines:
+            line = line.rstrip('\r\n')
+
+            if member is None:
+                member = _MemberParser(line)
+                n_blank = 0
+                continue
+
+            if line == '':
+                n_blank += 1
+                if n_blank == 2:
+                    yield member.finish()
+                    member = None
+                continue
+
+            n_blank = 0
+            member.feed(line)
+
+        # Anything after the last member separator is discarded, as it is not
+        #   a complete member.
+
     def _parseMember(self, text):
-        data = np.array(text.split('\r\n'))
-        data_idxs = []
-        new_record = False
-        begin_idx = 0
-        member_name = data[0]
-        dates = []
-        # Figure out the indices for the data chunks
-        for i in range(len(data)):
-            if "STID" in data[i]:
-                # Here is information about the record
-                spl = data[i].split()
-                station = spl[2]
-                wmo_id = spl[5]
-                dates.append(datetime.strptime(spl[8], '%y%m%d/%H%M'))
-                slat = float(data[i+1].split()[2])
-                slon = float(data[i+1].split()[5])
-                selv = float(data[i+1].split()[8])
-                stim = float(data[i+2].split()[2])
-            if data[i].find('HGHT') >= 0 and new_record == False:
-                # we've found a new data chunk
-                new_record = True
-                begin_idx = i+1
-            elif 'STID' in data[i] and new_record == True:
-                # We've found the end of the data chunk
-                new_record = False
-                data_idxs.append((begin_idx, i-1))
-            elif 'STN' in data[i] and new_record == True:
+        member = None
+        for line in text.split('\r\n'):
+            if member is None:
+                member = _MemberParser(line)
+            elif line != '':
+                member.feed(line)
+        return member.finish()
+
+class _MemberParser(object):
+    '''
+    Incrementally parses the lines of a single bufkit member. The first line
+    of a member is its name.
+    '''
+    def __init__(self, member_name):
+        self.member_name = member_name
+        self.profiles = []
+        self.dates = []
+        self.station = None
+        self._have_stid = False
+        self._record = None
+
+    def feed(self, line):
+        if "STID" in line:
+            # Here is information about the record (and the end of the previous one)
+            self._endRecord()
+            spl = line.split()
+            self.station = spl[2]
+            self.dates.append(datetime.strptime(spl[8], '%y%m%d/%H%M'))
+            self._have_stid = True
+        elif self._record is not None:
+            if 'STN' in line:
                 # We've found the end of the last data chunk of the file
-                new_record = False
-                data_idxs.append((begin_idx, i))
-            elif new_record == True:
-                continue
-                    ##print data[i]
-        
-        data_idxs = data_idxs[1:]
-        # Make arrays to store the data
-        profiles = []        
-
-        # Parse out the profiles
-        for i in range(len(data_idxs)):
-            data_stuff = data[data_idxs[i][0]: data_idxs[i][1]]
-            profile_length = len(data[data_idxs[i][0]: data_idxs[i][1]])/2
-
-            hght = np.zeros((profile_length,), dtype=float)
-            pres = np.zeros((profile_length,), dtype=float)
-            tmpc = np.zeros((profile_length,), dtype=float)
-            dwpc = np.zeros((profile_length,), dtype=float)
-            wdir = np.zeros((profile_length,), dtype=float)
-            wspd = np.zeros((profile_length,), dtype=float)
-            omeg = np.zeros((profile_length,), dtype=float)
-
-            for j in np.arange(0, profile_length * 2, 2):
-                if len(data_stuff[j+1].split()) == 1:
-                    hght[j / 2] = float(data_stuff[j+1].split()[0])
-                else:
-                    hght[j / 2] = float(data_stuff[j+1].split()[1])
-                tmpc[j / 2] = float(data_stuff[j].split()[1])
-                dwpc[j / 2] = float(data_stuff[j].split()[3])
-                pres[j / 2] = float(data_stuff[j].split()[0])
-                wspd[j / 2] = float(data_stuff[j].split()[6])
-                wdir[j / 2] = float(data_stuff[j].split()[5])
-                omeg[j / 2] = float(data_stuff[j].split()[7])
-
-            prof = profile.create_profile(profile='raw', pres=pres, hght=hght, tmpc=tmpc, dwpc=dwpc, 
-                wdir=wdir, wspd=wspd, omeg=omeg, location=station)
-
-            profiles.append(prof)
-
-        return member_name, profiles, dates
+                self._endRecord()
+            else:
+                self._record.append(line)
+        elif self._have_stid and line.find('HGHT') >= 0:
+            # we've found a new data chunk
+            self._record = []
+
+    def finish(self):
+        self._endRecord()
+        return self.member_name, self.profiles, self.dates
+
+    def _endRecord(self):
+        if self._record is None:
+            return
+
+        data_stuff = self._record
+        self._record = None
+        self._have_stid = False
+
+        profile_length = len(data_stuff) / 2
+
+        hght = np.zeros((profile_length,), dtype=float)
+        pres = np.zeros((profile_length,), dtype=float)
+        tmpc = np.zeros((profile_length,), dtype=float)
+        dwpc = np.zeros((profile_length,), dtype=float)
+        wdir = np.zeros((profile_length,), dtype=float)
+        wspd = np.zeros((profile_length,), dtype=float)
+        omeg = np.zeros((profile_length,), dtype=float)
+
+        for j in xrange(profile_length):
+            vals = data_stuff[2 * j].split()
+            hvals = data_stuff[2 * j + 1].split()
+            if len(hvals) == 1:
+                hght[j] = float(hvals[0])
+            else:
+                hght[j] = float(hvals[1])
+            pres[j] = float(vals[0])
+            tmpc[j] = float(vals[1])
+            dwpc[j] = float(vals[3])
+            wdir[j] = float(vals[5])
+            wspd[j] = float(vals[6])
+            omeg[j] = float(vals[7])
+
+        prof = profile.create_profile(profile='raw', pres=pres, hght=hght, tmpc=tmpc, dwpc=dwpc,
+            wdir=wdir, wspd=wspd, omeg=omeg, location=self.station)
+
+        self.profiles.append(prof)
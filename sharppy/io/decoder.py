@@ -1,9 +1,14 @@
 
 import numpy as np
 
+import itertools
+import multiprocessing
+
 import sharppy.sharptab.profile as profile
+import sharppy.sharptab.params as params
+from sharppy.io.stream import open_stream
+from sharppy.io.index_store import get_indices
 
-import urllib2
 from datetime import datetime
 
 class abstract(object):
@@ -13,6 +18,54 @@ class abstract(object):
     def __call__(self, *args, **kwargs):
         raise NotImplementedError("Function or method '%s' is abstract.  Override it in a subclass!" % self._func.__name__)
 
+class Cancelled(Exception):
+    pass
+
+class CancelToken(object):
+    '''
+    A flag that lets one thread ask a long-running job in another thread
+    to stop. The job calls check() every so often, which raises Cancelled
+    once cancel() has been called.
+    '''
+    def __init__(self):
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def check(self):
+        if self._cancelled:
+            raise Cancelled()
+
+def _build_profile(task):
+    # Build one profile from its raw arrays. This runs in the worker processes
+    #   when getProfiles() is given a pool, so it has to be a module-level
+    #   function (and the task has to be picklable).
+    prof_type, kwargs, records = task
+    if records:
+        return get_indices(profile.ConvectiveProfile(**kwargs))
+    elif prof_type == 'convective':
+        return profile.ConvectiveProfile(**kwargs)
+    else:
+        return profile.BasicProfile(**kwargs)
+
+def _build_sequence(tasks):
+    # Build the profiles for a run of times in order, with the searches for the
+    #   mean at each time warm-started from the time before it.
+    guess = None
+    for prof_tasks in tasks:
+        for idx, (prof_type, kwargs, records) in enumerate(prof_tasks):
+            if idx > 0 or prof_type != 'convective':
+                yield _build_profile((prof_type, kwargs, records))
+                continue
+
+            prof = profile.ConvectiveProfile(guess=guess, **kwargs)
+            guess = params.sequence_guess(prof)
+            yield get_indices(prof) if records else prof
+
 # Comment this file
 # Move inherited decoders to ~/.sharppy/decoders
 # Write function to figure out what custom decoders we have
@@ -25,46 +78,132 @@ class Decoder(object):
     def _parse(self):
         pass
 
+    def _openFile(self, file_name):
+        '''
+        Open a local file, URL, or in-memory buffer as a line-oriented
+        stream. Compressed (gzip, bzip2, xz) data are decompressed on the fly.
+        '''
+        return open_stream(file_name)
+
     def _downloadFile(self, file_name):
-        # Try to open the file.  This is a dirty hack right now until
-        # I can figure out a cleaner way to make sure the file (either local or URL)
-        # gets opened.
-        try:
-            f = urllib2.urlopen(file_name)
-        except (ValueError, IOError):
-            try:
-                f = open(file_name, 'r')
-            except IOError:
-                raise IOError("File '%s' cannot be found" % file_name)
-        file_data = f.read()
-#       f.close() # Apparently, this multiplies the time this function takes by anywhere from 2 to 6 ... ???
+        stream = self._openFile(file_name)
+        file_data = stream.read()
+        stream.close()
         return file_data
 
-    def getProfiles(self, prof_idxs=[0], prog=None):
-        profiles = []
+    def _getMembers(self):
+        # Returns the member names with the mean (or the only member) first, along
+        #   with whether each one gets a full ConvectiveProfile.
+        names = self._profiles.keys()
         mean_idx = 0
-        for idx, (mem_name, mem_profs) in enumerate(self._profiles.iteritems()):
-            profs = []
-            nprofs = len(mem_profs) if prof_idxs is None else len(prof_idxs)
-
-            for pidx, prof_idx in enumerate(prof_idxs):
-                if 'mean' in mem_name.lower() or len(self._profiles) == 1:
-                    mean_idx = idx
-                    if prog is not None:
-                        prog.emit(pidx, nprofs)
-                    profs.append(profile.ConvectiveProfile.copy(mem_profs[prof_idx]))
-                else:
-                    profs.append(profile.BasicProfile.copy(mem_profs[prof_idx]))
-
-            profiles.append(profs)
-
-        mean = profiles[mean_idx]
-        profiles = [ mean ] + profiles[:mean_idx] + profiles[(mean_idx + 1):]
-
-        if len(profiles) > 1:
-            profiles = [ list(p) for p in zip(*profiles) ]
+        for idx, mem_name in enumerate(names):
+            if 'mean' in mem_name.lower() or len(names) == 1:
+                mean_idx = idx
+
+        names = [ names[mean_idx] ] + names[:mean_idx] + names[(mean_idx + 1):]
+        return [ (n, 'mean' in n.lower() or len(names) == 1) for n in names ]
+
+    def _getTasks(self, prof_idx, records=False):
+        # The arguments to _build_profile() for every member at one time
+        tasks = []
+        for mem_name, convective in self._getMembers():
+            prof = self._profiles[mem_name][prof_idx]
+            tasks.append(('convective' if convective else 'default', prof.inputFields(), records))
+        return tasks
+
+    def getProfile(self, prof_idx, records=False):
+        '''
+        Build the profile(s) for a single time in the file.
+
+        Parameters
+        ----------
+        prof_idx : int
+        The index of the time to build
+        records : bool (optional; default False)
+        If True, return the computed indices (see
+        sharppy.io.index_store.get_indices) instead of the profiles.
+
+        Returns
+        -------
+        A ConvectiveProfile for single-member files, or a list of profiles
+        (the ConvectiveProfile for the mean first, BasicProfiles for the
+        rest of the members) for ensembles.
+        '''
+        profs = [ _build_profile(task) for task in self._getTasks(prof_idx, records=records) ]
+        if len(profs) == 1:
+            profs = profs[0]
+        return profs
+
+    def getProfiles(self, prof_idxs=[0], prog=None, cancel=None, workers=None, records=False, sequence=False):
+        '''
+        Build the profiles for a number of times in the file.
+
+        Parameters
+        ----------
+        prof_idxs : list of ints (optional; default [0])
+        The indexes of the times to build
+        prog : Qt Signal (optional)
+        Emitted with (index, number of times) as each time is reached
+        cancel : CancelToken (optional)
+        Checked before each time; raises Cancelled once it's set
+        workers : int or multiprocessing.Pool (optional)
+        Build the profiles in worker processes, either in a new pool of this
+        many processes or in an existing pool. The default builds them one
+        at a time in this process.
+        records : bool (optional; default False)
+        If True, every member is analyzed and its computed indices (see
+        sharppy.io.index_store.get_indices) are returned instead of the
+        profiles, which are much cheaper to send back from the workers.
+        sequence : bool (optional; default False)
+        If True, the most unstable parcel and convective temperature
+        searches at each time start from the results at the time before it
+        (see sharppy.sharptab.params.sequence_guess), which needs fewer
+        parcel lifts for a run of consecutive times. The profiles are
+        built in order in this process, so workers is ignored.
+
+        Returns
+        -------
+        A list with one entry per time, in the order of prof_idxs (see
+        getProfile()).
+        '''
+        tasks = [ self._getTasks(prof_idx, records=records) for prof_idx in prof_idxs ]
+
+        pool = None
+        if sequence:
+            results = _build_sequence(tasks)
         else:
-            profiles = profiles[0]
+            if workers is None or workers == 1:
+                imap = itertools.imap
+            elif isinstance(workers, int):
+                pool = multiprocessing.Pool(workers)
+                imap = pool.imap
+            else:
+                imap = workers.imap
+
+            ## imap hands back the results in the order the tasks went in.
+            results = imap(_build_profile, itertools.chain(*tasks))
+
+        profiles = []
+        nprofs = len(prof_idxs)
+        try:
+            for pidx, prof_tasks in enumerate(tasks):
+                if cancel is not None:
+                    cancel.check()
+                if prog is not None:
+                    prog.emit(pidx, nprofs)
+
+                profs = [ results.next() for task in prof_tasks ]
+                if len(profs) == 1:
+                    profs = profs[0]
+                profiles.append(profs)
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+
+        if pool is not None:
+            pool.close()
+            pool.join()
 
         return profiles
 
@@ -78,6 +217,40 @@ class Decoder(object):
     def getStnId(self):
         return self._profiles.values()[0][0].location
 
+    def getRawProfile(self, prof_idx, member=None):
+        '''
+        Get the undecorated (raw) profile for a single time in the file,
+        without computing anything.
+
+        Parameters
+        ----------
+        prof_idx : int
+        The index of the time
+        member : string (optional)
+        The ensemble member to get. Defaults to the mean (or the only
+        member).
+
+        Returns
+        -------
+        A raw Profile object
+        '''
+        if member is None:
+            member = self._getMembers()[0][0]
+        return self._profiles[member][prof_idx]
+
+    def iterRawProfiles(self):
+        '''
+        Iterate over the undecorated (raw) profiles in the file without
+        computing any indices.
+
+        Returns
+        -------
+        A generator of (member name, valid time, raw Profile) tuples
+        '''
+        for mem_name, mem_profs in self._profiles.iteritems():
+            for date, prof in zip(self._dates, mem_profs):
+                yield mem_name, date, prof
+
 if __name__ == "__main__":
     print "Creating bufkit decoder ..."
     bd = BufDecoder()
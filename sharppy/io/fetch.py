@@ -0,0 +1,554 @@
+''' Shared HTTP/FTP fetching with connection reuse and an on-disk cache '''
+import os
+import time
+import json
+import socket
+import hashlib
+import httplib
+import ftplib
+import urllib
+import urlparse
+import threading
+from StringIO import StringIO
+from collections import OrderedDict
+from os.path import expanduser
+
+__all__ = ['Fetcher', 'FetchError', 'get_fetcher', 'fetch', 'fetch_open']
+
+## The default location of the response cache
+CACHE_PATH = os.path.join(expanduser('~'), '.sharppy', 'cache')
+
+## Maximum number of idle connections kept open per host
+MAX_IDLE = 4
+
+## Maximum number of redirects to follow for one request
+MAX_REDIRECTS = 5
+
+## Maximum total size (in bytes) of the cached responses. The least recently
+## used ones are thrown out past this.
+CACHE_SIZE = 200 * 1024 * 1024
+
+## Number of bytes of a response to read at a time
+CHUNK_SIZE = 64 * 1024
+
+class FetchError(IOError):
+    pass
+
+class _RetryableError(Exception):
+    pass
+
+## Errors that are worth trying again (dropped connections, timeouts, server trouble)
+_RETRYABLE = (_RetryableError, socket.error, httplib.HTTPException, ftplib.error_temp, ftplib.error_reply, EOFError)
+
+class _CacheBody(object):
+    '''
+    A response body on its way into a ResponseCache. The body is written
+    to a temporary file (or a memory buffer for in-memory caches) in chunks
+    as it arrives, and ResponseCache.put() moves it into place.
+    '''
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+        self._file = StringIO() if file_name is None else open(file_name, 'wb')
+
+    def write(self, data):
+        self._file.write(data)
+
+    def reset(self):
+        self._file.seek(0)
+        self._file.truncate()
+
+    def getvalue(self):
+        return self._file.getvalue()
+
+    def close(self):
+        if self.file_name is not None:
+            self._file.close()
+
+    def discard(self):
+        self.close()
+        if self.file_name is not None:
+            try:
+                os.remove(self.file_name)
+            except OSError:
+                pass
+
+class ResponseCache(object):
+    '''
+    Stores the bodies of fetched URLs along with what's needed to
+    revalidate them (time fetched, ETag, Last-Modified, or FTP
+    modification time and size). If path is None, the cache is kept in
+    memory only. Once the bodies add up to more than max_size bytes, the
+    least recently used ones are removed.
+
+    The cache directory is created when the first response is put in it.
+    If it can't be created, the cache is kept in memory instead.
+    '''
+    def __init__(self, path=CACHE_PATH, max_size=CACHE_SIZE):
+        self._path = path
+        self._max_size = max_size
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _files(self, url):
+        key = hashlib.sha1(url).hexdigest()
+        return os.path.join(self._path, key + '.meta'), os.path.join(self._path, key + '.body')
+
+    def _tmpName(self, file_name):
+        return "%s.%d.%d.tmp" % (file_name, os.getpid(), threading.current_thread().ident)
+
+    def _replace(self, tmp_name, file_name):
+        if os.name == 'nt' and os.path.exists(file_name):
+            os.remove(file_name)
+        os.rename(tmp_name, file_name)
+
+    def _write(self, file_name, data):
+        # Write to a temporary file and move it into place so readers never see
+        #   a partially-written file.
+        tmp_name = self._tmpName(file_name)
+        tmp_file = open(tmp_name, 'wb')
+        tmp_file.write(data)
+        tmp_file.close()
+        self._replace(tmp_name, file_name)
+
+    def getMeta(self, url):
+        if self._path is None:
+            with self._lock:
+                entry = self._mem.get(url)
+            return None if entry is None else dict(entry[0])
+
+        meta_name, body_name = self._files(url)
+        try:
+            meta_file = open(meta_name, 'r')
+            meta = json.load(meta_file)
+            meta_file.close()
+        except (IOError, ValueError):
+            return None
+
+        if meta.get('url') != url or not os.path.exists(body_name):
+            return None
+        return meta
+
+    def open(self, url):
+        if self._path is None:
+            with self._lock:
+                entry = self._mem.pop(url)
+                self._mem[url] = entry
+            return StringIO(entry[1])
+
+        body_name = self._files(url)[1]
+        body_file = open(body_name, 'rb')
+        try:
+            # The modification time of the body is when it was last used
+            os.utime(body_name, None)
+        except OSError:
+            pass
+        return body_file
+
+    def read(self, url):
+        body_file = self.open(url)
+        body = body_file.read()
+        body_file.close()
+        return body
+
+    def newBody(self, url):
+        '''
+        Start a new body for a URL, to be written to and then handed to
+        put() (or discarded).
+        '''
+        if self._path is not None and not os.path.isdir(self._path):
+            try:
+                os.makedirs(self._path)
+            except OSError:
+                if not os.path.isdir(self._path):
+                    # Can't create the cache directory, so keep the cache in memory
+                    self._path = None
+
+        if self._path is None:
+            return _CacheBody()
+        return _CacheBody(self._tmpName(self._files(url)[1]))
+
+    def put(self, url, body, meta):
+        meta = dict(meta, url=url, time=time.time())
+        if self._path is None:
+            with self._lock:
+                self._mem.pop(url, None)
+                self._mem[url] = (meta, body.getvalue())
+                total = sum(len(b) for m, b in self._mem.itervalues())
+                while total > self._max_size and len(self._mem) > 1:
+                    old_url, (old_meta, old_body) = self._mem.popitem(last=False)
+                    total -= len(old_body)
+        else:
+            meta_name, body_name = self._files(url)
+            body.close()
+            self._replace(body.file_name, body_name)
+            self._write(meta_name, json.dumps(meta))
+            self._evict(body_name)
+
+    def _evict(self, keep):
+        # Remove the least recently used bodies (and their metadata) until the cache fits in
+        #   max_size, but never the one that was just put in.
+        bodies = []
+        total = 0
+        for f in os.listdir(self._path):
+            if not f.endswith('.body'):
+                continue
+            body_name = os.path.join(self._path, f)
+            try:
+                body_stat = os.stat(body_name)
+            except OSError:
+                continue
+            bodies.append((body_stat.st_mtime, body_stat.st_size, body_name))
+            total += body_stat.st_size
+
+        bodies.sort()
+        for mtime, size, body_name in bodies:
+            if total <= self._max_size:
+                break
+            if body_name == keep:
+                continue
+            for name in [ body_name[:-len('.body')] + '.meta', body_name ]:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            total -= size
+
+    def touch(self, url):
+        meta = self.getMeta(url)
+        if meta is None:
+            return
+        meta['time'] = time.time()
+        if self._path is None:
+            with self._lock:
+                self._mem[url] = (meta, self._mem[url][1])
+        else:
+            self._write(self._files(url)[0], json.dumps(meta))
+
+    def remove(self, url=None):
+        if self._path is None:
+            with self._lock:
+                if url is None:
+                    self._mem = OrderedDict()
+                else:
+                    self._mem.pop(url, None)
+            return
+
+        if url is None:
+            if not os.path.isdir(self._path):
+                return
+            names = [ os.path.join(self._path, f) for f in os.listdir(self._path) if f.endswith('.meta') or f.endswith('.body') ]
+        else:
+            names = self._files(url)
+
+        for name in names:
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+class Fetcher(object):
+    '''
+    Fetches http://, https://, and ftp:// URLs.
+
+    - Connections are kept open and reused, up to MAX_IDLE per host.
+    - Responses are kept in a ResponseCache. A cached response younger
+      than the TTL for its URL (see setTTL()) is returned without touching
+      the network. Older responses are revalidated with If-None-Match/
+      If-Modified-Since (HTTP) or MDTM and SIZE (FTP files), and only
+      downloaded again if they've changed. FTP directory listings can't
+      be revalidated, so they're downloaded again once their TTL is up.
+    - Failed requests are retried with exponential backoff.
+    - Response bodies are written to the cache in chunks as they arrive,
+      so open() can hand back the cached file without the whole body
+      ever being held in memory. The cache is limited to cache_size bytes.
+
+    A single Fetcher can be shared between threads.
+    '''
+    def __init__(self, cache_path=CACHE_PATH, retries=3, backoff=0.5, timeout=30, cache_size=CACHE_SIZE):
+        self._cache = ResponseCache(cache_path, max_size=cache_size)
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+
+        self._ttls = []
+        self._pool = {}
+        self._pool_lock = threading.Lock()
+
+        self.stats = { 'requests':0, 'downloads':0, 'not_modified':0, 'cache_hits':0, 'connections':0, 'retries':0 }
+
+    def setTTL(self, url_prefix, ttl):
+        '''
+        Set how long (in seconds) responses for URLs starting with
+        url_prefix are used without revalidating them. If more than one
+        prefix matches a URL, the longest one wins. The default TTL is 0
+        (always revalidate).
+        '''
+        self._ttls = [ (p, t) for p, t in self._ttls if p != url_prefix ]
+        self._ttls.append((url_prefix, ttl))
+        self._ttls.sort(key=lambda pt: len(pt[0]), reverse=True)
+
+    def getTTL(self, url):
+        for prefix, ttl in self._ttls:
+            if url.startswith(prefix):
+                return ttl
+        return 0
+
+    def fetch(self, url, ttl=None):
+        '''
+        Fetch a URL.
+
+        Parameters
+        ----------
+        url : string
+        The URL to fetch
+        ttl : number (optional)
+        Override the TTL for this URL (seconds)
+
+        Returns
+        -------
+        The response body as a string
+        '''
+        self._update(url, ttl)
+        return self._cache.read(url)
+
+    def open(self, url, ttl=None):
+        '''
+        Fetch a URL and return a file-like object to read the response body
+        from (the cached copy on disk).
+        '''
+        self._update(url, ttl)
+        return self._cache.open(url)
+
+    def invalidate(self, url=None):
+        '''
+        Remove a URL (or, by default, everything) from the cache.
+        '''
+        self._cache.remove(url)
+
+    def close(self):
+        '''
+        Close all the idle connections.
+        '''
+        with self._pool_lock:
+            pool = self._pool
+            self._pool = {}
+
+        for conns in pool.itervalues():
+            for conn in conns:
+                self._closeConn(conn)
+
+    def _update(self, url, ttl):
+        if ttl is None:
+            ttl = self.getTTL(url)
+
+        meta = self._cache.getMeta(url)
+        if meta is not None and time.time() - meta['time'] < ttl:
+            self.stats['cache_hits'] += 1
+            return
+
+        body, new_meta = self._retry(self._request, url, meta)
+        if body is None:
+            self.stats['not_modified'] += 1
+            self._cache.touch(url)
+        else:
+            self.stats['downloads'] += 1
+            self._cache.put(url, body, new_meta)
+
+    def _retry(self, func, *args):
+        for attempt in xrange(self._retries + 1):
+            try:
+                return func(*args)
+            except _RETRYABLE, err:
+                if attempt == self._retries:
+                    raise FetchError("Could not fetch '%s': %s" % (args[0], err))
+                self.stats['retries'] += 1
+                time.sleep(self._backoff * 2 ** attempt)
+
+    def _request(self, url, meta):
+        # Returns (body, metadata), or (None, None) if the cached copy described by meta
+        #   is still good. The body is a _CacheBody, ready to be put in the cache.
+        parsed = urlparse.urlsplit(url)
+        self.stats['requests'] += 1
+        if parsed.scheme in [ 'http', 'https' ]:
+            request = lambda body: self._requestHTTP(url, parsed, meta, body)
+        elif parsed.scheme == 'ftp':
+            request = lambda body: self._requestFTP(parsed, meta, body)
+        else:
+            raise ValueError("Can't fetch URL '%s'" % url)
+
+        body = self._cache.newBody(url)
+        try:
+            new_meta = request(body)
+        except:
+            body.discard()
+            raise
+
+        if new_meta is None:
+            body.discard()
+            return None, None
+        return body, new_meta
+
+    def _getResponse(self, conn, path, headers, body):
+        # Send a GET request and copy a successful response's body into body a chunk at a
+        #   time. Other responses (redirects, errors) are read and thrown away.
+        conn.request('GET', path, headers=headers)
+        resp = conn.getresponse()
+        if 200 <= resp.status < 300:
+            while True:
+                data = resp.read(CHUNK_SIZE)
+                if data == '':
+                    break
+                body.write(data)
+        else:
+            resp.read()
+        return resp
+
+    def _requestHTTP(self, url, parsed, meta, body, n_redirects=0):
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        headers = { 'User-Agent':'SHARPpy', 'Connection':'keep-alive' }
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        conn, reused = self._checkout(key)
+        try:
+            resp = self._getResponse(conn, path, headers, body)
+        except _RETRYABLE:
+            self._closeConn(conn)
+            if not reused:
+                raise
+            # The server probably closed the idle connection, so try again on a new one.
+            body.reset()
+            conn, reused = self._checkout(key, new=True)
+            try:
+                resp = self._getResponse(conn, path, headers, body)
+            except:
+                self._closeConn(conn)
+                raise
+
+        if resp.will_close:
+            self._closeConn(conn)
+        else:
+            self._checkin(key, conn)
+
+        if resp.status == 304 and meta is not None:
+            return None
+        elif resp.status in [ 301, 302, 303, 307, 308 ]:
+            location = resp.getheader('location')
+            if location is None or n_redirects >= MAX_REDIRECTS:
+                raise FetchError("Too many redirects fetching '%s'" % url)
+            new_url = urlparse.urljoin(url, location)
+            return self._requestHTTP(new_url, urlparse.urlsplit(new_url), meta, body, n_redirects + 1)
+        elif resp.status >= 500:
+            raise _RetryableError("HTTP error %d" % resp.status)
+        elif resp.status >= 400:
+            raise FetchError("HTTP error %d fetching '%s'" % (resp.status, url))
+
+        return { 'etag':resp.getheader('etag'), 'last_modified':resp.getheader('last-modified') }
+
+    def _requestFTP(self, parsed, meta, body):
+        key = ('ftp', parsed.hostname, parsed.port, parsed.username, parsed.password)
+        path = urllib.unquote(parsed.path) or '/'
+
+        ftp, reused = self._checkout(key)
+        if reused:
+            try:
+                ftp.voidcmd('NOOP')
+            except ftplib.all_errors:
+                self._closeConn(ftp)
+                ftp, reused = self._checkout(key, new=True)
+
+        try:
+            if path.endswith('/'):
+                # Directory listing; there's nothing to revalidate against.
+                ftp.retrlines('LIST ' + path, lambda line: body.write(line + '\n'))
+                new_meta = {}
+            else:
+                ftp.voidcmd('TYPE I')
+                try:
+                    mdtm = ftp.sendcmd('MDTM ' + path).split()[-1]
+                    size = ftp.size(path)
+                except ftplib.error_perm:
+                    # Server doesn't support MDTM/SIZE
+                    mdtm, size = None, None
+
+                if meta is not None and mdtm is not None and meta.get('mdtm') == mdtm and meta.get('size') == size:
+                    new_meta = None
+                else:
+                    ftp.retrbinary('RETR ' + path, body.write, CHUNK_SIZE)
+                    new_meta = { 'mdtm':mdtm, 'size':size }
+        except ftplib.error_perm, err:
+            self._checkin(key, ftp)
+            raise FetchError("FTP error fetching '%s': %s" % (parsed.geturl(), err))
+        except:
+            self._closeConn(ftp)
+            raise
+
+        self._checkin(key, ftp)
+        return new_meta
+
+    def _checkout(self, key, new=False):
+        # Returns a connection for key (an idle one if there is one, unless new is set) and
+        #   whether it's been used before.
+        if not new:
+            with self._pool_lock:
+                conns = self._pool.get(key, [])
+                if len(conns) > 0:
+                    return conns.pop(), True
+
+        self.stats['connections'] += 1
+        if key[0] == 'http':
+            conn = httplib.HTTPConnection(key[1], key[2], timeout=self._timeout)
+        elif key[0] == 'https':
+            conn = httplib.HTTPSConnection(key[1], key[2], timeout=self._timeout)
+        else:
+            conn = ftplib.FTP(timeout=self._timeout)
+            conn.connect(key[1], key[2] or ftplib.FTP_PORT)
+            conn.login(urllib.unquote(key[3] or 'anonymous'), urllib.unquote(key[4] or ''))
+        return conn, False
+
+    def _checkin(self, key, conn):
+        with self._pool_lock:
+            conns = self._pool.setdefault(key, [])
+            if len(conns) < MAX_IDLE:
+                conns.append(conn)
+                return
+        self._closeConn(conn)
+
+    def _closeConn(self, conn):
+        try:
+            conn.close()
+        except:
+            pass
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher():
+    '''
+    Get the Fetcher shared by all of SHARPpy.
+    '''
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher()
+    return _fetcher
+
+def fetch(url, ttl=None):
+    '''
+    Fetch a URL with the shared Fetcher and return the body as a string.
+    '''
+    return get_fetcher().fetch(url, ttl=ttl)
+
+def fetch_open(url, ttl=None):
+    '''
+    Fetch a URL with the shared Fetcher and return a file-like object to
+    read the body from.
+    '''
+    return get_fetcher().open(url, ttl=ttl)
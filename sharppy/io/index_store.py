@@ -0,0 +1,223 @@
+''' Persistent store of computed sounding indices '''
+import numpy as np
+import numpy.ma as ma
+
+import os
+import sqlite3
+import threading
+from os.path import expanduser
+
+import sharppy.sharptab.profile as profile
+from sharppy.sharptab import utils
+from sharppy.sharptab.constants import MISSING
+
+__all__ = ['IndexStore', 'STORED_INDICES', 'get_indices']
+
+## The default location of the store
+STORE_PATH = os.path.join(expanduser('~'), '.sharppy', 'indices.db')
+
+## The indices kept in the store, as (column name, SQL type, function of a
+## ConvectiveProfile) triples. Changing this list changes the table schema,
+## so bump STORE_VERSION when doing so.
+STORE_VERSION = 1
+
+def _pcl(name, attr):
+    return lambda prof: getattr(getattr(prof, name), attr)
+
+STORED_INDICES = [
+    ('sfc_bplus', 'REAL', _pcl('sfcpcl', 'bplus')),
+    ('sfc_bminus', 'REAL', _pcl('sfcpcl', 'bminus')),
+    ('sfc_lclhght', 'REAL', _pcl('sfcpcl', 'lclhght')),
+    ('sfc_lfchght', 'REAL', _pcl('sfcpcl', 'lfchght')),
+    ('sfc_elhght', 'REAL', _pcl('sfcpcl', 'elhght')),
+    ('ml_bplus', 'REAL', _pcl('mlpcl', 'bplus')),
+    ('ml_bminus', 'REAL', _pcl('mlpcl', 'bminus')),
+    ('ml_lclhght', 'REAL', _pcl('mlpcl', 'lclhght')),
+    ('ml_lfchght', 'REAL', _pcl('mlpcl', 'lfchght')),
+    ('ml_elhght', 'REAL', _pcl('mlpcl', 'elhght')),
+    ('mu_bplus', 'REAL', _pcl('mupcl', 'bplus')),
+    ('mu_bminus', 'REAL', _pcl('mupcl', 'bminus')),
+    ('mu_lclhght', 'REAL', _pcl('mupcl', 'lclhght')),
+    ('mu_lfchght', 'REAL', _pcl('mupcl', 'lfchght')),
+    ('mu_elhght', 'REAL', _pcl('mupcl', 'elhght')),
+    ('mu_pres', 'REAL', _pcl('mupcl', 'pres')),
+    ('srh1km', 'REAL', lambda prof: prof.srh1km[0]),
+    ('srh3km', 'REAL', lambda prof: prof.srh3km[0]),
+    ('right_esrh', 'REAL', lambda prof: prof.right_esrh[0]),
+    ('sfc_1km_shear', 'REAL', lambda prof: utils.mag(*prof.sfc_1km_shear)),
+    ('sfc_6km_shear', 'REAL', lambda prof: utils.mag(*prof.sfc_6km_shear)),
+    ('ebwspd', 'REAL', lambda prof: prof.ebwspd),
+    ('stp_fixed', 'REAL', lambda prof: prof.stp_fixed),
+    ('stp_cin', 'REAL', lambda prof: prof.stp_cin),
+    ('right_scp', 'REAL', lambda prof: prof.right_scp),
+    ('ship', 'REAL', lambda prof: prof.ship),
+    ('pwat', 'REAL', lambda prof: prof.pwat),
+    ('k_idx', 'REAL', lambda prof: prof.k_idx),
+    ('lapserate_700_500', 'REAL', lambda prof: prof.lapserate_700_500),
+    ('precip_type', 'TEXT', lambda prof: prof.precip_type),
+    ('watch_type', 'TEXT', lambda prof: prof.watch_type),
+]
+
+INDEX_NAMES = [ name for name, sql_type, func in STORED_INDICES ]
+
+def _to_sql(value):
+    # Masked and missing values are stored as NULL
+    if value is None or value is ma.masked:
+        return None
+    if isinstance(value, basestring):
+        return value
+    value = float(value)
+    if np.isnan(value) or value == MISSING:
+        return None
+    return value
+
+def get_indices(prof):
+    '''
+    Pull the stored indices out of a ConvectiveProfile.
+
+    Parameters
+    ----------
+    prof : ConvectiveProfile or ProfileRecord object
+    The profile, or one rehydrated from its record (see
+    sharppy.sharptab.records)
+
+    Returns
+    -------
+    A dictionary of index name to value (None where missing)
+    '''
+    indices = {}
+    for name, sql_type, func in STORED_INDICES:
+        try:
+            indices[name] = _to_sql(func(prof))
+        except (AttributeError, IndexError, TypeError, ValueError):
+            indices[name] = None
+    return indices
+
+class IndexStore(object):
+    '''
+    A SQLite-backed store of computed sounding indices, keyed by profile
+    fingerprint (see Profile.fingerprint()). Once a profile has been
+    analyzed, its indices can be looked up without building a
+    ConvectiveProfile again. The 'indices' table can also be queried
+    directly (e.g. for statistics over an archive).
+
+    A single store can be shared between threads.
+    '''
+    def __init__(self, path=STORE_PATH):
+        self._path = path
+        if path != ':memory:':
+            store_dir = os.path.dirname(path)
+            if store_dir != '' and not os.path.exists(store_dir):
+                os.makedirs(store_dir)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._createTable()
+
+    def _createTable(self):
+        cols = ", ".join("%s %s" % (name, sql_type) for name, sql_type, func in STORED_INDICES)
+        with self._lock:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != STORE_VERSION:
+                # The schema changed (or this is a new store), so start over.
+                self._conn.execute("DROP TABLE IF EXISTS indices")
+                self._conn.execute("PRAGMA user_version = %d" % STORE_VERSION)
+
+            self._conn.execute("CREATE TABLE IF NOT EXISTS indices (fingerprint TEXT PRIMARY KEY, " +
+                "station TEXT, valid TEXT, %s)" % cols)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS indices_station_valid ON indices (station, valid)")
+            self._conn.commit()
+
+    def __contains__(self, prof):
+        return self.get(prof) is not None
+
+    def get(self, prof):
+        '''
+        Look up the indices for a profile.
+
+        Parameters
+        ----------
+        prof : Profile object or string
+        The profile (of any type) or its fingerprint
+
+        Returns
+        -------
+        A dictionary of index name to value, or None if the profile isn't in
+        the store.
+        '''
+        fprint = prof if isinstance(prof, basestring) else prof.fingerprint()
+        with self._lock:
+            row = self._conn.execute("SELECT %s FROM indices WHERE fingerprint = ?" % ", ".join(INDEX_NAMES),
+                (fprint,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(INDEX_NAMES, row))
+
+    def put(self, prof, valid=None):
+        '''
+        Add a computed profile to the store (replacing any earlier entry).
+
+        Parameters
+        ----------
+        prof : ConvectiveProfile or ProfileRecord object
+        valid : datetime object (optional)
+        The valid time of the profile
+
+        Returns
+        -------
+        A dictionary of index name to value
+        '''
+        indices = get_indices(prof)
+        valid = None if valid is None else valid.strftime('%Y-%m-%d %H:%M')
+        values = [ prof.fingerprint(), prof.location, valid ] + [ indices[name] for name in INDEX_NAMES ]
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO indices (fingerprint, station, valid, %s) VALUES (%s)" %
+                (", ".join(INDEX_NAMES), ", ".join("?" * len(values))), values)
+            self._conn.commit()
+        return indices
+
+    def analyze(self, prof, valid=None):
+        '''
+        Get the indices for a profile, computing and storing them if they
+        aren't in the store yet.
+
+        Parameters
+        ----------
+        prof : Profile object
+        The profile (of any type)
+        valid : datetime object (optional)
+        The valid time of the profile
+
+        Returns
+        -------
+        A dictionary of index name to value
+        '''
+        indices = self.get(prof)
+        if indices is None:
+            if not isinstance(prof, profile.ConvectiveProfile):
+                # Built from the same input fields (winds included, in whichever
+                #   form they were given), so it has the same fingerprint
+                prof = profile.ConvectiveProfile(**prof.inputFields())
+            indices = self.put(prof, valid=valid)
+        return indices
+
+    def query(self, sql, params=()):
+        '''
+        Run a read-only SQL query against the 'indices' table. The table has
+        columns fingerprint, station, valid ('YYYY-MM-DD HH:MM'), and one
+        column per entry in STORED_INDICES.
+
+        Returns
+        -------
+        A list of row tuples
+        '''
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self.query("SELECT COUNT(*) FROM indices")[0][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,326 @@
+''' Bulk computation and analysis of sounding parameters for plotting on the map '''
+import numpy as np
+import numpy.ma as ma
+
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+
+import sharppy.sharptab.profile as profile
+from sharppy.sharptab import params, winds, interp, utils
+from sharppy.sharptab.constants import MISSING
+
+__all__ = ['MAP_PARAMS', 'StationParams', 'overlay_params', 'barnes_analysis', 'contour_segments']
+
+## The parameters that can be plotted on the map, as display name to the
+## name of the index in sharppy.io.index_store.STORED_INDICES (which is what
+## the values match)
+MAP_PARAMS = OrderedDict([
+    ('MUCAPE', 'mu_bplus'),
+    ('STP', 'stp_cin'),
+    ('SCP', 'right_scp'),
+    ('SHIP', 'ship'),
+    ('0-6 km Shear', 'sfc_6km_shear'),
+    ('PW', 'pwat'),
+])
+
+def _value(value):
+    # Masked and missing values are None, as in the index store
+    if value is None or value is ma.masked:
+        return None
+    value = float(value)
+    if np.isnan(value) or value == MISSING:
+        return None
+    return value
+
+def overlay_params(prof):
+    '''
+    Compute the map parameters (see MAP_PARAMS) for a profile without
+    building a full ConvectiveProfile. They are computed the same way as in
+    ConvectiveProfile, but only the parcels and layers they need are.
+
+    Parameters
+    ----------
+    prof : Profile object
+    The profile (of any type, e.g. the raw profile from a decoder)
+
+    Returns
+    -------
+    A dictionary of parameter name (the keys of MAP_PARAMS) to value (None
+    where missing)
+    '''
+    if not isinstance(prof, profile.BasicProfile):
+        prof = profile.BasicProfile(**prof.inputFields())
+
+    mulplvals = params.DefineParcel(prof, flag=3)
+    mupcl = params.parcelx(prof, flag=3, lplvals=mulplvals)
+    mlpcl = params.parcelx(prof, flag=4)
+
+    sfc = prof.pres[prof.sfc]
+    p6km = interp.pres(prof, interp.to_msl(prof, 6000.))
+    sfc_6km_shear = winds.wind_shear(prof, pbot=sfc, ptop=p6km)
+
+    ebottom, etop = params.effective_inflow_layer(prof, mupcl=mupcl)
+    if etop is ma.masked or ebottom is ma.masked:
+        stp_cin = 0.0
+        scp = 0.0
+    else:
+        ebotm = interp.to_agl(prof, interp.hght(prof, ebottom))
+        etopm = interp.to_agl(prof, interp.hght(prof, etop))
+        srwind = params.bunkers_storm_motion(prof, mupcl=mupcl, pbot=ebottom)
+        depth = ( mupcl.elhght - ebotm ) / 2
+        elh = interp.pres(prof, interp.to_msl(prof, ebotm + depth))
+        ebwd = winds.wind_shear(prof, pbot=ebottom, ptop=elh)
+        ebwspd = utils.mag( ebwd[0], ebwd[1] )
+        esrh = winds.helicity(prof, ebotm, etopm, stu=srwind[0], stv=srwind[1])[0]
+        scp = params.scp(mupcl.bplus, esrh, utils.KTS2MS(ebwspd))
+        stp_cin = params.stp_cin(mlpcl.bplus, esrh, utils.KTS2MS(ebwspd), mlpcl.lclhght, mlpcl.bminus)
+
+    values = {
+        'MUCAPE':mupcl.bplus,
+        'STP':stp_cin,
+        'SCP':scp,
+        'SHIP':params.ship(prof, mupcl=mupcl),
+        '0-6 km Shear':utils.mag(*sfc_6km_shear),
+        'PW':params.precip_water(prof),
+    }
+    return dict( (name, _value(values[name])) for name in MAP_PARAMS )
+
+def _station_params(task):
+    # Decode one station's file and compute the map parameters for one time. This
+    #   runs in the worker processes, so it has to be a module-level function.
+    srcid, url, decoder, prof_idx = task
+    try:
+        # Only the mean is needed for ensembles, so don't bother with the members.
+        values = overlay_params(decoder(url).getRawProfile(prof_idx))
+    except Exception:
+        # Missing or bad data; the station just doesn't get plotted.
+        return srcid, None
+    return srcid, values
+
+def barnes_analysis(xs, ys, vals, grid_xs, grid_ys):
+    '''
+    Interpolate scattered values to a regular grid with a single-pass Barnes
+    analysis. The smoothing parameter comes from the average spacing of the
+    points (Koch et al. 1983).
+
+    Parameters
+    ----------
+    xs, ys : numpy arrays
+    The locations of the points
+    vals : numpy array
+    The values at the points (non-finite values are left out)
+    grid_xs, grid_ys : numpy arrays
+    The x and y coordinates of the grid columns and rows
+
+    Returns
+    -------
+    A masked array with shape (len(grid_ys), len(grid_xs)), masked more than
+    twice the average spacing from the nearest point
+    '''
+    good = np.isfinite(xs) & np.isfinite(ys) & np.isfinite(vals)
+    xs, ys, vals = xs[good], ys[good], vals[good]
+
+    shape = (len(grid_ys), len(grid_xs))
+    area = (xs.max() - xs.min()) * (ys.max() - ys.min()) if len(xs) > 0 else 0
+    if len(xs) < 3 or area == 0:
+        return ma.masked_all(shape)
+
+    spacing = np.sqrt(area / len(xs))
+    kappa = 5.052 * (2 * spacing / np.pi) ** 2
+
+    gxs, gys = np.meshgrid(grid_xs, grid_ys)
+    gxs, gys = gxs.ravel(), gys.ravel()
+    analysis = np.empty(gxs.shape)
+    min_dist2 = np.empty(gxs.shape)
+
+    ## Do the grid points a chunk at a time to keep the weight arrays small
+    chunk = max(250000 // len(xs), 1)
+    for start in xrange(0, len(gxs), chunk):
+        sl = slice(start, start + chunk)
+        dist2 = (gxs[sl, np.newaxis] - xs) ** 2 + (gys[sl, np.newaxis] - ys) ** 2
+        weights = np.exp(-dist2 / kappa)
+        analysis[sl] = (weights * vals).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-300)
+        min_dist2[sl] = dist2.min(axis=1)
+
+    return ma.masked_where(min_dist2.reshape(shape) > (2 * spacing) ** 2, analysis.reshape(shape))
+
+def contour_segments(grid_xs, grid_ys, grid, level):
+    '''
+    Find the line segments making up one contour of a grid (marching squares).
+    Masked and non-finite grid points are left out.
+
+    Parameters
+    ----------
+    grid_xs, grid_ys : numpy arrays
+    The x and y coordinates of the grid columns and rows
+    grid : numpy array
+    The values, with shape (len(grid_ys), len(grid_xs))
+    level : number
+    The contour level
+
+    Returns
+    -------
+    The start and end points of the segments, as arrays (x0, y0, x1, y1)
+    '''
+    vals = ma.filled(ma.asanyarray(grid, dtype=float), np.nan)
+
+    ## The corners of each cell, going around the cell. Edge k runs from
+    ## corner k to corner k + 1.
+    corners = np.array([ vals[:-1, :-1], vals[:-1, 1:], vals[1:, 1:], vals[1:, :-1] ])
+    x0s, x1s = grid_xs[np.newaxis, :-1], grid_xs[np.newaxis, 1:]
+    y0s, y1s = grid_ys[:-1, np.newaxis], grid_ys[1:, np.newaxis]
+    corner_xs = np.array([ np.broadcast_to(x, corners.shape[1:]) for x in [ x0s, x1s, x1s, x0s ] ])
+    corner_ys = np.array([ np.broadcast_to(y, corners.shape[1:]) for y in [ y0s, y0s, y1s, y1s ] ])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        good = np.isfinite(corners).all(axis=0)
+        above = corners >= level
+        crossed = (above != np.roll(above, -1, axis=0)) & good
+
+        frac = (level - corners) / (np.roll(corners, -1, axis=0) - corners)
+        edge_xs = (corner_xs + frac * (np.roll(corner_xs, -1, axis=0) - corner_xs)).reshape(4, -1)
+        edge_ys = (corner_ys + frac * (np.roll(corner_ys, -1, axis=0) - corner_ys)).reshape(4, -1)
+
+    n_crossed = crossed.sum(axis=0).ravel()
+    crossed = crossed.reshape(4, -1)
+
+    ## Cells with two crossed edges get one segment between them.
+    cells = np.where(n_crossed == 2)[0]
+    order = np.argsort(~crossed[:, cells], axis=0, kind='mergesort')
+    start_edges, end_edges = [ order[0] ], [ order[1] ]
+    seg_cells = [ cells ]
+
+    ## Saddle cells have all four edges crossed. If the center is on the same
+    ## side as corner 0, cut off corners 1 and 3; otherwise cut off 0 and 2.
+    cells = np.where(n_crossed == 4)[0]
+    center_same = (corners.reshape(4, -1)[:, cells].mean(axis=0) >= level) == above.reshape(4, -1)[0, cells]
+    for sel, pairs in [ (cells[center_same], [ (0, 1), (2, 3) ]), (cells[~center_same], [ (3, 0), (1, 2) ]) ]:
+        for start_edge, end_edge in pairs:
+            start_edges.append(np.repeat(start_edge, len(sel)))
+            end_edges.append(np.repeat(end_edge, len(sel)))
+            seg_cells.append(sel)
+
+    start_edges, end_edges = np.concatenate(start_edges), np.concatenate(end_edges)
+    seg_cells = np.concatenate(seg_cells)
+    return edge_xs[start_edges, seg_cells], edge_ys[start_edges, seg_cells], \
+        edge_xs[end_edges, seg_cells], edge_ys[end_edges, seg_cells]
+
+class StationParams(object):
+    '''
+    Computes the map parameters (see MAP_PARAMS) for many stations at once
+    in a pool of worker processes. All the parameters for a station are
+    computed together, so switching between them is free, and the results
+    are cached per (data source, cycle, forecast hour).
+
+    A single instance can be shared between threads.
+    '''
+    def __init__(self, processes=None, max_entries=8):
+        '''
+        Parameters
+        ----------
+        processes : int (optional)
+        The number of worker processes (defaults to the number of CPUs). If 1,
+        everything is computed in the calling thread.
+        max_entries : int (optional; default 8)
+        The number of (data source, cycle, forecast hour) entries to keep
+        '''
+        self._processes = processes
+        self._max_entries = max_entries
+        self._pool = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _imap(self, func, tasks):
+        if self._processes == 1:
+            return itertools.imap(func, tasks)
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self._processes)
+            pool = self._pool
+        return pool.imap_unordered(func, tasks)
+
+    def _entry(self, key):
+        # The (mutable) cache entry for a key; call with the lock held.
+        if key in self._cache:
+            entry = self._cache.pop(key)
+        else:
+            entry = {}
+        self._cache[key] = entry
+
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+        return entry
+
+    def get(self, key):
+        '''
+        Get everything computed so far for a key.
+
+        Parameters
+        ----------
+        key : tuple
+        The (data source name, cycle, forecast hour) key
+
+        Returns
+        -------
+        A dictionary of station source id to a dictionary of parameter name
+        to value (None for stations whose data couldn't be loaded)
+        '''
+        with self._lock:
+            return dict(self._entry(key))
+
+    def compute(self, data_source, points, cycle, fhour, cancel=None):
+        '''
+        Compute the map parameters for a list of stations at one time. Only
+        the stations that aren't already in the cache are loaded.
+
+        Parameters
+        ----------
+        data_source : DataSource object
+        points : list of dictionaries
+        The stations, as returned by DataSource.getAvailableAtTime()
+        cycle : datetime object
+        The cycle (run) time
+        fhour : int
+        The forecast hour
+        cancel : CancelToken (optional)
+        Checked as each station finishes. Stations that finished before the
+        cancel are still cached.
+
+        Returns
+        -------
+        A dictionary of station source id to a dictionary of parameter name
+        to value (None for stations whose data couldn't be loaded)
+        '''
+        key = (data_source.getName(), cycle, fhour)
+        prof_idx = data_source.getForecastHours().index(fhour)
+
+        cached = self.get(key)
+        tasks = [ (p['srcid'], data_source.getURL(p, cycle), data_source.getDecoder(p, cycle), prof_idx)
+            for p in points if p['srcid'] not in cached ]
+
+        for srcid, values in self._imap(_station_params, tasks):
+            with self._lock:
+                self._entry(key)[srcid] = values
+            cached[srcid] = values
+
+            if cancel is not None:
+                cancel.check()
+
+        return dict( (p['srcid'], cached[p['srcid']]) for p in points )
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        '''
+        Stop the worker processes. Anything still being computed is dropped.
+        '''
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
@@ -12,22 +12,34 @@ class SPCDecoder(Decoder):
         super(SPCDecoder, self).__init__(file_name)
 
     def _parse(self, file_name):
-        file_data = self._downloadFile(file_name)           
-        ## read in the file
-        data = np.array([l.strip() for l in file_data.split('\n')])
-
-        ## necessary index points
-        title_idx = np.where( data == '%TITLE%')[0][0]
-        start_idx = np.where( data == '%RAW%' )[0] + 1
-        finish_idx = np.where( data == '%END%')[0]
+        stream = self._openFile(file_name)
+
+        ## read in the file, keeping only the title and the raw data block
+        title = None
+        raw_lines = []
+        section = None
+        for line in stream:
+            line = line.strip()
+            if line in [ '%TITLE%', '%RAW%', '%END%' ]:
+                section = line
+            elif section == '%TITLE%' and title is None:
+                title = line
+            elif section == '%RAW%':
+                raw_lines.append(line)
+        stream.close()
+
+        if not title:
+            raise IOError("File '%s' has no %%TITLE%% section" % file_name)
+        if len(raw_lines) == 0:
+            raise IOError("File '%s' has no %%RAW%% section" % file_name)
 
         ## create the plot title
-        data_header = data[title_idx + 1].split()
+        data_header = title.split()
         location = data_header[0]
         time = data_header[1][:11]
 
         ## put it all together for StringIO
-        full_data = '\n'.join(data[start_idx : finish_idx][:])
+        full_data = '\n'.join(raw_lines)
         sound_data = StringIO( full_data )
 
         ## read the data into arrays
@@ -0,0 +1,196 @@
+''' Streaming input for the sounding decoders '''
+import os
+import zlib
+import bz2
+
+from sharppy.io.fetch import fetch_open
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+__all__ = ['DataStream', 'open_stream']
+
+## Magic numbers at the start of the supported compressed formats
+_GZIP_MAGIC = '\x1f\x8b'
+_BZ2_MAGIC = 'BZh'
+_XZ_MAGIC = '\xfd7zXZ\x00'
+
+CHUNK_SIZE = 64 * 1024
+
+def _decompressor(head):
+    '''
+    Pick a streaming decompressor based on the first bytes of the data.
+
+    Parameters
+    ----------
+    head : string
+    The first bytes read from the data source
+
+    Returns
+    -------
+    An object with a decompress() method, or None if the data are not
+    compressed.
+    '''
+    if head.startswith(_GZIP_MAGIC):
+        # 16 + MAX_WBITS tells zlib to expect the gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif head.startswith(_BZ2_MAGIC):
+        return bz2.BZ2Decompressor()
+    elif head.startswith(_XZ_MAGIC):
+        if lzma is None:
+            raise IOError("Data are xz-compressed, but no lzma module is available")
+        return lzma.LZMADecompressor()
+    return None
+
+def _open_raw(source):
+    '''
+    Open a local file or URL for binary reading. URLs are fetched through
+    the shared Fetcher (see sharppy.io.fetch), so repeated downloads of an
+    unchanged file come from the local cache. Objects that already
+    have a read() method (open files, StringIO buffers, etc.) are passed
+    through untouched.
+    '''
+    if hasattr(source, 'read'):
+        return source
+
+    if os.path.exists(source):
+        return open(source, 'rb')
+
+    try:
+        return fetch_open(source)
+    except (ValueError, IOError):
+        raise IOError("File '%s' cannot be found" % source)
+
+class DataStream(object):
+    '''
+    A read-only, line-oriented view of a data source that is read in
+    fixed-size chunks. Compressed data (gzip, bzip2 or xz) are detected
+    from their magic numbers and decompressed on the fly, so at no point
+    does the whole file need to be held in memory. Files made up of several
+    compressed streams one after another (e.g. concatenated gzip files) are
+    read through to the end.
+
+    Iterating over a DataStream yields the lines of the (decompressed)
+    data, including their line endings.
+    '''
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        self._raw = _open_raw(source)
+        self._chunk_size = chunk_size
+        self._close_raw = not hasattr(source, 'read')
+
+        # Whether the data are compressed isn't known until enough of them
+        #   have been read to see the magic number.
+        self._compressed = None
+        self._decomp = None
+        self._head = ''
+        self._eof = False
+
+    def _decompress(self, data):
+        # Feed raw data to the decompressor. A file made by concatenating
+        #   compressed files (e.g. "cat a.gz b.gz > c.gz") holds one stream
+        #   after another, so when a stream ends, the data after it start a
+        #   new one.
+        out = []
+        while data:
+            if self._decomp is None:
+                data = self._head + data
+                if len(data) < len(_XZ_MAGIC):
+                    self._head = data
+                    break
+
+                self._head = ''
+                self._decomp = _decompressor(data)
+                if self._decomp is None:
+                    if self._compressed is None:
+                        # Not compressed, so pass everything through as-is
+                        self._compressed = False
+                        out.append(data)
+                    # Otherwise, it's padding after the last stream, which
+                    #   gzip ignores as well.
+                    break
+                self._compressed = True
+
+            try:
+                # The decompressor may need more input before producing output
+                out.append(self._decomp.decompress(data))
+            except EOFError:
+                # bz2 and lzma raise this on input after the end of a stream
+                self._decomp = None
+                continue
+
+            data = self._decomp.unused_data
+            if data != '':
+                self._decomp = None
+        return ''.join(out)
+
+    def _next_chunk(self):
+        while not self._eof:
+            chunk = self._raw.read(self._chunk_size)
+
+            if chunk == '':
+                self._eof = True
+                if self._compressed is None:
+                    # Too short to have a magic number
+                    return self._head
+                if self._decomp is not None and hasattr(self._decomp, 'flush'):
+                    return self._decomp.flush()
+                return ''
+
+            if self._compressed is not False:
+                chunk = self._decompress(chunk)
+            if chunk != '':
+                return chunk
+        return ''
+
+    def chunks(self):
+        '''
+        Generator over the decompressed data in chunks.
+        '''
+        while True:
+            chunk = self._next_chunk()
+            if chunk == '':
+                break
+            yield chunk
+
+    def __iter__(self):
+        partial = ''
+        for chunk in self.chunks():
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if partial != '':
+            yield partial
+
+    def read(self):
+        '''
+        Read the rest of the stream and return it as a single string.
+        '''
+        return ''.join(self.chunks())
+
+    def close(self):
+        if self._close_raw:
+            self._raw.close()
+
+def open_stream(source, chunk_size=CHUNK_SIZE):
+    '''
+    Open a local file name, URL or file-like object (e.g. a StringIO buffer)
+    as a DataStream.
+
+    Parameters
+    ----------
+    source : string or file-like object
+    The file name, URL, or open file object to read from
+    chunk_size : int (optional)
+    Number of bytes to read from the source at a time
+
+    Returns
+    -------
+    A DataStream object
+    '''
+    return DataStream(source, chunk_size=chunk_size)
@@ -6,5 +6,10 @@ import interp
 import winds
 import params
 import watch_type
+import timeseries
+import batch
+import uncertainty
+import ensemble
+import records
 
-__all__ = ['constants', 'utils', 'profile', 'params', 'thermo', 'interp', 'winds', 'sars', 'watch_type']
+__all__ = ['constants', 'utils', 'profile', 'params', 'thermo', 'interp', 'winds', 'sars', 'watch_type', 'timeseries', 'batch', 'uncertainty', 'ensemble', 'records']
@@ -0,0 +1,419 @@
+''' Batched Parcel Lifting over Many Environments at Once '''
+from __future__ import division
+import numpy as np
+import numpy.ma as ma
+from sharppy.sharptab import thermo
+from sharppy.sharptab.constants import *
+
+__all__ = ['SWEEP_PARAMS', 'define_parcels', 'lift_parcels', 'surface_sweep']
+
+## The parcel parameters computed by lift_parcels
+SWEEP_PARAMS = ['bplus', 'bminus', 'lclpres', 'lclhght', 'lfcpres', 'lfchght']
+
+
+def _satlift(p, thetam):
+    '''
+    Array version of thermo.satlift. Every element is iterated the same way
+    as in thermo.satlift and frozen once it has converged, so the results
+    match it exactly.
+
+    '''
+    p, thetam = np.broadcast_arrays(np.asarray(p, dtype=float), np.asarray(thetam, dtype=float))
+    out = thetam.copy()
+    todo = np.fabs(p - 1000.) - 0.001 > 0
+    if not todo.any():
+        return out
+
+    p = p[todo]
+    thetam = thetam[todo]
+    pwrp = np.power((p / 1000.), ROCP)
+    t1 = (thetam + ZEROCNK) * pwrp - ZEROCNK
+    e1 = thermo.wobf(t1) - thermo.wobf(thetam)
+    rate = np.ones(p.shape)
+    t2 = np.empty(p.shape)
+    e2 = np.empty(p.shape)
+    eor = np.empty(p.shape)
+    active = np.ones(p.shape, dtype=bool)
+    first = True
+    while active.any():
+        if not first:
+            ## Successive passes
+            rate[active] = (t2[active] - t1[active]) / (e2[active] - e1[active])
+            t1[active] = t2[active]
+            e1[active] = e2[active]
+        first = False
+        t2[active] = t1[active] - (e1[active] * rate[active])
+        e2[active] = (t2[active] + ZEROCNK) / pwrp[active] - ZEROCNK
+        e2[active] += thermo.wobf(t2[active]) - thermo.wobf(e2[active]) - thetam[active]
+        eor[active] = e2[active] * rate[active]
+        with np.errstate(invalid='ignore'):
+            active &= np.fabs(eor) - 0.1 > 0
+
+    out[todo] = t2 - eor
+    return out
+
+
+def _wetlift(p, t, p2):
+    '''
+    Array version of thermo.wetlift.
+
+    '''
+    thta = thermo.theta(p, t, 1000.)
+    thetam = thta - thermo.wobf(thta) + thermo.wobf(t)
+    return _satlift(p2, thetam)
+
+
+def _virtemp(p, t, td):
+    '''
+    Array version of thermo.virtemp, with the temperature passed back
+    wherever the dewpoint is missing (NaN).
+
+    '''
+    with np.errstate(invalid='ignore'):
+        vt = thermo.virtemp(p, t, td)
+    return np.where(np.isfinite(vt), vt, t)
+
+
+class _Levels(object):
+    '''
+    Row-by-row linear interpolation in log10(pressure) on the levels of a
+    profile. All the rows share the profile's pressure levels, so the
+    brackets are found once for all the points. This gives the same results
+    as sharppy.sharptab.interp, with NaN outside of the data.
+
+    '''
+    def __init__(self, prof):
+        self.logp = np.log10(ma.filled(ma.asanyarray(prof.pres, dtype=float), np.nan))
+        self.pres_ok = np.isfinite(self.logp)
+
+    def __call__(self, field, p, valid=None):
+        field = np.atleast_2d(field)
+        x = np.log10(np.asarray(p, dtype=float))
+        rows = np.arange(field.shape[0]).reshape((-1,) + (1,) * (x.ndim - 1))
+
+        good = self.pres_ok if valid is None else self.pres_ok & valid
+        cols = np.where(good)[0][::-1]
+        xp = self.logp[cols]
+        fp = field[:, cols]
+        if len(xp) == 0:
+            return np.nan * np.ones(np.broadcast(x, rows).shape)
+
+        with np.errstate(invalid='ignore'):
+            hi = np.clip(np.searchsorted(xp, x, side='right'), 1, max(len(xp) - 1, 1))
+            lo = hi - 1
+            if len(xp) == 1:
+                out = fp[rows, lo] + 0. * x
+            else:
+                slope = (fp[rows, hi] - fp[rows, lo]) / (xp[hi] - xp[lo])
+                out = slope * (x - xp[lo]) + fp[rows, lo]
+                out = np.where(x == xp[-1], fp[rows, len(xp) - 1], out)
+            out = np.where((x < xp[0]) | (x > xp[-1]) | np.isnan(x), np.nan, out)
+        return out
+
+
+def _environments(prof, env_tmpc=None, env_dwpc=None):
+    '''
+    The temperature and dewpoint of each environment as 2D float arrays
+    (NaN where missing), defaulting to the profile itself.
+
+    '''
+    if env_tmpc is None:
+        env_tmpc = prof.tmpc[np.newaxis, :]
+    if env_dwpc is None:
+        env_dwpc = prof.dwpc[np.newaxis, :]
+    env_tmpc = np.atleast_2d(ma.filled(ma.asanyarray(env_tmpc, dtype=float), np.nan))
+    env_dwpc = np.atleast_2d(ma.filled(ma.asanyarray(env_dwpc, dtype=float), np.nan))
+    return np.broadcast_arrays(env_tmpc, env_dwpc)
+
+
+def define_parcels(prof, flag=1, env_tmpc=None, env_dwpc=None, presval=100.):
+    '''
+    Define the lifted parcel for many environments at once, the same way as
+    sharppy.sharptab.params.DefineParcel. The environments all share the
+    pressure and height levels of the profile.
+
+    Parameters
+    ----------
+    prof : profile object
+        Profile object (supplies the pressure and height levels)
+    flag : int (optional; default = 1)
+        Parcel Selection (see DefineParcel). Only these are supported:
+        1: Observed Surface Parcel
+        4: Mean Mixed Layer Parcel
+    env_tmpc : 2D array (optional)
+        The temperature (C) of each environment, with shape (N, levels).
+        Defaults to the profile's.
+    env_dwpc : 2D array (optional)
+        The dewpoint (C) of each environment, with shape (N, levels).
+        Defaults to the profile's.
+    presval : number (optional; default = 100)
+        The depth (hPa) of the mixed layer
+
+    Returns
+    -------
+    pres : numpy array
+        The pressure (hPa) of each parcel
+    tmpc : numpy array
+        The temperature (C) of each parcel
+    dwpc : numpy array
+        The dewpoint (C) of each parcel
+
+    '''
+    env_tmpc, env_dwpc = _environments(prof, env_tmpc, env_dwpc)
+    nenv = env_tmpc.shape[0]
+    pbot = prof.pres[prof.sfc]
+
+    if flag == 1:
+        return np.ones(nenv) * pbot, env_tmpc[:, prof.sfc].copy(), env_dwpc[:, prof.sfc].copy()
+
+    if flag != 4:
+        raise ValueError("Batched parcels can only be surface (flag 1) or mixed layer (flag 4) parcels")
+
+    ## The exact layer averages from params.mean_theta and params.mean_mixratio:
+    ## the levels inside the layer count twice as much as the ends.
+    ptop = pbot - presval
+    levels = _Levels(prof)
+    pres = ma.filled(ma.asanyarray(prof.pres, dtype=float), np.nan)
+    with np.errstate(invalid='ignore'):
+        inside = (pbot > pres) & (ptop < pres)
+    ind1 = np.where(pbot > pres)[0].min()
+    ind2 = np.where(ptop < pres)[0].max()
+    inside[:ind1] = False
+    inside[ind2 + 1:] = False
+
+    tmpc_ok = np.isfinite(env_tmpc).all(axis=0)
+    tmp_bot = levels(env_tmpc, pbot, tmpc_ok)
+    tmp_top = levels(env_tmpc, ptop, tmpc_ok)
+    theta = thermo.theta(pres[inside], env_tmpc[:, inside])
+    theta_ok = np.isfinite(theta)
+    tott = thermo.theta(pbot, tmp_bot) + thermo.theta(ptop, tmp_top) + 2 * np.where(theta_ok, theta, 0.).sum(axis=1)
+    mtheta = tott / (2 + 2 * theta_ok.sum(axis=1))
+
+    dwpc_ok = np.isfinite(env_dwpc).all(axis=0)
+    dwpt_bot = levels(env_dwpc, pbot, dwpc_ok)
+    dwpt_top = levels(env_dwpc, ptop, dwpc_ok)
+    mask = inside & dwpc_ok
+    totd = dwpt_bot + dwpt_top + 2 * env_dwpc[:, mask].sum(axis=1)
+    totp = pbot + ptop + 2 * pres[mask].sum()
+    num = 2 + 2 * mask.sum()
+    mmr = thermo.mixratio(totp / num, totd / num)
+
+    tmpc = thermo.theta(1000., mtheta, pbot)
+    dwpc = thermo.temp_at_mixrat(mmr, pbot)
+    return np.ones(nenv) * pbot, tmpc, dwpc
+
+
+def lift_parcels(prof, pres, tmpc, dwpc, env_tmpc=None, env_dwpc=None, env_hght=None):
+    '''
+    Lift many parcels through many environments at once, computing the
+    CAPE, CINH, LCL, and LFC the same way as sharppy.sharptab.params.parcelx.
+    Each parcel is lifted through its own environment, and all the
+    environments share the pressure levels of the profile, so the moist
+    ascent is done level by level for all the parcels together.
+
+    Parameters
+    ----------
+    prof : profile object
+        Profile object (supplies the pressure and height levels, and the
+        environment when env_tmpc and env_dwpc are not given)
+    pres : array_like
+        The pressure (hPa) of each parcel
+    tmpc : array_like
+        The temperature (C) of each parcel
+    dwpc : array_like
+        The dewpoint (C) of each parcel
+    env_tmpc : 2D array (optional)
+        The temperature (C) of each environment, with shape (N, levels)
+    env_dwpc : 2D array (optional)
+        The dewpoint (C) of each environment, with shape (N, levels)
+    env_hght : 2D array (optional)
+        The height (m MSL) of each environment, with shape (N, levels).
+        Defaults to the profile's.
+
+    Returns
+    -------
+    A dictionary of parameter name (see SWEEP_PARAMS) to a masked array with
+    one value per parcel
+
+    '''
+    pres, tmpc, dwpc = [ ma.filled(ma.asanyarray(v, dtype=float), np.nan) for v in (pres, tmpc, dwpc) ]
+    pres, tmpc, dwpc = np.broadcast_arrays(np.atleast_1d(pres), np.atleast_1d(tmpc), np.atleast_1d(dwpc))
+    env_tmpc, env_dwpc = _environments(prof, env_tmpc, env_dwpc)
+    env_tmpc, env_dwpc = [ np.broadcast_to(env, (len(pres), env.shape[1])) for env in (env_tmpc, env_dwpc) ]
+    npcl = len(pres)
+
+    levels = _Levels(prof)
+    prof_pres = ma.filled(ma.asanyarray(prof.pres, dtype=float), np.nan)
+    if env_hght is None:
+        env_hght = prof.hght[np.newaxis, :]
+    hghts = np.atleast_2d(ma.filled(ma.asanyarray(env_hght, dtype=float), np.nan))
+    hghts = np.broadcast_to(hghts, (npcl, hghts.shape[1]))
+    hght_ok = np.isfinite(hghts).all(axis=0)
+    tmpc_ok = np.isfinite(env_tmpc).all(axis=0)
+    dwpc_ok = np.isfinite(env_dwpc).all(axis=0)
+    sfc_pres = prof_pres[prof.sfc]
+    sfc_hght = hghts[:, prof.sfc]
+
+    env_vtmp = _virtemp(prof_pres, env_tmpc, env_dwpc)
+    vtmp_ok = tmpc_ok
+
+    def hght(p):
+        return levels(hghts, p, hght_ok)
+
+    def vtmp(p, rows=slice(None)):
+        return levels(env_vtmp[rows], p[:, np.newaxis], vtmp_ok)[:, 0]
+
+    result = dict( (name, np.nan * np.ones(npcl)) for name in SWEEP_PARAMS )
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pbot = np.minimum(sfc_pres, pres)
+
+        ## Lift the parcels to the LCL
+        pe_lcl, tp_lcl = thermo.drylift(pres, tmpc, dwpc)
+        result['lclpres'] = np.minimum(pe_lcl, sfc_pres)
+        result['lclhght'] = hght(pe_lcl) - sfc_hght
+
+        ## Accumulated CINH in the mixing layer below the LCL, in 1 hPa steps
+        theta_parcel = thermo.theta(pe_lcl, tp_lcl, 1000.)
+        blmr = thermo.mixratio(pres, dwpc)
+        nsteps = np.ceil(pbot - pe_lcl + 1)
+        nsteps = np.where(np.isfinite(nsteps), np.maximum(nsteps, 0), 0).astype(int)
+        totn = np.zeros(npcl)
+        if nsteps.max() > 1:
+            pp = pbot[:, np.newaxis] - np.arange(nsteps.max())[np.newaxis, :]
+            hh = hght(pp)
+            tmp_env_theta = thermo.theta(pp, levels(env_tmpc, pp, tmpc_ok), 1000.)
+            tmp_env_dwpt = levels(env_dwpc, pp, dwpc_ok)
+            tv_env = _virtemp(pp, tmp_env_theta, tmp_env_dwpt)
+            tmp1 = _virtemp(pp, theta_parcel[:, np.newaxis], thermo.temp_at_mixrat(blmr[:, np.newaxis], pp))
+            tdef = (tmp1 - tv_env) / thermo.ctok(tv_env)
+            lyre = G * (tdef[:, :-1] + tdef[:, 1:]) / 2 * (hh[:, 1:] - hh[:, :-1])
+            in_layer = np.arange(1, pp.shape[1])[np.newaxis, :] < nsteps[:, np.newaxis]
+            totn = np.where(in_layer & (lyre < 0), lyre, 0.).sum(axis=1)
+
+        ## Moist ascent from the LCL, level by level for all the parcels
+        pbot = np.where(pbot > pe_lcl, pe_lcl, pbot)
+        lptr = np.array([ np.where(p >= prof_pres)[0].min() if np.isfinite(p) else len(prof_pres) for p in pbot ])
+        pe1 = pbot.copy()
+        h1 = hght(pe1)
+        te1 = vtmp(pe1)
+        tp1 = _wetlift(pe_lcl, tp_lcl, pe1)
+        lyre = np.zeros(npcl)
+        lyrlast = np.zeros(npcl)
+        totp = np.zeros(npcl)
+        bplus = np.nan * np.ones(npcl)
+        bminus = np.nan * np.ones(npcl)
+        lfcpres = np.nan * np.ones(npcl)
+        top = len(prof_pres) - 1
+
+        for i in xrange(lptr.min() if npcl > 0 else top + 1, top + 1):
+            if not tmpc_ok[i]: continue
+            rows = np.where(lptr <= i)[0]
+            pe2 = prof_pres[i]
+            h2 = hghts[rows, i]
+            te2 = env_vtmp[rows, i]
+            tp2 = _wetlift(pe1[rows], tp1[rows], pe2)
+            tdef1 = (thermo.virtemp(pe1[rows], tp1[rows], tp1[rows]) - te1[rows]) / thermo.ctok(te1[rows])
+            tdef2 = (thermo.virtemp(pe2, tp2, tp2) - te2) / thermo.ctok(te2)
+            lyrlast[rows] = lyre[rows]
+            lyre[rows] = G * (tdef1 + tdef2) / 2. * (h2 - h1[rows])
+
+            pos = lyre[rows] > 0
+            totp[rows[pos]] += lyre[rows[pos]]
+            if pe2 > 500.:
+                totn[rows[~pos]] += lyre[rows[~pos]]
+
+            pelast = pe1[rows]
+            pe1[rows] = pe2
+            h1[rows] = h2
+            te1[rows] = te2
+            tp1[rows] = tp2
+
+            ## The top of the profile
+            if i == top:
+                lyrf = lyre[rows]
+                bplus[rows] = np.where(lyrf > 0, totp[rows] - lyrf, totp[rows])
+                bminus[rows] = np.where((lyrf <= 0) & (pe2 > 500.), totn[rows] + lyrf, totn[rows])
+
+            ## LFC possibility
+            lfc = (lyre[rows] >= 0.) & (lyrlast[rows] <= 0.)
+            if lfc.any():
+                lfc_rows = rows[lfc]
+                pe3 = pelast[lfc]
+                tp3 = _wetlift(pe1[lfc_rows], tp1[lfc_rows], pe3)
+                env3 = vtmp(pe3, lfc_rows)
+                below = env3 < thermo.virtemp(pe3, tp3, tp3)
+                lfcpres[lfc_rows[below]] = pe3[below]
+                stepping = env3 > thermo.virtemp(pe3, tp3, tp3)
+                while stepping.any():
+                    pe3[stepping] -= 5
+                    lfcpres[lfc_rows[stepping]] = pe3[stepping]
+                    tp3[stepping] = _wetlift(pe1[lfc_rows[stepping]], tp1[lfc_rows[stepping]], pe3[stepping])
+                    env3[stepping] = vtmp(pe3[stepping], lfc_rows[stepping])
+                    stepping &= env3 > thermo.virtemp(pe3, tp3, tp3)
+
+                ## Force the LFC to be at least at the LCL
+                lfc_lcl = lfcpres[lfc_rows] >= result['lclpres'][lfc_rows]
+                lfcpres[lfc_rows[lfc_lcl]] = result['lclpres'][lfc_rows[lfc_lcl]]
+
+        no_top = np.isnan(bplus)
+        bplus[no_top] = totp[no_top]
+        bminus[np.floor(bplus) == 0] = 0.
+
+        result['bplus'] = bplus
+        result['bminus'] = bminus
+        result['lfcpres'] = lfcpres
+        result['lfchght'] = hght(lfcpres) - sfc_hght
+
+    ## Parcels that couldn't be lifted at all
+    bad = ~(np.isfinite(pres) & np.isfinite(tmpc) & np.isfinite(dwpc))
+    for name in SWEEP_PARAMS:
+        result[name][bad] = np.nan
+        result[name] = ma.masked_invalid(result[name])
+    return result
+
+
+def surface_sweep(prof, tmpcs, dwpcs, flag=1):
+    '''
+    Compute the parcel parameters for every combination of a set of surface
+    temperatures and dewpoints (i.e. what the CAPE would be if the surface
+    reached 32/22 C), with all the parcels lifted together. Combinations
+    where the dewpoint is above the temperature are masked.
+
+    Parameters
+    ----------
+    prof : profile object
+        Profile object
+    tmpcs : array_like
+        The surface temperatures (C)
+    dwpcs : array_like
+        The surface dewpoints (C)
+    flag : int (optional; default = 1)
+        Parcel Selection (1: Surface, 4: Mean Mixed Layer; see DefineParcel)
+
+    Returns
+    -------
+    A dictionary of parameter name (see SWEEP_PARAMS) to a 2D masked array
+    with shape (len(tmpcs), len(dwpcs))
+
+    '''
+    tmpcs = np.asarray(tmpcs, dtype=float)
+    dwpcs = np.asarray(dwpcs, dtype=float)
+    sfc_tmpc, sfc_dwpc = np.meshgrid(tmpcs, dwpcs, indexing='ij')
+    ok = (sfc_dwpc <= sfc_tmpc).ravel()
+
+    env_tmpc, env_dwpc = _environments(prof)
+    env_tmpc = np.repeat(env_tmpc, ok.sum(), axis=0)
+    env_dwpc = np.repeat(env_dwpc, ok.sum(), axis=0)
+    env_tmpc[:, prof.sfc] = sfc_tmpc.ravel()[ok]
+    env_dwpc[:, prof.sfc] = sfc_dwpc.ravel()[ok]
+
+    pres, tmpc, dwpc = define_parcels(prof, flag, env_tmpc, env_dwpc)
+    lifted = lift_parcels(prof, pres, tmpc, dwpc, env_tmpc, env_dwpc)
+
+    sweep = {}
+    for name in SWEEP_PARAMS:
+        values = ma.masked_all(ok.shape)
+        values[ok] = lifted[name]
+        sweep[name] = values.reshape(sfc_tmpc.shape)
+    return sweep
@@ -0,0 +1,153 @@
+''' Statistics over the Members of an Ensemble (e.g. the SREF) '''
+from __future__ import division
+import warnings
+import numpy as np
+import numpy.ma as ma
+from sharppy.sharptab import utils, profile, batch, uncertainty
+from sharppy.sharptab.timeseries import _basic_profile, _stack, _interp_rows
+
+__all__ = ['ENSEMBLE_PARAMS', 'STATS', 'HGHTS', 'stack_members', 'EnsembleStats']
+
+## The parameters with member distributions
+ENSEMBLE_PARAMS = ['sbcape', 'sbcinh', 'sblcl', 'mlcape', 'mlcinh', 'mllcl', 'shr06']
+
+## The statistics computed at each level
+STATS = ['mean', 'median', 'spread', 'min', 'max', 'p10', 'p90']
+
+## The heights (m AGL) of the wind statistics (for the hodograph)
+HGHTS = np.arange(0., 12001., 250.)
+
+
+def stack_members(profs, dp=10.):
+    '''
+    Interpolate the members of an ensemble to a common pressure grid, all at
+    once. The grid goes from the lowest surface pressure of the members up
+    to the lowest top of the members in dp steps, so every member covers the
+    whole grid.
+
+    Parameters
+    ----------
+    profs : list of Profile objects
+        The members (of any type)
+    dp : number (optional; default = 10)
+        The pressure spacing (hPa) of the grid
+
+    Returns
+    -------
+    pres : numpy array
+        The pressure grid (hPa)
+    fields : dictionary
+        Field name ('tmpc', 'dwpc', 'hght', 'u', 'v') to a 2D float array with
+        shape (len(profs), len(pres)), with NaN where a member has no data
+
+    '''
+    profs = [ _basic_profile(prof) for prof in profs ]
+    pres = _stack([ prof.pres for prof in profs ])
+    tmpc = _stack([ prof.tmpc for prof in profs ])
+    sfc_pres = min( prof.pres[prof.sfc] for prof in profs )
+    top_pres = np.nanmin(np.where(np.isfinite(tmpc), pres, np.nan), axis=1).max()
+    grid = np.arange(sfc_pres, top_pres, -dp)
+
+    ## Interpolate in log10(pressure), which has to increase along the rows
+    logp = -np.log10(pres)
+    fields = {}
+    for name in [ 'tmpc', 'dwpc', 'hght', 'u', 'v' ]:
+        values = _stack([ prof.__dict__[name] for prof in profs ])
+        fields[name] = _interp_rows(logp, values, -np.log10(grid))
+    return grid, fields
+
+
+def _statistics(values):
+    # The statistics (see STATS) over the members (the first axis), leaving out
+    #   the missing members at each level.
+    with warnings.catch_warnings():
+        ## Levels where every member is missing just come out NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        stats = {
+            'mean':np.nanmean(values, axis=0),
+            'median':np.nanmedian(values, axis=0),
+            'spread':np.nanstd(values, axis=0),
+            'min':np.nanmin(values, axis=0),
+            'max':np.nanmax(values, axis=0),
+            'p10':np.nanpercentile(values, 10, axis=0),
+            'p90':np.nanpercentile(values, 90, axis=0),
+        }
+    return dict( (name, ma.masked_invalid(stat)) for name, stat in stats.iteritems() )
+
+
+class EnsembleStats(object):
+    '''
+    Statistics over the members of an ensemble at one time. All the members
+    are put on a common pressure grid (see stack_members()), and everything
+    is computed with array operations over the members. The members'
+    parcels are all lifted together on the grid (see
+    sharppy.sharptab.batch), so their parameters can differ a little from
+    the ones for each member's own profile.
+
+    Attributes:
+
+    pres : numpy array of the common pressure grid (hPa)
+    tmpc, dwpc : dictionaries of statistic name (see STATS) to a masked
+        array on the pressure grid
+    hghts : numpy array of the wind heights (m AGL)
+    u, v : dictionaries of statistic name to a masked array on the wind
+        heights (kts)
+    members : dictionary of parameter name (see ENSEMBLE_PARAMS) to a masked
+        array with one value per member
+    percentiles : dictionary of parameter name to a masked array of the
+        percentiles in sharppy.sharptab.uncertainty.PERCENTILES
+
+    '''
+    def __init__(self, profs, dp=10., hghts=HGHTS):
+        '''
+        Parameters
+        ----------
+        profs : list of Profile objects
+            The members (of any type; not including the ensemble mean)
+        dp : number (optional; default = 10)
+            The pressure spacing (hPa) of the common grid
+        hghts : array_like (optional)
+            The heights (m AGL) of the wind statistics
+        '''
+        profs = [ _basic_profile(prof) for prof in profs ]
+        self.pres, fields = stack_members(profs, dp)
+        self.hghts = np.asarray(hghts, dtype=float)
+
+        self.tmpc = _statistics(fields['tmpc'])
+        self.dwpc = _statistics(fields['dwpc'])
+
+        ## The winds on a common height grid (above each member's own
+        ## surface), for the hodograph
+        sfc_hght = np.array([ prof.hght[prof.sfc] for prof in profs ], dtype=float)
+        agl = _stack([ prof.hght for prof in profs ]) - sfc_hght[:, np.newaxis]
+        u = _stack([ prof.u for prof in profs ])
+        v = _stack([ prof.v for prof in profs ])
+        self.u = _statistics(_interp_rows(agl, u, self.hghts))
+        self.v = _statistics(_interp_rows(agl, v, self.hghts))
+
+        self.members = self._parameters(fields)
+
+        ## 0-6 km bulk shear (kts)
+        u = _interp_rows(agl, u, np.array([ 0., 6000. ]))
+        v = _interp_rows(agl, v, np.array([ 0., 6000. ]))
+        self.members['shr06'] = ma.masked_invalid(utils.mag(u[:, 1] - u[:, 0], v[:, 1] - v[:, 0]))
+
+        self.percentiles = uncertainty.percentiles(self.members)
+
+    def _parameters(self, fields):
+        # Lift all the members' parcels together on the common grid, through a
+        #   profile of the ensemble mean (which supplies the pressure levels).
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = dict( (name, ma.masked_invalid(np.nanmean(fields[name], axis=0))) for name in fields )
+        grid_prof = profile.create_profile(profile='default', pres=self.pres, hght=mean['hght'],
+            tmpc=mean['tmpc'], dwpc=mean['dwpc'], u=mean['u'], v=mean['v'])
+
+        members = {}
+        for pcl_name, flag in [ ('sb', 1), ('ml', 4) ]:
+            pres, tmpc, dwpc = batch.define_parcels(grid_prof, flag, fields['tmpc'], fields['dwpc'])
+            lifted = batch.lift_parcels(grid_prof, pres, tmpc, dwpc, fields['tmpc'], fields['dwpc'], fields['hght'])
+            members[pcl_name + 'cape'] = lifted['bplus']
+            members[pcl_name + 'cinh'] = lifted['bminus']
+            members[pcl_name + 'lcl'] = lifted['lclhght']
+        return members
@@ -6,17 +6,31 @@ from sharppy.sharptab import interp, utils, thermo, winds
 from sharppy.sharptab.constants import *
 
 
-__all__ = ['DefineParcel', 'Parcel', 'inferred_temp_advection']
+__all__ = ['DefineParcel', 'Parcel', 'CapeParcel', 'inferred_temp_advection']
 __all__ += ['k_index', 't_totals', 'c_totals', 'v_totals', 'precip_water']
 __all__ += ['temp_lvl', 'max_temp', 'mean_mixratio', 'mean_theta', 'mean_thetae', 'mean_relh']
 __all__ += ['lapse_rate', 'most_unstable_level', 'parcelx', 'bulk_rich']
 __all__ += ['bunkers_storm_motion', 'effective_inflow_layer']
 __all__ += ['convective_temp', 'esp', 'pbl_top', 'precip_eff', 'dcape', 'sig_severe']
 __all__ += ['dgz', 'ship', 'stp_cin', 'stp_fixed', 'scp', 'mmp', 'wndg', 'sherb', 'tei', 'cape']
-__all__ += ['mburst', 'dcp', 'ehi', 'sweat', 'hgz', 'lhp']
+__all__ += ['mburst', 'dcp', 'ehi', 'sweat', 'hgz', 'lhp', 'sequence_guess']
 
 
-class DefineParcel(object):
+class _Slots(object):
+    # Pickling (and copying) for the parcel classes, which keep their attributes
+    #   in __slots__ instead of a per-instance __dict__, since the parcel searches
+    #   make a lot of them. Attributes that were never set are left out.
+    __slots__ = ()
+
+    def __getstate__(self):
+        return dict( (name, getattr(self, name)) for name in self.__slots__ if hasattr(self, name) )
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+
+class DefineParcel(_Slots):
     '''
         Create a parcel from a supplied profile object.
         
@@ -46,6 +60,9 @@ class DefineParcel(object):
         pres : number (default = 400 hPa)
         Depth over which to look for the the most unstable parcel
         starting from the surface pressure
+        guess : number (default = None)
+        Pressure of the most unstable parcel at the previous time in a
+        sequence (see most_unstable_level)
         Parcel (flag) == 4: Mixed Layer Parcel
         pres : number (default = 100 hPa)
         Depth over which to mix the surface parcel
@@ -65,6 +82,8 @@ class DefineParcel(object):
         considered as part of the inflow layer
         
         '''
+    __slots__ = ('flag', 'presval', 'desc', 'pres', 'tmpc', 'dwpc', 'pbot', 'ptop')
+
     def __init__(self, prof, flag, **kwargs):
         self.flag = flag
         if flag == 1:
@@ -123,7 +142,7 @@ class DefineParcel(object):
         self.desc = 'Most Unstable Parcel in Lowest %.2f hPa' % self.presval
         pbot = prof.pres[prof.sfc]
         ptop = pbot - self.presval
-        self.pres = most_unstable_level(prof, pbot=pbot, ptop=ptop)
+        self.pres = most_unstable_level(prof, pbot=pbot, ptop=ptop, guess=kwargs.get('guess', None))
         self.tmpc = interp.temp(prof, self.pres)
         self.dwpc = interp.dwpt(prof, self.pres)
     
@@ -183,7 +202,7 @@ class DefineParcel(object):
         else: self.pbot = ma.masked
 
 
-class Parcel(object):
+class Parcel(_Slots):
     '''
         Initialize the parcel variables
         
@@ -200,7 +219,16 @@ class Parcel(object):
         dwpc : number
         Dew Point of the parcel to lift (C)
         
+        Only the attributes below (and lplvals, pbot, and ptop) can be set.
+        
         '''
+    __slots__ = ('pres', 'tmpc', 'dwpc', 'ptrace', 'ttrace', 'blayer', 'tlayer', 'entrain',
+        'lclpres', 'lclhght', 'lfcpres', 'lfchght', 'elpres', 'elhght', 'mplpres', 'mplhght',
+        'bplus', 'bminus', 'bfzl', 'b3km', 'b6km', 'p0c', 'pm10c', 'pm20c', 'pm30c',
+        'hght0c', 'hghtm10c', 'hghtm20c', 'hghtm30c', 'wm10c', 'wm20c', 'wm30c', 'li5', 'li3',
+        'brnshear', 'brnu', 'brnv', 'brn', 'limax', 'limaxpres', 'cap', 'cappres', 'bmin',
+        'bminpres', 'lplvals', 'pbot', 'ptop')
+
     def __init__(self, **kwargs):
         self.pres = ma.masked # Parcel beginning pressure (mb)
         self.tmpc = ma.masked # Parcel beginning temperature (C)
@@ -248,6 +276,34 @@ class Parcel(object):
         self.bminpres = ma.masked # Buoyancy minimum pressure (mb)
         for kw in kwargs: setattr(self, kw, kwargs.get(kw))
 
+
+class CapeParcel(_Slots):
+    '''
+        The result of cape(): just the starting point of the parcel and its
+        CAPE and CINH, for the searches that lift a lot of parcels and only
+        look at those.
+
+        Parameters
+        ----------
+        pbot : number
+        Lower-bound (pressure; hPa) that the parcel is lifted
+        ptop : number
+        Upper-bound (pressure; hPa) that the parcel is lifted
+
+        '''
+    __slots__ = ('pres', 'tmpc', 'dwpc', 'blayer', 'tlayer', 'bplus', 'bminus', 'lplvals',
+        'pbot', 'ptop')
+
+    def __init__(self, **kwargs):
+        self.pres = ma.masked # Parcel beginning pressure (mb)
+        self.tmpc = ma.masked # Parcel beginning temperature (C)
+        self.dwpc = ma.masked # Parcel beginning dewpoint (C)
+        self.blayer = ma.masked # Pressure of the bottom of the layer the parcel is lifted (mb)
+        self.tlayer = ma.masked # Pressure of the top of the layer the parcel is lifted (mb)
+        self.bplus = ma.masked # Parcel CAPE (J/kg)
+        self.bminus = ma.masked # Parcel CIN (J/kg)
+        for kw in kwargs: setattr(self, kw, kwargs.get(kw))
+
 def hgz(prof):
     '''
         Hail Growth Zone Levels
@@ -1126,9 +1182,16 @@ def lapse_rate(prof, lower, upper, pres=True):
     return (tv2 - tv1) / (z2 - z1) * -1000.
 
 
-def most_unstable_level(prof, pbot=None, ptop=None, dp=-1, exact=False):
+def most_unstable_level(prof, pbot=None, ptop=None, dp=-1, exact=False, guess=None):
     '''
         Finds the most unstable level between the lower and upper levels.
+
+        If a guess is given (the most unstable level at the previous time in
+        a sequence, e.g. the previous hour of a model run), only the levels
+        within 50 hPa of it are searched. The guess is accepted if the
+        maximum is inside that window and none of the data levels outside
+        it come within 1 C (wet-bulb potential temperature) of it;
+        otherwise, the whole layer is searched.
         
         Parameters
         ----------
@@ -1143,6 +1206,9 @@ def most_unstable_level(prof, pbot=None, ptop=None, dp=-1, exact=False):
         exact : bool (optional; default = False)
         Switch to choose between using the exact data (slower) or using
         interpolated sounding at 'dp' pressure levels (faster)
+        guess : number (optional; default = None)
+        Pressure of the most unstable level at the previous time in a
+        sequence (hPa). Not used if exact is True.
         
         Returns
         -------
@@ -1153,6 +1219,10 @@ def most_unstable_level(prof, pbot=None, ptop=None, dp=-1, exact=False):
     if not ptop: ptop = prof.pres[prof.sfc] - 400
     if not utils.QC(interp.temp(prof, pbot)): pbot = prof.pres[prof.sfc]
     if not utils.QC(interp.temp(prof, ptop)): return ma.masked
+    if not exact and utils.QC(guess) and ptop <= guess <= pbot:
+        mu_pres = _mu_level_guess(prof, pbot, ptop, guess)
+        if mu_pres is not None:
+            return mu_pres
     if exact:
         ind1 = np.where(pbot > prof.pres)[0].min()
         ind2 = np.where(ptop < prof.pres)[0].max()
@@ -1177,6 +1247,31 @@ def most_unstable_level(prof, pbot=None, ptop=None, dp=-1, exact=False):
     ind = np.where(np.fabs(mt - np.nanmax(mt)) < TOL)[0]
     return p[ind[0]]
 
+def _mu_level_guess(prof, pbot, ptop, guess, window=50., margin=1.):
+    # Search for the most unstable level within window hPa of a guess. Returns
+    #   None if the guess can't be trusted.
+    p = np.arange(pbot, ptop-1, -1, dtype=type(pbot))
+    p = p[np.fabs(p - guess) <= window]
+    t = interp.temp(prof, p)
+    d = interp.dwpt(prof, p)
+    p2, t2 = thermo.drylift(p, t, d)
+    mt = thermo.wetlift(p2, t2, 1000.)
+    ind = np.where(np.fabs(mt - np.nanmax(mt)) < TOL)[0]
+
+    # The maximum has to be inside the window (or at the end of the layer)
+    if (ind[0] == 0 and p[0] < pbot) or (ind[-1] == len(p) - 1 and p[-1] > ptop):
+        return None
+
+    # None of the data levels outside the window can be close
+    outside = (prof.pres <= pbot) & (prof.pres >= ptop) & ((prof.pres > p[0]) | (prof.pres < p[-1])) & \
+        ~prof.tmpc.mask & ~prof.dwpc.mask
+    outside = ma.filled(outside, False)
+    if outside.any():
+        p2, t2 = thermo.drylift(prof.pres[outside].data, prof.tmpc[outside].data, prof.dwpc[outside].data)
+        if np.nanmax(thermo.wetlift(p2, t2, 1000.)) > np.nanmax(mt) - margin:
+            return None
+    return p[ind[0]]
+
 def parcelTraj(prof, parcel, smu=None, smv=None):
     '''
         Parcel Trajectory Routine (Storm Slinky)
@@ -1321,13 +1416,15 @@ def cape(prof, pbot=None, ptop=None, dp=-1, **kwargs):
         
         Returns
         -------
-        pcl : parcel object
-        Parcel Object
+        pcl : CapeParcel object
+        The parcel's starting point, CAPE, and CINH
     
     '''
     flag = kwargs.get('flag', 5)
-    pcl = Parcel(pbot=pbot, ptop=ptop)
-    pcl.lplvals = kwargs.get('lplvals', DefineParcel(prof, flag))
+    pcl = CapeParcel(pbot=pbot, ptop=ptop)
+    pcl.lplvals = kwargs.get('lplvals', None)
+    if pcl.lplvals is None:
+        pcl.lplvals = DefineParcel(prof, flag)
     if prof.pres.compressed().shape[0] < 1: return pcl
     
     # Variables
@@ -1503,7 +1600,9 @@ def parcelx(prof, pbot=None, ptop=None, dp=-1, **kwargs):
         '''
     flag = kwargs.get('flag', 5)
     pcl = Parcel(pbot=pbot, ptop=ptop)
-    pcl.lplvals = kwargs.get('lplvals', DefineParcel(prof, flag))
+    pcl.lplvals = kwargs.get('lplvals', None)
+    if pcl.lplvals is None:
+        pcl.lplvals = DefineParcel(prof, flag)
     if prof.pres.compressed().shape[0] < 1: return pcl
     
     # Variables
@@ -1543,8 +1642,7 @@ def parcelx(prof, pbot=None, ptop=None, dp=-1, **kwargs):
     pe1 = pbot
     h1 = interp.hght(prof, pe1)
     tp1 = thermo.virtemp(pres, tmpc, dwpc)
-    ttrace = [tp1]
-    ptrace = [pe1]
+    lpl_trace = (pe1, tp1)
     
     # Lift parcel and return LCL pres (hPa) and LCL temp (C)
     pe2, tp2 = thermo.drylift(pres, tmpc, dwpc)
@@ -1554,8 +1652,7 @@ def parcelx(prof, pbot=None, ptop=None, dp=-1, **kwargs):
     pcl.lclpres = min(pe2, prof.pres[prof.sfc]) # Make sure the LCL pressure is
                                                 # never below the surface
     pcl.lclhght = interp.to_agl(prof, h2)
-    ptrace.append(pe2)
-    ttrace.append(thermo.virtemp(pe2, tp2, tp2))
+    lcl_trace = (pe2, thermo.virtemp(pe2, tp2, tp2))
     
     # Calculate lifted parcel theta for use in iterative CINH loop below
     # RECALL: lifted parcel theta is CONSTANT from LPL to LCL
@@ -1621,9 +1718,16 @@ def parcelx(prof, pbot=None, ptop=None, dp=-1, **kwargs):
 
 
     iter_ranges = np.arange(lptr, prof.pres.shape[0])
-    ttraces = ma.zeros(len(iter_ranges))
-    ptraces = ma.zeros(len(iter_ranges))
-    ttraces[:] = ptraces[:] = ma.masked
+
+    # The parcel trace goes in preallocated arrays: the LPL and the LCL, then
+    # a point at each level of the moist ascent (NaN, and masked at the end,
+    # where a level is skipped)
+    ptrace = np.empty(len(iter_ranges) + 2)
+    ttrace = np.empty(len(iter_ranges) + 2)
+    ptrace.fill(np.nan)
+    ttrace.fill(np.nan)
+    ptrace[:2] = ma.filled(ma.array([ lpl_trace[0], lcl_trace[0] ], dtype=float), np.nan)
+    ttrace[:2] = ma.filled(ma.array([ lpl_trace[1], lcl_trace[1] ], dtype=float), np.nan)
 
     for i in iter_ranges:
         if not utils.QC(prof.tmpc[i]): continue
@@ -1635,8 +1739,8 @@ def parcelx(prof, pbot=None, ptop=None, dp=-1, **kwargs):
         tdef1 = (thermo.virtemp(pe1, tp1, tp1) - te1) / thermo.ctok(te1)
         tdef2 = (thermo.virtemp(pe2, tp2, tp2) - te2) / thermo.ctok(te2)
 
-        ptraces[i-iter_ranges[0]] = pe2
-        ttraces[i-iter_ranges[0]] = thermo.virtemp(pe2, tp2, tp2)
+        ptrace[i - lptr + 2] = pe2
+        ttrace[i - lptr + 2] = thermo.virtemp(pe2, tp2, tp2)
         lyrlast = lyre
         lyre = G * (tdef1 + tdef2) / 2. * (h2 - h1)
 
@@ -1908,8 +2012,8 @@ def parcelx(prof, pbot=None, ptop=None, dp=-1, **kwargs):
     
     # Save params
     if np.floor(pcl.bplus) == 0: pcl.bminus = 0.
-    pcl.ptrace = ma.concatenate((ptrace, ptraces))
-    pcl.ttrace = ma.concatenate((ttrace, ttraces))
+    pcl.ptrace = ma.masked_invalid(ptrace)
+    pcl.ttrace = ma.masked_invalid(ttrace)
 
     # Find minimum buoyancy from Trier et al. 2014, Part 1
     idx = np.ma.where(pcl.ptrace >= 500.)[0]
@@ -2127,6 +2231,14 @@ def convective_temp(prof, **kwargs):
         Temperature of parcel to lift (C)
         dwpc : number (optional)
         Dew Point of parcel to lift (C)
+        guess : number (optional)
+        The convective temperature at the previous time in a sequence (C).
+        The search starts near there instead of at the surface temperature,
+        on the same 2 C and 0.5 C steps as the full search, and checks the
+        steps on either side of where it would change step and stop. This
+        assumes the CINH doesn't grow as the parcel is heated. If those
+        steps aren't found within a few steps of the guess, the full search
+        is done.
         
         Returns
         -------
@@ -2145,6 +2257,13 @@ def convective_temp(prof, **kwargs):
     if pcl.bplus == 0. or pcl.bminus < mincinh: return ma.masked
     excess = dwpc - tmpc
     if excess > 0: tmpc = tmpc + excess + 4.
+
+    guess = kwargs.get('guess', None)
+    if guess is not None and utils.QC(guess):
+        convt = _convective_temp_guess(prof, pres, tmpc, dwpc, mincinh, guess)
+        if convt is not None:
+            return convt
+
     pcl = cape(prof, flag=5, pres=pres, tmpc=tmpc, dwpc=dwpc)
     if pcl.bplus == 0.: pcl.bminus = ma.masked
     while pcl.bminus < mincinh:
@@ -2154,6 +2273,78 @@ def convective_temp(prof, **kwargs):
         if pcl.bplus == 0.: pcl.bminus = ma.masked
     return tmpc
 
+def _convective_temp_guess(prof, pres, tmin, dwpc, mincinh, guess, max_steps=4):
+    # Find where the search in convective_temp() stops, starting near a guess
+    #   rather than at tmin. Returns None if it isn't within max_steps steps.
+    lifts = {}
+    def cinh(tmpc):
+        if tmpc not in lifts:
+            pcl = cape(prof, flag=5, pres=pres, tmpc=tmpc, dwpc=dwpc)
+            lifts[tmpc] = ma.masked if pcl.bplus == 0. else pcl.bminus
+        return lifts[tmpc]
+    def capped(tmpc):
+        # Whether the full search keeps heating the parcel past tmpc
+        bminus = cinh(tmpc)
+        return bminus is not ma.masked and bminus < mincinh
+    def heat(tmpc, dt, n):
+        # Add the steps one at a time like the full search, so the sums match
+        for i in xrange(n): tmpc += dt
+        return tmpc
+
+    # The full search takes 2 C steps while the CINH is below -100 ...
+    k = max(int(np.floor((guess - tmin) / 2.)), 0)
+    k = _walk_steps(lambda n: capped(heat(tmin, 2., n)) and cinh(heat(tmin, 2., n)) < -100, k, max_steps)
+    if k is None:
+        return None
+    tmpc = heat(tmin, 2., k)
+
+    # ... and then 0.5 C steps until it isn't capped.
+    m = max(int(round((guess - tmpc) / 0.5)), 0)
+    m = _walk_steps(lambda n: capped(heat(tmpc, 0.5, n)), m, max_steps)
+    if m is None:
+        return None
+    if m > 0 and cinh(heat(tmpc, 0.5, m - 1)) < -100:
+        return None
+    return heat(tmpc, 0.5, m)
+
+def _walk_steps(searching, n, max_steps):
+    # Walk from step n to the first step where searching(n) is False, checking
+    #   that it's True for the step before. Returns None if it isn't within
+    #   max_steps steps.
+    for step in xrange(max_steps):
+        if searching(n):
+            n += 1
+        elif n > 0 and not searching(n - 1):
+            n -= 1
+        else:
+            return n
+    return None
+
+def sequence_guess(prof):
+    '''
+        Get the results of the searches in a ConvectiveProfile, for use as the
+        initial guesses at the next time in a sequence (e.g. the next hour of a
+        model run). Consecutive hours are usually similar enough that the
+        searches only have to look near the previous results.
+
+        Parameters
+        ----------
+        prof : ConvectiveProfile object
+
+        Returns
+        -------
+        A dictionary with the most unstable parcel pressure ('mupres'; hPa)
+        and the convective temperature ('convt'; C), for the guess keyword
+        of ConvectiveProfile
+
+        '''
+    guess = {
+        'mupres':prof.mupcl.lplvals.pres,
+    }
+    if hasattr(prof, 'convT'):
+        guess['convt'] = thermo.ftoc(prof.convT)
+    return guess
+
 def tei(prof):
     '''
         Theta-E Index (TEI)
@@ -2,11 +2,13 @@
 from __future__ import division
 import numpy as np
 import numpy.ma as ma
-from sharppy.sharptab import utils, winds, params, interp, thermo, watch_type, fire
+import hashlib
+from sharppy.sharptab import utils, winds, params, interp, thermo, watch_type, fire, uncertainty, records
 import sharppy.io.qc_tools as qc_tools
 from sharppy.databases.sars import hail, supercell
 from sharppy.databases.pwv import pwv_climo
 from sharppy.sharptab.constants import MISSING
+from sharppy.version import __version__ as sharppy_version
 
 def create_profile(**kwargs):
     '''
@@ -102,20 +104,25 @@ class Profile(object):
         self.tmpc = ma.asanyarray(kwargs.get('tmpc'), dtype=float)
         self.dwpc = ma.asanyarray(kwargs.get('dwpc'), dtype=float)
 
+        ## the form the winds were given in (if they were given at all)
+        self._wind_input = ()
+        self.wdir = None
+        self.wspd = None
+        self.u = None
+        self.v = None
+
         if 'wdir' in kwargs:
             self.wdir = ma.asanyarray(kwargs.get('wdir'), dtype=float)
             self.wspd = ma.asanyarray(kwargs.get('wspd'), dtype=float)
 
-            self.u = None
-            self.v = None
+            self._wind_input = ('wdir', 'wspd')
 
         ## did the user provide the wind in u,v form?
         elif 'u' in kwargs:
             self.u = ma.asanyarray(kwargs.get('u'), dtype=float)
             self.v = ma.asanyarray(kwargs.get('v'), dtype=float)
 
-            self.wdir = None
-            self.wspd = None
+            self._wind_input = ('u', 'v')
 
         ## check if any standard deviation data was supplied
         if 'tmp_stdev' in kwargs:
@@ -134,6 +141,56 @@ class Profile(object):
         ## optional keyword argument for location
         self.location = kwargs.get('location', None)
  
+    def fingerprint(self):
+        '''
+        Compute a stable fingerprint of the data in this profile. Two
+        profiles built from the same data at the same location with the
+        same version of SHARPpy have the same fingerprint, regardless of
+        which Profile class they are.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        A hexadecimal SHA-1 digest (string)
+        '''
+        fields = [ 'pres', 'hght', 'tmpc', 'dwpc' ] + list(self._wind_input) + [ 'omeg' ]
+
+        digest = hashlib.sha1()
+        digest.update(sharppy_version)
+        digest.update(str(self.location))
+        for field in fields:
+            data = self.__dict__[field]
+            ## An entirely missing field (e.g. the omega BasicProfile fills
+            ## in) hashes the same as one that was never given.
+            if data is None:
+                continue
+            data = ma.asanyarray(data, dtype=float).filled(self.missing)
+            if (data == self.missing).all():
+                continue
+            digest.update(field)
+            digest.update(np.ascontiguousarray(data, dtype='<f8').tostring())
+        return digest.hexdigest()
+
+    def inputFields(self):
+        '''
+        Get the data this profile was built from, for building another
+        profile from the same data (e.g. a BasicProfile from a raw one).
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        A dictionary of keyword arguments for the Profile constructors,
+        with the winds in the form they were given in (if any)
+        '''
+        fields = [ 'pres', 'hght', 'tmpc', 'dwpc', 'omeg', 'location' ] + list(self._wind_input)
+        return dict( (k, getattr(self, k)) for k in fields )
+
     @classmethod
     def copy(cls, prof, **kwargs):
         new_kwargs = dict( (k, prof.__dict__[k]) for k in [ 'pres', 'hght', 'tmpc', 'dwpc', 'omeg', 'location' ])
@@ -142,6 +199,9 @@ class Profile(object):
         else:   
             new_kwargs.update({'wspd':prof.wspd, 'wdir':prof.wdir})
 
+        if prof.tmp_stdev is not None:
+            new_kwargs.update({'tmp_stdev':prof.tmp_stdev, 'dew_stdev':prof.dew_stdev})
+
         new_kwargs.update(kwargs)
         return cls(**new_kwargs)
 
@@ -428,6 +488,11 @@ class ConvectiveProfile(BasicProfile):
 
         omeg : array_like
         List of the vertical velocity in pressure coordinates with height (Pascals/second)
+
+        guess : dictionary (default: None)
+        Initial guesses for the most unstable parcel and convective
+        temperature searches from the previous time in a sequence (see
+        sharppy.sharptab.params.sequence_guess)
             
         Returns
         -------
@@ -436,6 +501,9 @@ class ConvectiveProfile(BasicProfile):
         ## call the constructor for Profile
         super(ConvectiveProfile, self).__init__(**kwargs)
 
+        ## warm-start the searches from the previous time, if given
+        self.guess = kwargs.get('guess', None) or {}
+
         # Generate the fire weather paramters
         self.get_fire()
 
@@ -454,6 +522,10 @@ class ConvectiveProfile(BasicProfile):
         ## get SCP, STP(cin), STP(fixed), SHIP
         self.get_severe()
 
+        ## get the uncertainty in the parameters from the temperature and
+        ## dewpoint standard deviations
+        self.get_uncertainty()
+
         ## calculate the SARS database matches
         self.get_sars()
 
@@ -569,7 +641,8 @@ class ConvectiveProfile(BasicProfile):
         None
         '''
 
-        self.mupcl = params.parcelx( self, flag=3 )
+        mulplvals = params.DefineParcel(self, flag=3, guess=self.guess.get('mupres', None))
+        self.mupcl = params.parcelx( self, flag=3, lplvals=mulplvals )
         if self.mupcl.lplvals.pres == self.pres[self.sfc]:
             self.sfcpcl = self.mupcl
         else:
@@ -726,7 +799,7 @@ class ConvectiveProfile(BasicProfile):
         ## 700-500mb lapse rate
         self.lapserate_700_500 = params.lapse_rate( self, 700., 500., pres=True )
         ## convective temperature
-        self.convT = thermo.ctof( params.convective_temp( self ) )
+        self.convT = thermo.ctof( params.convective_temp( self, guess=self.guess.get('convt', None) ) )
         ## sounding forecast surface temperature
         self.maxT = thermo.ctof( params.max_temp( self ) )
         #fzl = str(int(self.sfcparcel.hght0c))
@@ -900,3 +973,41 @@ class ConvectiveProfile(BasicProfile):
         self.sig_severe = params.sig_severe(self)
         self.dcape, self.dpcl_ttrace, self.dpcl_ptrace = params.dcape(self)
         self.drush = thermo.ctof(self.dpcl_ttrace[-1])
+
+    def get_uncertainty(self):
+        '''
+        Function to get the percentiles of the surface-based and mixed-layer
+        parcel parameters and STP over a set of profiles perturbed by the
+        temperature and dewpoint standard deviations (see
+        sharppy.sharptab.uncertainty). Set to None if the profile has no
+        standard deviations.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        '''
+        if self.tmp_stdev is None or self.dew_stdev is None:
+            self.uncertainty = None
+        else:
+            self.uncertainty = uncertainty.percentiles(uncertainty.distributions(self))
+
+    def to_record(self):
+        '''
+        Function to pull the scalar indices out into a compact, typed record
+        for batch jobs and caches (see sharppy.sharptab.records). The record
+        can be turned back into an object with the same index attributes
+        with sharppy.sharptab.records.ProfileRecord.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        A numpy.void record with dtype sharppy.sharptab.records.RECORD_DTYPE
+        '''
+        return records.to_record(self)
@@ -0,0 +1,156 @@
+''' Compact Records of the Indices of a ConvectiveProfile '''
+from __future__ import division
+import numpy as np
+import numpy.ma as ma
+from sharppy.sharptab import params
+from sharppy.sharptab.constants import MISSING
+
+__all__ = ['RECORD_VERSION', 'RECORD_DTYPE', 'to_record', 'ProfileRecord']
+
+## The version of the record layout below. Changing any of the lists changes
+## the layout, so bump this when doing so.
+RECORD_VERSION = 1
+
+## The parcels in a record, and the values kept for each one (as fields named
+## e.g. 'mupcl_bplus')
+PARCELS = ['sfcpcl', 'fcstpcl', 'mlpcl', 'mupcl', 'effpcl']
+PARCEL_ATTRS = ['pres', 'tmpc', 'dwpc', 'lclpres', 'lclhght', 'lfcpres', 'lfchght', 'elpres',
+    'elhght', 'mplpres', 'mplhght', 'bplus', 'bminus', 'bfzl', 'b3km', 'b6km', 'p0c', 'pm10c',
+    'pm20c', 'pm30c', 'hght0c', 'hghtm10c', 'hghtm20c', 'hghtm30c', 'wm10c', 'wm20c', 'wm30c',
+    'li5', 'li3', 'brnshear', 'brn', 'limax', 'limaxpres', 'cap', 'cappres', 'bmin', 'bminpres']
+
+## The single values of the profile
+SCALARS = ['ebottom', 'etop', 'ebotm', 'etopm', 'ebwspd', 'critical_angle', 'k_idx', 'pwat',
+    'lapserate_3km', 'lapserate_3_6km', 'lapserate_850_500', 'lapserate_700_500', 'convT', 'maxT',
+    'mean_mixr', 'low_rh', 'mid_rh', 'totals_totals', 'stp_fixed', 'stp_cin', 'right_scp',
+    'left_scp', 'ship', 'tei', 'esp', 'mmp', 'wndg', 'sig_severe', 'dcape', 'drush',
+    'updraft_tilt', 'fosberg', 'ppbl_top', 'sfc_rh', 'rh01km', 'pblrh', 'bplus_fire', 'dgz_pbot',
+    'dgz_ptop', 'dgz_meanrh', 'dgz_pw', 'dgz_meanq', 'dgz_meanomeg', 'oprh']
+
+## The short vectors of the profile (wind components, helicities, ...), as
+## (name, length)
+VECTORS = [('srwind', 4), ('upshear_downshear', 4), ('srh1km', 3), ('srh3km', 3),
+    ('right_esrh', 3), ('left_esrh', 3), ('wind1km', 2), ('wind6km', 2), ('sfc_1km_shear', 2),
+    ('sfc_3km_shear', 2), ('sfc_6km_shear', 2), ('sfc_8km_shear', 2), ('sfc_9km_shear', 2),
+    ('lcl_el_shear', 2), ('eff_shear', 2), ('ebwd', 2), ('mean_1km', 2), ('mean_3km', 2),
+    ('mean_6km', 2), ('mean_8km', 2), ('mean_lcl_el', 2), ('mean_eff', 2), ('mean_ebw', 2),
+    ('srw_1km', 2), ('srw_3km', 2), ('srw_6km', 2), ('srw_8km', 2), ('srw_4_5km', 2),
+    ('srw_lcl_el', 2), ('srw_eff', 2), ('srw_ebw', 2), ('srw_0_2km', 2), ('srw_4_6km', 2),
+    ('srw_9_11km', 2), ('meanwind01km', 2), ('meanwindpbl', 2)]
+
+## The strings of the profile, as (name, maximum length)
+STRINGS = [('location', 16), ('fingerprint', 40), ('watch_type', 16), ('watch_type_color', 16),
+    ('precip_type', 32)]
+
+## The values are kept as single precision, which is plenty for the indices
+## and halves the size of a record.
+RECORD_DTYPE = np.dtype([ ('version', '<i2') ] +
+    [ ('%s_%s' % (pcl, attr), '<f4') for pcl in PARCELS for attr in PARCEL_ATTRS ] +
+    [ (name, '<f4') for name in SCALARS ] +
+    [ (name, '<f4', (length,)) for name, length in VECTORS ] +
+    [ (name, 'S%d' % length) for name, length in STRINGS ])
+
+
+def _to_floats(value, length=None):
+    # Convert a value (or the first length values of a sequence) to floats, with
+    #   NaN for masked, missing, and absent values.
+    try:
+        value = ma.filled(ma.asanyarray(value, dtype=float), np.nan)
+    except (TypeError, ValueError):
+        value = np.nan
+    value = np.where(value == MISSING, np.nan, value)
+    if length is None:
+        return value if value.ndim == 0 else np.nan
+
+    value = value.ravel()[:length]
+    return np.concatenate((value, np.nan * np.ones(length - len(value))))
+
+
+def _from_floats(value):
+    # The other direction: NaNs become masked
+    if np.ndim(value) == 0:
+        return ma.masked if np.isnan(value) else float(value)
+    return ma.masked_invalid(np.asarray(value, dtype=float))
+
+
+def to_record(prof):
+    '''
+    Pull the scalar indices out of a ConvectiveProfile into a flat, typed
+    record (see RECORD_DTYPE). A record is about 1.4 kB, and many of them
+    can be put in one NumPy array (e.g. np.array(records,
+    dtype=RECORD_DTYPE)) to keep in memory or save, so batch jobs can keep
+    the records and drop the full profiles. The traces, SARS matches, and
+    the profile data itself aren't kept.
+
+    Parameters
+    ----------
+    prof : ConvectiveProfile object
+
+    Returns
+    -------
+    A numpy.void record. Missing values are NaN (or '' for the strings).
+    '''
+    record = np.zeros(1, dtype=RECORD_DTYPE)[0]
+    record['version'] = RECORD_VERSION
+    for pcl_name in PARCELS:
+        pcl = getattr(prof, pcl_name, None)
+        for attr in PARCEL_ATTRS:
+            record['%s_%s' % (pcl_name, attr)] = _to_floats(getattr(pcl, attr, None))
+
+    for name in SCALARS:
+        record[name] = _to_floats(getattr(prof, name, None))
+    for name, length in VECTORS:
+        record[name] = _to_floats(getattr(prof, name, None), length)
+
+    record['fingerprint'] = prof.fingerprint()
+    for name, length in STRINGS:
+        if name == 'fingerprint':
+            continue
+        value = getattr(prof, name, None)
+        record[name] = '' if value is None or value is ma.masked else str(value)[:length]
+    return record
+
+
+class ProfileRecord(object):
+    '''
+    The indices of a ConvectiveProfile, rehydrated from a record made by
+    to_record(). It has the same attributes as the profile for everything
+    in the record, so code that only reads the indices (e.g. the insets'
+    numbers or sharppy.io.index_store.get_indices) works on either one.
+    The parcels are Parcel objects without their traces, and missing values
+    are masked.
+    '''
+    def __init__(self, record):
+        '''
+        Parameters
+        ----------
+        record : numpy.void
+            A record from to_record() (or an element of an array of them)
+        '''
+        if record['version'] != RECORD_VERSION:
+            raise ValueError("The record has version %d, but this is version %d" %
+                (record['version'], RECORD_VERSION))
+
+        for pcl_name in PARCELS:
+            pcl = params.Parcel()
+            for attr in PARCEL_ATTRS:
+                setattr(pcl, attr, _from_floats(record['%s_%s' % (pcl_name, attr)]))
+            setattr(self, pcl_name, pcl)
+
+        for name in SCALARS:
+            setattr(self, name, _from_floats(record[name]))
+        for name, length in VECTORS:
+            setattr(self, name, _from_floats(record[name]))
+
+        for name, length in STRINGS:
+            if name != 'fingerprint':
+                setattr(self, name, str(record[name]))
+        self.location = self.location or None
+        self._fingerprint = str(record['fingerprint'])
+
+    def fingerprint(self):
+        '''
+        The fingerprint of the profile the record was made from (see
+        Profile.fingerprint()).
+        '''
+        return self._fingerprint
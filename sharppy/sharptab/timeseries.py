@@ -0,0 +1,307 @@
+''' Time-Height Sections and Parameter Time Series for Model Runs '''
+from __future__ import division
+import numpy as np
+import numpy.ma as ma
+import threading
+from sharppy.sharptab import utils, winds, params, interp, thermo, watch_type, profile
+
+__all__ = ['SECTION_FIELDS', 'SERIES_PARAMS', 'time_height', 'headline_params', 'SeriesSnapshot', 'RunSeries']
+
+## The default heights (m AGL) of the time-height sections
+HGHTS = np.arange(0., 12001., 250.)
+
+## The fields in the time-height sections
+SECTION_FIELDS = ['thetae', 'relh', 'omeg', 'u', 'v']
+
+## The headline parameters in the time series
+SERIES_PARAMS = ['mlcape', 'mlcinh', 'mllcl', 'mucape', 'esrh', 'stp_cin', 'scp', 'pwat', 'precip_type']
+
+
+def _basic_profile(prof):
+    '''
+    Get a BasicProfile for a profile of any type (e.g. the raw profiles
+    from a decoder).
+
+    '''
+    if isinstance(prof, profile.BasicProfile):
+        return prof
+    return profile.BasicProfile(**prof.inputFields())
+
+
+def _stack(arrays):
+    '''
+    Stack 1D masked arrays of (possibly) different lengths into a 2D float
+    array, with NaN for masked values and padding.
+
+    '''
+    stacked = np.empty((len(arrays), max(len(a) for a in arrays)))
+    stacked.fill(np.nan)
+    for idx, arr in enumerate(arrays):
+        stacked[idx, :len(arr)] = ma.filled(ma.asanyarray(arr, dtype=float), np.nan)
+    return stacked
+
+
+def _interp_rows(xs, ys, x_new):
+    '''
+    Linearly interpolate every row of a 2D array to the same set of points
+    in one call to np.interp. Each row is shifted by an offset larger than
+    the range of the data, so all the rows can go in as one increasing
+    array. NaN points are left out, and the points outside the range of a
+    row come back as NaN.
+
+    Parameters
+    ----------
+    xs : 2D numpy array
+        The coordinates of the data (increasing along each row)
+    ys : 2D numpy array
+        The data
+    x_new : 1D numpy array
+        The coordinates to interpolate to
+
+    Returns
+    -------
+    A 2D numpy array with shape (xs.shape[0], len(x_new))
+
+    '''
+    good = np.isfinite(xs) & np.isfinite(ys)
+    out = np.empty((xs.shape[0], len(x_new)))
+    out.fill(np.nan)
+    if not good.any():
+        return out
+
+    x_min = min(xs[good].min(), x_new.min())
+    x_max = max(xs[good].max(), x_new.max())
+    offsets = np.arange(xs.shape[0]) * (x_max - x_min + 1.)
+
+    shifted = (xs + offsets[:, np.newaxis])[good]
+    new_shifted = (x_new[np.newaxis, :] + offsets[:, np.newaxis]).ravel()
+    out[:] = np.interp(new_shifted, shifted, ys[good]).reshape(out.shape)
+
+    ## Mask everything outside the data in each row (including rows with
+    ## fewer than two good points)
+    row_min = np.where(good, xs, np.inf).min(axis=1)
+    row_max = np.where(good, xs, -np.inf).max(axis=1)
+    n_good = good.sum(axis=1)
+    outside = (x_new[np.newaxis, :] < row_min[:, np.newaxis]) | (x_new[np.newaxis, :] > row_max[:, np.newaxis]) | \
+        (n_good[:, np.newaxis] < 2)
+    out[outside] = np.nan
+    return out
+
+
+def time_height(profs, hghts=HGHTS):
+    '''
+    Interpolate a set of profiles to a common height grid, all at once.
+
+    Parameters
+    ----------
+    profs : list of Profile objects
+        The profiles (of any type)
+    hghts : array_like (optional)
+        The heights (m AGL) to interpolate to
+
+    Returns
+    -------
+    A dictionary of field name (see SECTION_FIELDS) to a 2D masked array with
+    shape (len(profs), len(hghts)). The fields are theta-e (K), relative
+    humidity (%), omega (the same units as the profiles), and the u and v
+    wind components (kts).
+
+    '''
+    hghts = np.asarray(hghts, dtype=float)
+    profs = [ _basic_profile(prof) for prof in profs ]
+    pres = _stack([ prof.pres for prof in profs ])
+    tmpc = _stack([ prof.tmpc for prof in profs ])
+    dwpc = _stack([ prof.dwpc for prof in profs ])
+    sfc_hght = np.array([ prof.hght[prof.sfc] for prof in profs ], dtype=float)
+    agl = _stack([ prof.hght for prof in profs ]) - sfc_hght[:, np.newaxis]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fields = {
+            'thetae':_stack([ prof.thetae for prof in profs ]),
+            'relh':thermo.relh(pres, tmpc, dwpc),
+            'omeg':_stack([ prof.omeg for prof in profs ]),
+            'u':_stack([ prof.u for prof in profs ]),
+            'v':_stack([ prof.v for prof in profs ]),
+        }
+
+    sections = {}
+    for name in SECTION_FIELDS:
+        sections[name] = ma.masked_invalid(_interp_rows(agl, fields[name], hghts))
+    return sections
+
+
+def headline_params(prof, guess=None):
+    '''
+    Compute the headline parameters for a profile without building a full
+    ConvectiveProfile (no fire, SARS, DCAPE, trajectory, etc.). They are
+    computed the same way as in ConvectiveProfile.
+
+    Parameters
+    ----------
+    prof : Profile object
+        The profile (of any type)
+    guess : dictionary (optional)
+        Initial guesses for the searches from the previous time (see
+        sharppy.sharptab.params.sequence_guess)
+
+    Returns
+    -------
+    A dictionary of parameter name (see SERIES_PARAMS) to value
+
+    '''
+    return _headline_params(prof, guess)[0]
+
+
+def _headline_params(prof, guess=None):
+    # Returns the headline parameters and the guesses for the next time.
+    guess = guess or {}
+    prof = _basic_profile(prof)
+    mulplvals = params.DefineParcel(prof, flag=3, guess=guess.get('mupres', None))
+    mupcl = params.parcelx(prof, flag=3, lplvals=mulplvals)
+    mlpcl = params.parcelx(prof, flag=4)
+
+    ebottom, etop = params.effective_inflow_layer(prof, mupcl=mupcl)
+    if etop is ma.masked or ebottom is ma.masked:
+        esrh = ma.masked
+        stp_cin = 0.0
+        scp = 0.0
+    else:
+        ebotm = interp.to_agl(prof, interp.hght(prof, ebottom))
+        etopm = interp.to_agl(prof, interp.hght(prof, etop))
+        srwind = params.bunkers_storm_motion(prof, mupcl=mupcl, pbot=ebottom)
+        depth = ( mupcl.elhght - ebotm ) / 2
+        elh = interp.pres(prof, interp.to_msl(prof, ebotm + depth))
+        ebwd = winds.wind_shear(prof, pbot=ebottom, ptop=elh)
+        ebwspd = utils.mag( ebwd[0], ebwd[1] )
+        esrh = winds.helicity(prof, ebotm, etopm, stu=srwind[0], stv=srwind[1])[0]
+        scp = params.scp(mupcl.bplus, esrh, utils.KTS2MS(ebwspd))
+        stp_cin = params.stp_cin(mlpcl.bplus, esrh, utils.KTS2MS(ebwspd), mlpcl.lclhght, mlpcl.bminus)
+
+    plevel, phase, tmp, st = watch_type.init_phase(prof)
+    tpos, tneg, ttop, tbot = watch_type.posneg_temperature(prof, start=plevel)
+    precip_type = watch_type.best_guess_precip(prof, phase, plevel, tmp, tpos, tneg)
+
+    next_guess = {'mupres':mulplvals.pres}
+    return {
+        'mlcape':mlpcl.bplus,
+        'mlcinh':mlpcl.bminus,
+        'mllcl':mlpcl.lclhght,
+        'mucape':mupcl.bplus,
+        'esrh':esrh,
+        'stp_cin':stp_cin,
+        'scp':scp,
+        'pwat':params.precip_water(prof),
+        'precip_type':precip_type,
+    }, next_guess
+
+
+class SeriesSnapshot(object):
+    '''
+    The results of a RunSeries as of one update. These don't change when the
+    RunSeries is updated again, so they can be drawn while the next update
+    runs on another thread (see RunSeries.snapshot()). Has the same dates,
+    hghts, sections, and series attributes as the RunSeries.
+
+    '''
+    def __init__(self, dates, hghts, sections, series):
+        self.dates = dates
+        self.hghts = hghts
+        self.sections = sections
+        self.series = series
+
+
+class RunSeries(object):
+    '''
+    Time-height sections and headline parameter time series for all the
+    times in a model run (e.g. a BUFKIT file). The results for each time are
+    kept by profile fingerprint, so when the run is updated with some of the
+    profiles changed (e.g. modified by the user), only those times are
+    recomputed. The most unstable parcel search at each time is
+    warm-started from the time before it.
+
+    After update(), the results are in:
+
+    dates : list of datetime objects
+    hghts : numpy array of the section heights (m AGL)
+    sections : dictionary of field name (see SECTION_FIELDS) to a 2D masked
+        array with shape (len(dates), len(hghts))
+    series : dictionary of parameter name (see SERIES_PARAMS) to a masked
+        array with one value per time (a list of strings for precip_type)
+
+    update() replaces these all at once (it never changes them in place),
+    and snapshot() gets a consistent set of them while another thread may
+    be updating.
+
+    '''
+    def __init__(self, hghts=HGHTS):
+        self.hghts = np.asarray(hghts, dtype=float)
+        self.dates = []
+        self.sections = dict( (name, ma.masked_all((0, len(self.hghts)))) for name in SECTION_FIELDS )
+        self.series = dict( (name, ma.masked_all((0,))) for name in SERIES_PARAMS )
+
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def update(self, profs, dates):
+        '''
+        Compute the sections and time series for a run.
+
+        Parameters
+        ----------
+        profs : list of Profile objects
+            The profile (of any type) at each time
+        dates : list of datetime objects
+            The valid time of each profile
+
+        Returns
+        -------
+        The indexes of the times that had to be computed
+
+        '''
+        with self._lock:
+            fprints = [ prof.fingerprint() for prof in profs ]
+            new_idxs = [ idx for idx, fprint in enumerate(fprints)
+                if fprint not in self._results and fprints.index(fprint) == idx ]
+
+            if len(new_idxs) > 0:
+                new_profs = [ _basic_profile(profs[idx]) for idx in new_idxs ]
+                sections = time_height(new_profs, self.hghts)
+                for row, (idx, prof) in enumerate(zip(new_idxs, new_profs)):
+                    columns = dict( (name, sections[name][row].filled(np.nan)) for name in SECTION_FIELDS )
+                    guess = None
+                    if idx > 0 and fprints[idx - 1] in self._results:
+                        guess = self._results[fprints[idx - 1]][2]
+                    pvals, next_guess = _headline_params(prof, guess)
+                    self._results[fprints[idx]] = (columns, pvals, next_guess)
+
+            ## Only hang on to the times in this run
+            self._results = dict( (fprint, self._results[fprint]) for fprint in fprints )
+
+            results = [ self._results[fprint] for fprint in fprints ]
+            sections = {}
+            for name in SECTION_FIELDS:
+                section = np.array([ result[0][name] for result in results ]).reshape(len(results), len(self.hghts))
+                sections[name] = ma.masked_invalid(section)
+
+            series = {}
+            for name in SERIES_PARAMS:
+                vals = [ result[1][name] for result in results ]
+                if name == 'precip_type':
+                    series[name] = vals
+                else:
+                    series[name] = ma.masked_invalid(np.array([ float(v) if utils.QC(v) else np.nan for v in vals ]))
+
+            self.dates, self.sections, self.series = list(dates), sections, series
+            return new_idxs
+
+    def snapshot(self):
+        '''
+        Get the results of the last update, which won't change when the
+        RunSeries is updated again.
+
+        Returns
+        -------
+        A SeriesSnapshot object
+        '''
+        with self._lock:
+            return SeriesSnapshot(self.dates, self.hghts, self.sections, self.series)
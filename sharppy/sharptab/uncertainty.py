@@ -0,0 +1,154 @@
+''' Monte Carlo Uncertainty in the Parameters from Temperature and Dewpoint Errors '''
+from __future__ import division
+import numpy as np
+import numpy.ma as ma
+from sharppy.sharptab import utils, params, batch
+
+__all__ = ['UNCERTAINTY_PARAMS', 'PERCENTILES', 'perturb', 'distributions', 'percentiles']
+
+## The parameters with uncertainty distributions
+UNCERTAINTY_PARAMS = ['sbcape', 'sbcinh', 'sblcl', 'mlcape', 'mlcinh', 'mllcl', 'stp_cin']
+
+## The default percentiles reported for each parameter
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def _correlated_noise(hght, members, corr_depth, rng):
+    '''
+    Draw standard normal noise that is correlated in the vertical, with a
+    correlation of exp(-dz / corr_depth) between two levels dz meters apart.
+    The noise is built up from the bottom as a first-order autoregressive
+    process in height, so irregular level spacing is handled exactly.
+
+    '''
+    hght = ma.filled(ma.asanyarray(hght, dtype=float), np.nan)
+    dz = np.abs(np.diff(hght))
+    dz[~np.isfinite(dz)] = 0.
+    rho = np.exp(-dz / corr_depth)
+    innov = np.sqrt(1. - rho ** 2)
+
+    noise = rng.standard_normal((members, len(hght)))
+    for lev in xrange(1, len(hght)):
+        noise[:, lev] = rho[lev - 1] * noise[:, lev - 1] + innov[lev - 1] * noise[:, lev]
+    return noise
+
+
+def perturb(prof, members=100, corr_depth=1000., seed=None):
+    '''
+    Draw perturbed temperature and dewpoint profiles from the standard
+    deviations in the profile (tmp_stdev and dew_stdev). The errors are
+    normally distributed and correlated in the vertical (see corr_depth).
+    The temperature and dewpoint errors are drawn independently, and the
+    perturbed dewpoints are capped at the perturbed temperatures. Levels with
+    a missing standard deviation aren't perturbed.
+
+    Parameters
+    ----------
+    prof : profile object
+        Profile object with tmp_stdev and dew_stdev
+    members : int (optional; default = 100)
+        The number of perturbed profiles
+    corr_depth : number (optional; default = 1000)
+        The depth (m) over which the errors decorrelate (the correlation is
+        1/e at this separation)
+    seed : int (optional)
+        The seed for the random numbers, for repeatable draws
+
+    Returns
+    -------
+    tmpc : 2D numpy array
+        The perturbed temperatures (C), with shape (members, levels)
+    dwpc : 2D numpy array
+        The perturbed dewpoints (C), with shape (members, levels)
+
+    '''
+    if prof.tmp_stdev is None or prof.dew_stdev is None:
+        raise ValueError("The profile has no temperature and dewpoint standard deviations")
+
+    rng = np.random.RandomState(seed)
+    tmp_stdev = ma.filled(ma.asanyarray(prof.tmp_stdev, dtype=float), 0.)
+    dew_stdev = ma.filled(ma.asanyarray(prof.dew_stdev, dtype=float), 0.)
+    tmpc = ma.filled(ma.asanyarray(prof.tmpc, dtype=float), np.nan)
+    dwpc = ma.filled(ma.asanyarray(prof.dwpc, dtype=float), np.nan)
+
+    tmpc = tmpc + tmp_stdev * _correlated_noise(prof.hght, members, corr_depth, rng)
+    dwpc = dwpc + dew_stdev * _correlated_noise(prof.hght, members, corr_depth, rng)
+    with np.errstate(invalid='ignore'):
+        dwpc = np.where(dwpc > tmpc, tmpc, dwpc)
+    return tmpc, dwpc
+
+
+def distributions(prof, members=100, corr_depth=1000., seed=0):
+    '''
+    Compute the distributions of the surface-based and mixed-layer parcel
+    parameters and the effective-layer STP over a set of perturbed profiles
+    (see perturb()). All the perturbed parcels are lifted together (see
+    sharppy.sharptab.batch). The winds aren't perturbed, so STP uses the
+    effective SRH and bulk shear of the profile itself.
+
+    Parameters
+    ----------
+    prof : profile object
+        Profile object with tmp_stdev and dew_stdev (a ConvectiveProfile for
+        STP; it's 0 otherwise)
+    members : int (optional; default = 100)
+        The number of perturbed profiles
+    corr_depth : number (optional; default = 1000)
+        The depth (m) over which the errors decorrelate
+    seed : int (optional; default = 0)
+        The seed for the random numbers, so the same profile always gives
+        the same distributions
+
+    Returns
+    -------
+    A dictionary of parameter name (see UNCERTAINTY_PARAMS) to a masked
+    array with one value per perturbed profile
+
+    '''
+    env_tmpc, env_dwpc = perturb(prof, members, corr_depth, seed)
+
+    dists = {}
+    for pcl_name, flag in [ ('sb', 1), ('ml', 4) ]:
+        pres, tmpc, dwpc = batch.define_parcels(prof, flag, env_tmpc, env_dwpc)
+        lifted = batch.lift_parcels(prof, pres, tmpc, dwpc, env_tmpc, env_dwpc)
+        dists[pcl_name + 'cape'] = lifted['bplus']
+        dists[pcl_name + 'cinh'] = lifted['bminus']
+        dists[pcl_name + 'lcl'] = lifted['lclhght']
+
+    esrh = getattr(prof, 'right_esrh', [ ma.masked ])[0]
+    ebwspd = getattr(prof, 'ebwspd', ma.masked)
+    if not utils.QC(esrh) or not utils.QC(ebwspd):
+        dists['stp_cin'] = ma.zeros(members)
+    else:
+        ebwd = utils.KTS2MS(ebwspd)
+        dists['stp_cin'] = ma.masked_invalid([ params.stp_cin(mlcape, esrh, ebwd, mllcl, mlcinh)
+            for mlcape, mllcl, mlcinh in zip(dists['mlcape'], dists['mllcl'], dists['mlcinh']) ])
+    return dists
+
+
+def percentiles(dists, q=PERCENTILES):
+    '''
+    Summarize the distributions from distributions() by their percentiles.
+    Members where a parameter is missing are left out of its percentiles.
+
+    Parameters
+    ----------
+    dists : dictionary
+        Parameter name to a masked array of values (see distributions())
+    q : list of numbers (optional)
+        The percentiles (0 - 100)
+
+    Returns
+    -------
+    A dictionary of parameter name to a masked array of the percentiles
+    (all masked if every member is missing)
+
+    '''
+    pctls = {}
+    for name, values in dists.iteritems():
+        values = ma.masked_invalid(ma.asanyarray(values, dtype=float)).compressed()
+        if len(values) == 0:
+            pctls[name] = ma.masked_all((len(q),))
+        else:
+            pctls[name] = ma.asanyarray(np.percentile(values, q))
+    return pctls
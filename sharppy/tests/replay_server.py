@@ -0,0 +1,161 @@
+''' A local stand-in for the SPC and PSU data servers, for testing sharppy.io.fetch offline '''
+import os
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+__all__ = ['ReplayServer', 'LISTING_PATH']
+
+## The recorded SPC and PSU listings
+LISTING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'listings')
+
+class _ReplayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.replay.count('connections')
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        replay = self.server.replay
+        replay.count('requests')
+        if replay.latency > 0:
+            time.sleep(replay.latency)
+
+        if replay.takeFailure():
+            self._respond(503, '')
+            return
+
+        file_name = replay.fileFor(self.path)
+        if file_name is None:
+            self._respond(404, '')
+            return
+
+        mtime = int(os.path.getmtime(file_name))
+        etag = '"%x-%x"' % (mtime, os.path.getsize(file_name))
+        headers = { 'Last-Modified':formatdate(mtime, usegmt=True), 'ETag':etag }
+
+        inm = self.headers.getheader('if-none-match')
+        ims = self.headers.getheader('if-modified-since')
+        if inm is not None:
+            not_modified = (inm == etag)
+        elif ims is not None:
+            ims_tuple = parsedate_tz(ims)
+            not_modified = ims_tuple is not None and mktime_tz(ims_tuple) >= mtime
+        else:
+            not_modified = False
+
+        if not_modified:
+            replay.count('not_modified')
+            self._respond(304, '', headers)
+        else:
+            body = open(file_name, 'rb').read()
+            replay.count('downloads')
+            self._respond(200, body, headers)
+
+    def _respond(self, status, body, headers={}):
+        self.send_response(status)
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class ReplayServer(object):
+    '''
+    Serves the recorded listings (or any directory) over HTTP on localhost.
+    URL paths map to files under the directory; paths ending in '/' map to
+    the 'index.txt' file in that directory. Responses carry Last-Modified
+    and ETag headers, and conditional requests get 304 responses.
+
+    The server counts connections, requests, downloads and 304 responses
+    (see counts), can add latency to every request, and can be told to
+    fail the next few requests with 503 errors.
+    '''
+    def __init__(self, path=LISTING_PATH, latency=0.):
+        self.path = path
+        self.latency = latency
+        self.counts = { 'connections':0, 'requests':0, 'downloads':0, 'not_modified':0 }
+        self._failures = 0
+        self._lock = threading.Lock()
+
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _ReplayHandler)
+        self._server.replay = self
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url(self, path=''):
+        host, port = self._server.server_address
+        return "http://%s:%d/%s" % (host, port, path.lstrip('/'))
+
+    def fail(self, n_requests):
+        with self._lock:
+            self._failures = n_requests
+
+    def takeFailure(self):
+        with self._lock:
+            if self._failures > 0:
+                self._failures -= 1
+                return True
+        return False
+
+    def count(self, what):
+        with self._lock:
+            self.counts[what] += 1
+
+    def fileFor(self, url_path):
+        url_path = url_path.split('?')[0]
+        rel_path = os.path.normpath(url_path.lstrip('/'))
+        if rel_path.startswith('..'):
+            return None
+        file_name = os.path.join(self.path, rel_path)
+        if url_path.endswith('/'):
+            file_name = os.path.join(file_name, 'index.txt')
+        if not os.path.isfile(file_name):
+            return None
+        return file_name
+
+if __name__ == "__main__":
+    import sys
+    import shutil
+    import tempfile
+    from sharppy.io.fetch import Fetcher
+
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    server = ReplayServer(latency=latency).start()
+    urls = [ server.url(p) for p in [ 'spc/', 'spc/14061612_OBS/', 'psu/', 'psu/GFS/12/' ] ] * 25
+
+    cache_dir = tempfile.mkdtemp()
+    fetcher = Fetcher(cache_path=cache_dir)
+    for label, ttl in [ ('cold', 0), ('revalidated', 0), ('cached', 3600) ]:
+        start = time.time()
+        for url in urls:
+            fetcher.fetch(url, ttl=ttl)
+        elapsed = time.time() - start
+        print "%-12s %4d fetches in %.3f s (%.1f/s)" % (label, len(urls), elapsed, len(urls) / elapsed)
+    print "Fetcher:", fetcher.stats
+    print "Server: ", server.counts
+
+    fetcher.close()
+    server.stop()
+    shutil.rmtree(cache_dir)
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import numpy.ma as ma
+import numpy.testing as npt
+from datetime import datetime
+from sharppy.io.archive import Archive, ArchiveWriter
+from sharppy.io.spc_decoder import SPCDecoder
+from sharppy.io.buf_decoder import BufDecoder
+from sharppy.sharptab import utils
+from sharppy.sharptab.constants import MISSING
+
+PROF_PATH = os.path.join(os.path.dirname(__file__), 'profs')
+SPC_FILE = os.path.join(PROF_PATH, '14061619.OAX')
+BUF_FILE = os.path.join(PROF_PATH, 'oax_sref.buf')
+
+arch_dir = None
+
+def setup_module(module):
+    global arch_dir
+    arch_dir = tempfile.mkdtemp()
+
+def teardown_module(module):
+    shutil.rmtree(arch_dir)
+
+def new_archive(*decs):
+    path = os.path.join(arch_dir, 'archive')
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    writer = ArchiveWriter(path)
+    for dec in decs:
+        writer.addDecoder(dec)
+    writer.close()
+    return path
+
+def assert_prof_equal(prof, correct):
+    u, v = utils.vec2comp(correct.wdir, correct.wspd)
+    data = { 'pres':correct.pres, 'hght':correct.hght, 'tmpc':correct.tmpc, 'dwpc':correct.dwpc,
+        'u':u, 'v':v }
+    for field, col in data.iteritems():
+        # Raw profiles keep the missing values as MISSING instead of masking them
+        col = ma.asanyarray(col, dtype=float).filled(MISSING)
+        npt.assert_almost_equal(ma.getdata(getattr(prof, field)), col)
+
+def test_round_trip():
+    spc_dec = SPCDecoder(SPC_FILE)
+    buf_dec = BufDecoder(BUF_FILE)
+    arch = Archive(new_archive(spc_dec, buf_dec))
+
+    npt.assert_equal(len(arch), 5)
+    npt.assert_equal(arch.getStations(), [ 'OAX' ])
+    npt.assert_equal(arch.getMembers(), sorted([ 'EM1', 'MEAN' ] + spc_dec._profiles.keys()))
+
+    for mem_name, valid, correct in list(spc_dec.iterRawProfiles()) + list(buf_dec.iterRawProfiles()):
+        rows = arch.query(station='OAX', start=valid, end=valid, member=mem_name)
+        npt.assert_equal(len(rows), 1)
+        npt.assert_equal(arch.getProfileTimes(rows), [ valid ])
+        npt.assert_equal(arch.getMemberNames(rows), [ mem_name ])
+        assert_prof_equal(arch.getProfile(rows[0]), correct)
+
+        # The raw profiles are views into the memory maps
+        assert isinstance(arch.getColumn('tmpc', rows[0]), np.memmap)
+
+def test_missing():
+    # The SPC file has missing winds and dewpoints and no omega, all of which
+    #   are stored as MISSING and come back masked.
+    spc_dec = SPCDecoder(SPC_FILE)
+    arch = Archive(new_archive(spc_dec))
+    raw = spc_dec._profiles.values()[0][0]
+    wind_missing = ma.getdata(raw.wspd) == MISSING
+    assert wind_missing.any()
+
+    npt.assert_equal(arch.getColumn('u', 0) == MISSING, wind_missing)
+    npt.assert_equal(arch.getColumn('v', 0) == MISSING, wind_missing)
+    assert (arch.getColumn('omeg', 0) == MISSING).all()
+
+    prof = arch.getProfile(0, prof_type='default')
+    correct = spc_dec.getProfile(0)
+    for field in [ 'pres', 'hght', 'tmpc', 'dwpc', 'u', 'v', 'wdir', 'wspd' ]:
+        npt.assert_equal(ma.getmaskarray(getattr(prof, field)), ma.getmaskarray(getattr(correct, field)))
+        npt.assert_almost_equal(getattr(prof, field).compressed(), getattr(correct, field).compressed())
+    npt.assert_equal(ma.getmaskarray(prof.u), wind_missing)
+    assert ma.getmaskarray(prof.omeg).all()
+
+def test_append():
+    path = new_archive(SPCDecoder(SPC_FILE))
+    writer = ArchiveWriter(path)
+    writer.addDecoder(BufDecoder(BUF_FILE))
+    writer.close()
+
+    arch = Archive(path)
+    npt.assert_equal(len(arch), 5)
+    rows = arch.query(start=datetime(2014, 6, 16, 18), member='EM1')
+    npt.assert_equal(arch.getProfileTimes(rows), [ datetime(2014, 6, 16, 18), datetime(2014, 6, 16, 21) ])
+
+    # A profile whose index line never got written is left out
+    lines = open(os.path.join(path, 'index.csv')).readlines()
+    open(os.path.join(path, 'index.csv'), 'w').writelines(lines[:-1])
+    npt.assert_equal(len(Archive(path)), 4)
+
+def test_index_quoting():
+    # Station names and members with commas and quotes come back unchanged
+    path = os.path.join(arch_dir, 'archive')
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    raw = SPCDecoder(SPC_FILE).getRawProfile(0)
+    writer = ArchiveWriter(path)
+    writer.addProfile(raw, datetime(2014, 6, 16, 19), station='Omaha, NE', member='"a",b')
+    writer.addProfile(raw, datetime(2014, 6, 16, 20), station='OAX')
+    writer.close()
+
+    arch = Archive(path)
+    npt.assert_equal(len(arch), 2)
+    npt.assert_equal(arch.getStations(), sorted([ 'Omaha, NE', 'OAX' ]))
+    rows = arch.query(station='Omaha, NE')
+    npt.assert_equal(arch.getMemberNames(rows), [ '"a",b' ])
+    npt.assert_equal(arch.getProfileTimes(arch.query(station='OAX')), [ datetime(2014, 6, 16, 20) ])
+
+def test_not_archive():
+    npt.assert_raises(IOError, Archive, arch_dir)
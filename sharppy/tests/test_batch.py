@@ -0,0 +1,54 @@
+import numpy as np
+import numpy.ma as ma
+import numpy.testing as npt
+import sharppy.sharptab.profile as profile
+import sharppy.sharptab.params as params
+import sharppy.sharptab.thermo as thermo
+import sharppy.sharptab.batch as batch
+import test_profile as tp
+
+prof = profile.create_profile(profile='default', pres=tp.pres, hght=tp.hght, tmpc=tp.tmpc,
+    dwpc=tp.dwpc, wdir=tp.wdir, wspd=tp.wspd, missing=-9999.)
+
+
+def modified_profile(tmpc, dwpc):
+    tmpcs = prof.tmpc.copy()
+    dwpcs = prof.dwpc.copy()
+    tmpcs[prof.sfc] = tmpc
+    dwpcs[prof.sfc] = dwpc
+    return profile.create_profile(profile='default', pres=prof.pres, hght=prof.hght, tmpc=tmpcs,
+        dwpc=dwpcs, wdir=prof.wdir, wspd=prof.wspd, missing=-9999.)
+
+
+def test_satlift():
+    ps = np.array([ 1000., 850., 500., 200. ])
+    thetams = np.array([ 20., 25., 10., 30. ])
+    correct = [ thermo.satlift(p, thetam) for p, thetam in zip(ps, thetams) ]
+    npt.assert_almost_equal(batch._satlift(ps, thetams), correct)
+
+
+def test_define_parcels():
+    for flag in [ 1, 4 ]:
+        lplvals = params.DefineParcel(prof, flag)
+        pres, tmpc, dwpc = batch.define_parcels(prof, flag)
+        npt.assert_almost_equal([ pres[0], tmpc[0], dwpc[0] ], [ lplvals.pres, lplvals.tmpc, lplvals.dwpc ])
+
+
+def test_surface_sweep():
+    tmpcs = prof.tmpc[prof.sfc] + np.array([ -4., 0., 4. ])
+    dwpcs = prof.dwpc[prof.sfc] + np.array([ -4., 0., 4. ])
+    for flag in [ 1, 4 ]:
+        sweep = batch.surface_sweep(prof, tmpcs, dwpcs, flag=flag)
+        for i, tmpc in enumerate(tmpcs):
+            for j, dwpc in enumerate(dwpcs):
+                if dwpc > tmpc:
+                    assert sweep['bplus'][i, j] is ma.masked
+                    continue
+
+                pcl = params.parcelx(modified_profile(tmpc, dwpc), flag=flag)
+                for name in batch.SWEEP_PARAMS:
+                    correct = getattr(pcl, name)
+                    if correct is ma.masked:
+                        assert sweep[name][i, j] is ma.masked
+                    else:
+                        npt.assert_almost_equal(sweep[name][i, j], correct, decimal=4)
@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import numpy.testing as npt
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from datasources import data_source, available
+
+CSV_TEXT = '''icao,iata,synop,name,state,country,lat,lon,elev,priority,srcid
+KOAX,OAX,72558,Omaha,NE,US,41.32,-96.37,350,3,koax
+KC04,C04,,Hart/Shelby,MI,US,41.9166666667,-85.0333333333,279,7,c04
+,,,c04,,,34.59,-94.3,380,7,c04
+KTOP,TOP,72456,Topeka,KS,US,39.07,-95.62,270,3,ktop
+'''
+
+OUTLET_XML = '''<outlet name="Test" url="http://localhost/{cycle}/{srcid}.buf" format="bufkit" >
+    <time range="84" delta="1" offset="0" delay="3" cycle="12" archive="24"/>
+    <points csv="test.csv" />
+</outlet>'''
+
+CYCLE = datetime(2014, 6, 16, 12)
+
+tmp_dir = None
+calls = []
+
+def availableat_test(dt):
+    calls.append(dt)
+    return [ 'koax', 'c04', 'knone' ]
+
+def setup_module(module):
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+    open(os.path.join(tmp_dir, 'test.csv'), 'w').write(CSV_TEXT)
+    available.available['test'] = { 'model':lambda: [ CYCLE ] }
+    available.availableat['test'] = { 'model':availableat_test }
+
+def teardown_module(module):
+    shutil.rmtree(tmp_dir)
+    del available.available['test']
+    del available.availableat['test']
+
+def new_outlet():
+    outlet = data_source.Outlet('Model', ET.fromstring(OUTLET_XML))
+    outlet._csv_file_name = os.path.join(tmp_dir, 'test.csv')
+    del calls[:]
+    return outlet
+
+def test_indexes():
+    outlet = new_outlet()
+    points = outlet.getPoints()
+    npt.assert_equal(len(points), 4)
+
+    npt.assert_equal(outlet.getPoint(srcid='koax')['name'], 'Omaha')
+    npt.assert_equal(outlet.getPoint(icao='koax')['name'], 'Omaha')
+    npt.assert_equal(outlet.getPoint(wmo=72456)['name'], 'Topeka')
+    npt.assert_equal(outlet.getPoint(srcid='knone'), None)
+    npt.assert_equal(outlet.getPoint(icao='knone'), None)
+
+    # Both points with the same srcid are kept, and the first one is found
+    #   when looking it up.
+    npt.assert_equal(outlet.getPoint(srcid='c04'), points[1])
+    npt.assert_equal(outlet._by_srcid['c04'], points[1:3])
+
+def test_available_at():
+    outlet = new_outlet()
+    points = outlet.getPoints()
+
+    stns = outlet.getAvailableAtTime(dt=CYCLE)
+    npt.assert_equal(stns, points[:3])
+    for pt in points[:3]:
+        assert outlet.hasProfile(pt, CYCLE)
+    assert not outlet.hasProfile(points[3], CYCLE)
+    assert not outlet.hasProfile(points[0], CYCLE - timedelta(days=2))
+
+    # Everything after the first call came from the memo
+    npt.assert_equal(calls, [ CYCLE ])
+
+def test_memo_ttl():
+    outlet = new_outlet()
+    outlet.getAvailableAtTime(dt=CYCLE)
+    outlet.getAvailableAtTime(dt=CYCLE)
+    npt.assert_equal(len(calls), 1)
+
+    outlet.invalidate(cycle=CYCLE - timedelta(hours=12))
+    outlet.getAvailableAtTime(dt=CYCLE)
+    npt.assert_equal(len(calls), 1)
+
+    outlet.invalidate(cycle=CYCLE)
+    outlet.getAvailableAtTime(dt=CYCLE)
+    npt.assert_equal(len(calls), 2)
+
+    # Results are kept until they expire
+    outlet._memoStore(('availableat', CYCLE), [ 'ktop' ], datetime.utcnow() + timedelta(hours=1))
+    outlet.invalidate(cycle=None)
+    outlet._memoStore(('availableat', CYCLE), [ 'ktop' ], datetime.utcnow() - timedelta(seconds=1))
+    npt.assert_equal(outlet.getAvailableAtTime(dt=CYCLE), outlet.getPoints()[:3])
+    npt.assert_equal(len(calls), 3)
+
+    ttl = data_source.AVAILABLE_TTL
+    try:
+        data_source.AVAILABLE_TTL = timedelta(0)
+        outlet.invalidate()
+        outlet.getAvailableAtTime(dt=CYCLE)
+        outlet.getAvailableAtTime(dt=CYCLE)
+        npt.assert_equal(len(calls), 5)
+    finally:
+        data_source.AVAILABLE_TTL = ttl
+
+def test_point_table():
+    csv_name = os.path.join(tmp_dir, 'table.csv')
+    open(csv_name, 'w').write(CSV_TEXT)
+    fields, points = data_source.loadPoints(csv_name)
+    npt.assert_equal(len(points), 4)
+    npt.assert_equal(os.listdir(tmp_dir).count('table.csv.pkl'), 1)
+    npt.assert_equal([ f for f in os.listdir(tmp_dir) if f.endswith('.tmp') ], [])
+
+    # A damaged table is ignored and written again
+    data_source._point_tables.clear()
+    table = open(csv_name + '.pkl', 'rb').read()
+    open(csv_name + '.pkl', 'wb').write(table[:len(table) // 2])
+    npt.assert_equal(data_source.loadPoints(csv_name), (fields, points))
+    npt.assert_equal(open(csv_name + '.pkl', 'rb').read(), table)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import numpy.testing as npt
+import sharppy.sharptab.profile as profile
+from sharppy.io.buf_decoder import BufDecoder
+from sharppy.io.spc_decoder import SPCDecoder
+from sharppy.io.decoder import CancelToken, Cancelled
+from sharppy.io.index_store import get_indices, INDEX_NAMES
+
+BUF_FILE = os.path.join(os.path.dirname(__file__), 'profs', 'oax_sref.buf')
+SPC_FILE = os.path.join(os.path.dirname(__file__), 'profs', '14061619.OAX')
+
+dec = None
+serial = None
+
+def setup_module(module):
+    global dec, serial
+    dec = BufDecoder(BUF_FILE)
+    serial = dec.getProfiles(prof_idxs=[0, 1])
+
+def test_serial():
+    npt.assert_equal(len(serial), 2)
+    for profs in serial:
+        # The mean comes first and is the only one that gets analyzed
+        npt.assert_equal(len(profs), 2)
+        assert isinstance(profs[0], profile.ConvectiveProfile)
+        assert not isinstance(profs[1], profile.ConvectiveProfile)
+
+def test_workers():
+    parallel = dec.getProfiles(prof_idxs=[0, 1], workers=2)
+    for profs, correct in zip(parallel, serial):
+        for prof, correct_prof in zip(profs, correct):
+            npt.assert_equal(type(prof), type(correct_prof))
+            npt.assert_equal(prof.fingerprint(), correct_prof.fingerprint())
+        npt.assert_equal(get_indices(profs[0]), get_indices(correct[0]))
+
+def test_records():
+    for workers in [ None, 2 ]:
+        records = dec.getProfiles(prof_idxs=[0, 1], workers=workers, records=True)
+        for recs, correct in zip(records, serial):
+            # Every member is analyzed when only the records come back
+            npt.assert_equal(len(recs), 2)
+            for rec in recs:
+                npt.assert_equal(sorted(rec.keys()), sorted(INDEX_NAMES))
+            npt.assert_equal(recs[0], get_indices(correct[0]))
+            npt.assert_equal(recs[1], get_indices(profile.ConvectiveProfile.copy(correct[1])))
+
+def test_cancel():
+    token = CancelToken()
+    token.cancel()
+    npt.assert_raises(Cancelled, dec.getProfiles, prof_idxs=[0, 1], cancel=token)
+
+def test_spc_missing_section():
+    # A file without its title or data says which section is missing
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        text = open(SPC_FILE).read()
+        for section in [ '%TITLE%', '%RAW%' ]:
+            file_name = os.path.join(tmp_dir, 'bad.OAX')
+            open(file_name, 'w').write(text.replace(section, ''))
+            try:
+                SPCDecoder(file_name)
+            except IOError as e:
+                assert section in str(e)
+            else:
+                raise AssertionError("No IOError without %s" % section)
+    finally:
+        shutil.rmtree(tmp_dir)
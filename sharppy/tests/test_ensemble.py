@@ -0,0 +1,48 @@
+import numpy as np
+import numpy.testing as npt
+import sharppy.sharptab.profile as profile
+import sharppy.sharptab.params as params
+import sharppy.sharptab.ensemble as ensemble
+import sharppy.sharptab.uncertainty as uncertainty
+import test_profile as tp
+
+
+def make_member(dt):
+    ## Leave the missing values alone
+    tmpc = np.where(tp.tmpc == -9999., tp.tmpc, tp.tmpc + dt)
+    dwpc = np.where(tp.dwpc == -9999., tp.dwpc, tp.dwpc + dt)
+    return profile.create_profile(profile='default', pres=tp.pres, hght=tp.hght, tmpc=tmpc,
+        dwpc=dwpc, wdir=tp.wdir, wspd=tp.wspd, missing=-9999.)
+
+
+def test_stack_members():
+    members = [ make_member(0.), make_member(1.) ]
+    pres, fields = ensemble.stack_members(members)
+    assert pres[0] == members[0].pres[members[0].sfc]
+    assert pres[-1] >= tp.pres[-1]
+    for name in [ 'tmpc', 'dwpc', 'hght', 'u', 'v' ]:
+        assert fields[name].shape == (2, len(pres))
+        assert np.isfinite(fields[name]).all()
+    npt.assert_almost_equal(fields['tmpc'][1] - fields['tmpc'][0], 1.)
+
+
+def test_identical_members():
+    members = [ make_member(0.) for i in xrange(3) ]
+    stats = ensemble.EnsembleStats(members)
+    npt.assert_almost_equal(stats.tmpc['spread'], 0.)
+    npt.assert_almost_equal(stats.u['spread'].compressed(), 0.)
+    npt.assert_almost_equal(stats.tmpc['p10'], stats.tmpc['p90'])
+
+    pcl = params.parcelx(members[0], flag=1)
+    npt.assert_almost_equal(stats.members['sblcl'], pcl.lclhght, decimal=0)
+    for name in ensemble.ENSEMBLE_PARAMS:
+        assert stats.members[name].shape == (3,)
+        assert stats.percentiles[name].shape == (len(uncertainty.PERCENTILES),)
+
+
+def test_spread():
+    members = [ make_member(dt) for dt in [ -1., 0., 1. ] ]
+    stats = ensemble.EnsembleStats(members)
+    npt.assert_almost_equal(stats.tmpc['spread'], np.sqrt(2. / 3.))
+    npt.assert_almost_equal(stats.tmpc['max'] - stats.tmpc['min'], 2.)
+    assert (stats.members['sbcape'][0] < stats.members['sbcape'][2])
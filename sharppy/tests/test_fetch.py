@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import time
+import numpy.testing as npt
+from sharppy.io.fetch import Fetcher, FetchError
+from replay_server import ReplayServer, LISTING_PATH
+
+server = None
+cache_dir = None
+
+def setup_module(module):
+    global server, cache_dir
+    server = ReplayServer().start()
+    cache_dir = tempfile.mkdtemp()
+
+def teardown_module(module):
+    server.stop()
+    shutil.rmtree(cache_dir)
+
+def new_fetcher():
+    shutil.rmtree(cache_dir)
+    os.makedirs(cache_dir)
+    return Fetcher(cache_path=cache_dir, backoff=0.)
+
+def test_fetch_listing():
+    fetcher = new_fetcher()
+    text = fetcher.fetch(server.url('spc/'))
+    correct = open(os.path.join(LISTING_PATH, 'spc', 'index.txt'), 'rb').read()
+    npt.assert_equal(text, correct)
+
+def test_revalidate():
+    fetcher = new_fetcher()
+    url = server.url('psu/GFS/12/')
+    first = fetcher.fetch(url, ttl=0)
+    second = fetcher.fetch(url, ttl=0)
+    npt.assert_equal(first, second)
+    npt.assert_equal(fetcher.stats['downloads'], 1)
+    npt.assert_equal(fetcher.stats['not_modified'], 1)
+
+def test_ttl():
+    fetcher = new_fetcher()
+    fetcher.setTTL(server.url('spc/'), 3600)
+    n_requests = server.counts['requests']
+    for i in xrange(5):
+        fetcher.fetch(server.url('spc/14061612_OBS/'))
+    npt.assert_equal(server.counts['requests'] - n_requests, 1)
+    npt.assert_equal(fetcher.stats['cache_hits'], 4)
+
+def test_connection_reuse():
+    fetcher = new_fetcher()
+    n_connections = server.counts['connections']
+    for path in [ 'spc/', 'spc/14061612_OBS/', 'psu/', 'psu/GFS/12/' ] * 3:
+        fetcher.fetch(server.url(path))
+    fetcher.close()
+    npt.assert_equal(server.counts['connections'] - n_connections, 1)
+
+def test_retry():
+    fetcher = new_fetcher()
+    server.fail(2)
+    fetcher.fetch(server.url('psu/'))
+    npt.assert_equal(fetcher.stats['retries'], 2)
+
+def test_not_found():
+    fetcher = new_fetcher()
+    npt.assert_raises(FetchError, fetcher.fetch, server.url('psu/NOPE/'))
+
+def test_large_body():
+    # Bodies bigger than a chunk arrive intact, and open() hands back the cached file
+    data_dir = tempfile.mkdtemp()
+    data = ''.join(chr(i % 251) for i in xrange(300 * 1024))
+    open(os.path.join(data_dir, 'big.buf'), 'wb').write(data)
+    data_server = ReplayServer(path=data_dir).start()
+    try:
+        fetcher = new_fetcher()
+        body_file = fetcher.open(data_server.url('big.buf'))
+        npt.assert_equal(body_file.read(), data)
+        assert body_file.name.startswith(cache_dir)
+        body_file.close()
+        npt.assert_equal([ f for f in os.listdir(cache_dir) if f.endswith('.tmp') ], [])
+    finally:
+        data_server.stop()
+        shutil.rmtree(data_dir)
+
+def test_cache_size():
+    # The least recently used responses are thrown out once the cache is full
+    new_fetcher()
+    fetcher = Fetcher(cache_path=cache_dir, backoff=0., cache_size=2000)
+    first = fetcher.fetch(server.url('psu/'))
+    for path in [ 'spc/', 'psu/GFS/12/' ]:
+        time.sleep(0.01)
+        fetcher.fetch(server.url(path))
+    npt.assert_equal(len([ f for f in os.listdir(cache_dir) if f.endswith('.body') ]), 2)
+    npt.assert_equal(fetcher._cache.getMeta(server.url('psu/')), None)
+    npt.assert_equal(fetcher.fetch(server.url('psu/')), first)
+
+    # A response that doesn't fit on its own is still kept until the next one
+    fetcher = Fetcher(cache_path=cache_dir, backoff=0., cache_size=10)
+    fetcher.fetch(server.url('spc/14061612_OBS/'))
+    npt.assert_equal(len([ f for f in os.listdir(cache_dir) if f.endswith('.body') ]), 1)
+
+def test_lazy_cache_dir():
+    path = os.path.join(cache_dir, 'lazy')
+    fetcher = Fetcher(cache_path=path, backoff=0.)
+    assert not os.path.exists(path)
+    fetcher.fetch(server.url('spc/'))
+    assert os.path.isdir(path)
+
+def test_memory_cache():
+    fetcher = Fetcher(cache_path=None, backoff=0., cache_size=1000)
+    first = fetcher.fetch(server.url('psu/'))
+    fetcher.fetch(server.url('spc/'))
+    npt.assert_equal(fetcher._cache.getMeta(server.url('psu/')), None)
+    npt.assert_equal(fetcher.fetch(server.url('psu/')), first)
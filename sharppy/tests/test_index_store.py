@@ -0,0 +1,104 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import numpy.testing as npt
+from datetime import datetime
+import sharppy.sharptab.profile as profile
+from sharppy.sharptab import utils
+from sharppy.io import index_store
+from sharppy.io.index_store import IndexStore, INDEX_NAMES, get_indices
+from sharppy.io.spc_decoder import SPCDecoder
+
+SPC_FILE = os.path.join(os.path.dirname(__file__), 'profs', '14061619.OAX')
+
+store_dir = None
+prof = None
+
+def setup_module(module):
+    global store_dir, prof
+    store_dir = tempfile.mkdtemp()
+    prof = SPCDecoder(SPC_FILE).getProfile(0)
+
+def teardown_module(module):
+    shutil.rmtree(store_dir)
+
+def new_store():
+    path = os.path.join(store_dir, 'indices.db')
+    if os.path.exists(path):
+        os.remove(path)
+    return IndexStore(path), path
+
+def test_put_get():
+    store, path = new_store()
+    npt.assert_equal(store.get(prof), None)
+    assert prof not in store
+
+    indices = store.put(prof, valid=datetime(2014, 6, 16, 19))
+    npt.assert_equal(indices, get_indices(prof))
+    npt.assert_equal(sorted(indices.keys()), sorted(INDEX_NAMES))
+    npt.assert_equal(store.get(prof), indices)
+    npt.assert_equal(store.get(prof.fingerprint()), indices)
+    assert prof in store
+
+    # Putting the same profile again replaces the entry
+    store.put(prof)
+    npt.assert_equal(len(store), 1)
+    npt.assert_equal(store.query("SELECT station, valid FROM indices"), [ (prof.location, None) ])
+    store.close()
+
+    # The indices are still there when the store is opened again
+    store = IndexStore(path)
+    npt.assert_equal(store.get(prof), indices)
+    store.close()
+
+def test_analyze():
+    # Any type of profile with the same data finds the same entry
+    store, path = new_store()
+    indices = store.put(prof)
+    raw = profile.create_profile(profile='raw', **prof.inputFields())
+    basic = profile.BasicProfile(**prof.inputFields())
+    npt.assert_equal(raw.fingerprint(), prof.fingerprint())
+    npt.assert_equal(store.analyze(raw), indices)
+    npt.assert_equal(store.analyze(basic), indices)
+    npt.assert_equal(len(store), 1)
+    store.close()
+
+def test_analyze_uv():
+    # Profiles with u and v winds (e.g. from an Archive) are analyzed and
+    #   found again by the same fingerprint
+    store, path = new_store()
+    fields = prof.inputFields()
+    fields['u'], fields['v'] = utils.vec2comp(fields.pop('wdir'), fields.pop('wspd'))
+    for prof_type in [ 'raw', 'default' ]:
+        uv = profile.create_profile(profile=prof_type, **fields)
+        indices = store.analyze(uv)
+        npt.assert_equal(store.get(uv), indices)
+        assert uv in store
+    npt.assert_equal(len(store), 1)
+    store.close()
+
+def test_invalidate():
+    # A store written with a different version of the schema is thrown away
+    store, path = new_store()
+    store.put(prof)
+    store.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA user_version = %d" % (index_store.STORE_VERSION + 1))
+    conn.commit()
+    conn.close()
+
+    store = IndexStore(path)
+    npt.assert_equal(len(store), 0)
+    npt.assert_equal(store.get(prof), None)
+    store.close()
+
+def test_no_winds():
+    # Profiles without winds can still be fingerprinted
+    fields = prof.inputFields()
+    for wind in [ 'wdir', 'wspd', 'u', 'v' ]:
+        fields.pop(wind, None)
+    raw = profile.create_profile(profile='raw', **fields)
+    npt.assert_equal(raw.inputFields(), fields)
+    assert raw.fingerprint() != prof.fingerprint()
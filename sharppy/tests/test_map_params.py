@@ -0,0 +1,136 @@
+import os
+import numpy as np
+import numpy.ma as ma
+import numpy.testing as npt
+from datetime import datetime
+from sharppy.io.map_params import MAP_PARAMS, StationParams, overlay_params, \
+    barnes_analysis, contour_segments
+from sharppy.io.decoder import CancelToken, Cancelled
+from sharppy.io.spc_decoder import SPCDecoder
+from sharppy.io.buf_decoder import BufDecoder
+from sharppy.io.index_store import get_indices
+
+PROF_PATH = os.path.join(os.path.dirname(__file__), 'profs')
+SPC_FILE = os.path.join(PROF_PATH, '14061619.OAX')
+BUF_FILE = os.path.join(PROF_PATH, 'oax_sref.buf')
+
+CYCLE = datetime(2014, 6, 16, 18)
+
+class FakeDataSource(object):
+    # Just enough of a DataSource for StationParams, serving the test files
+    def getName(self):
+        return 'Test'
+
+    def getForecastHours(self):
+        return [ 0, 3 ]
+
+    def getURL(self, point, cycle):
+        return point['file']
+
+    def getDecoder(self, point, cycle):
+        return BufDecoder if point['file'].endswith('.buf') else SPCDecoder
+
+POINTS = [
+    { 'srcid':'koax', 'file':BUF_FILE },
+    { 'srcid':'kspc', 'file':SPC_FILE },
+    { 'srcid':'knone', 'file':os.path.join(PROF_PATH, 'nope.buf') },
+]
+
+def assert_matches_indices(values, prof):
+    indices = get_indices(prof)
+    npt.assert_equal(sorted(values.keys()), sorted(MAP_PARAMS.keys()))
+    for name, idx_name in MAP_PARAMS.iteritems():
+        npt.assert_almost_equal(values[name], indices[idx_name])
+
+def test_overlay_params():
+    # The same values as from the full profile
+    dec = SPCDecoder(SPC_FILE)
+    assert_matches_indices(overlay_params(dec.getRawProfile(0)), dec.getProfile(0))
+
+def test_raw_profile():
+    dec = BufDecoder(BUF_FILE)
+    raw = dec.getRawProfile(1)
+    npt.assert_equal(raw, dec._profiles['MEAN'][1])
+    npt.assert_equal(dec.getRawProfile(1, member='EM1'), dec._profiles['EM1'][1])
+    npt.assert_equal(raw.fingerprint(), dec.getProfile(1)[0].fingerprint())
+
+def test_station_params():
+    dec = BufDecoder(BUF_FILE)
+    for processes in [ 1, 2 ]:
+        station_params = StationParams(processes=processes)
+        try:
+            values = station_params.compute(FakeDataSource(), POINTS, CYCLE, 3)
+        finally:
+            station_params.close()
+
+        npt.assert_equal(sorted(values.keys()), [ 'knone', 'koax', 'kspc' ])
+        npt.assert_equal(values['knone'], None)
+        assert_matches_indices(values['koax'], dec.getProfile(1)[0])
+        npt.assert_equal(station_params.get(('Test', CYCLE, 3)), values)
+
+def test_station_params_cache():
+    station_params = StationParams(processes=1, max_entries=1)
+    data_source = FakeDataSource()
+    values = station_params.compute(data_source, POINTS[:1], CYCLE, 0)
+
+    # Cached stations aren't loaded again (a cancel would stop the first one)
+    cancel = CancelToken()
+    cancel.cancel()
+    npt.assert_equal(station_params.compute(data_source, POINTS[:1], CYCLE, 0, cancel=cancel), values)
+    npt.assert_raises(Cancelled, station_params.compute, data_source, POINTS, CYCLE, 0, cancel=cancel)
+
+    # Only max_entries times are kept
+    station_params.compute(data_source, POINTS[:1], CYCLE, 3)
+    npt.assert_equal(station_params.get(('Test', CYCLE, 0)), {})
+    station_params.clear()
+    npt.assert_equal(station_params.get(('Test', CYCLE, 3)), {})
+
+def test_barnes_analysis():
+    np.random.seed(0)
+    xs, ys = np.random.uniform(0, 10, (2, 200))
+    grid_xs = np.linspace(0, 10, 21)
+    grid_ys = np.linspace(0, 5, 11)
+
+    # A constant field comes back unchanged
+    grid = barnes_analysis(xs, ys, 3. * np.ones(xs.shape), grid_xs, grid_ys)
+    npt.assert_equal(grid.shape, (11, 21))
+    npt.assert_almost_equal(grid.compressed(), 3.)
+
+    # A smooth field comes back close to itself
+    grid = barnes_analysis(xs, ys, xs + ys, grid_xs, grid_ys)
+    gxs, gys = np.meshgrid(grid_xs, grid_ys)
+    inner = (gxs > 2) & (gxs < 8) & (gys > 2) & (gys < 3)
+    assert np.abs(grid[inner] - (gxs + gys)[inner]).max() < 0.5
+
+    # Far from the points is masked, and non-finite values are left out
+    vals = xs + ys
+    vals[0] = np.nan
+    grid = barnes_analysis(xs, ys, vals, np.array([ 5., 100. ]), np.array([ 2.5 ]))
+    assert not ma.getmaskarray(grid)[0, 0]
+    assert ma.getmaskarray(grid)[0, 1]
+
+    # Too few points to analyze
+    assert ma.getmaskarray(barnes_analysis(xs[:2], ys[:2], vals[:2], grid_xs, grid_ys)).all()
+
+def test_contour_segments():
+    # The contour of a field that increases with x is a vertical line
+    grid_xs = np.arange(5.)
+    grid_ys = np.arange(4.)
+    grid = np.meshgrid(grid_xs, grid_ys)[0]
+    x0s, y0s, x1s, y1s = contour_segments(grid_xs, grid_ys, grid, 1.5)
+    npt.assert_equal(len(x0s), 3)
+    npt.assert_almost_equal(x0s, 1.5)
+    npt.assert_almost_equal(x1s, 1.5)
+    npt.assert_almost_equal(sorted(zip(np.minimum(y0s, y1s), np.maximum(y0s, y1s))), [ (0, 1), (1, 2), (2, 3) ])
+
+    # Masked points are left out
+    masked = ma.masked_where(np.zeros(grid.shape, dtype=bool), grid)
+    masked[0, 1] = ma.masked
+    npt.assert_equal(len(contour_segments(grid_xs, grid_ys, masked, 1.5)[0]), 2)
+
+    # A saddle gets two segments
+    x0s, y0s, x1s, y1s = contour_segments(np.arange(2.), np.arange(2.), np.array([[ 1., 0. ], [ 0., 1. ]]), 0.5)
+    npt.assert_equal(len(x0s), 2)
+
+    # No crossings
+    npt.assert_equal(len(contour_segments(grid_xs, grid_ys, grid, 10.)[0]), 0)
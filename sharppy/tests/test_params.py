@@ -0,0 +1,54 @@
+import pickle
+import numpy as np
+import numpy.testing as npt
+import sharppy.sharptab.profile as profile
+import sharppy.sharptab.params as params
+import test_profile as tp
+
+prof = profile.create_profile(profile='default', pres=tp.pres, hght=tp.hght, tmpc=tp.tmpc,
+    dwpc=tp.dwpc, wdir=tp.wdir, wspd=tp.wspd, missing=-9999.)
+mupcl = params.parcelx(prof, flag=3)
+
+
+def test_most_unstable_level_guess():
+    correct = params.most_unstable_level(prof)
+    for guess in [ correct, correct - 20., prof.pres[prof.sfc] - 350. ]:
+        npt.assert_almost_equal(params.most_unstable_level(prof, guess=guess), correct)
+
+
+def test_convective_temp_guess():
+    # Near guesses and ones far enough off to need the full search all give
+    #   exactly the same answer
+    correct = params.convective_temp(prof)
+    for guess in [ correct, correct - 0.5, correct + 0.25, correct - 3., correct + 3., correct - 20., correct + 20., np.ma.masked ]:
+        npt.assert_equal(params.convective_temp(prof, guess=guess), correct)
+
+
+def test_convective_profile_guess():
+    cold = profile.ConvectiveProfile.copy(prof)
+    warm = profile.ConvectiveProfile.copy(prof, guess=params.sequence_guess(cold))
+    npt.assert_almost_equal(warm.mupcl.bplus, cold.mupcl.bplus)
+    npt.assert_almost_equal([ warm.ebottom, warm.etop ], [ cold.ebottom, cold.etop ])
+    npt.assert_almost_equal(warm.stp_cin, cold.stp_cin)
+    npt.assert_equal(warm.convT, cold.convT)
+
+
+def test_parcel_trace():
+    assert len(mupcl.ptrace) == len(mupcl.ttrace)
+    npt.assert_almost_equal(mupcl.ptrace[0], mupcl.lplvals.pres)
+    npt.assert_almost_equal(mupcl.ptrace[1], mupcl.lclpres)
+    assert mupcl.ptrace.count() > 2
+    assert (np.diff(mupcl.ptrace.compressed()) <= 0).all()
+
+
+def test_cape_parcel():
+    pcl = params.cape(prof, lplvals=mupcl.lplvals)
+    assert isinstance(pcl, params.CapeParcel)
+    npt.assert_almost_equal([ pcl.bplus, pcl.bminus ], [ mupcl.bplus, mupcl.bminus ], decimal=0)
+
+
+def test_parcel_pickle():
+    pcl = pickle.loads(pickle.dumps(mupcl, 0))
+    npt.assert_almost_equal([ pcl.bplus, pcl.lplvals.pres ], [ mupcl.bplus, mupcl.lplvals.pres ])
+    npt.assert_almost_equal(pcl.ttrace, mupcl.ttrace)
+    assert not hasattr(mupcl, '__dict__')
@@ -208,3 +208,15 @@ class TestProfile(object):
         npt.assert_almost_equal(prof.sfc, sfc_ind)
 
 
+
+def test_fingerprint_same_data():
+    raw = Profile(pres=pres, hght=hght, tmpc=tmpc, dwpc=dwpc, wdir=wdir, wspd=wspd, location='OUN')
+    copy = Profile.copy(raw)
+    npt.assert_equal(raw.fingerprint(), copy.fingerprint())
+
+def test_fingerprint_changes_with_data():
+    raw = Profile(pres=pres, hght=hght, tmpc=tmpc, dwpc=dwpc, wdir=wdir, wspd=wspd, location='OUN')
+    warmer = Profile(pres=pres, hght=hght, tmpc=tmpc + 1, dwpc=dwpc, wdir=wdir, wspd=wspd, location='OUN')
+    moved = Profile(pres=pres, hght=hght, tmpc=tmpc, dwpc=dwpc, wdir=wdir, wspd=wspd, location='OAX')
+    assert raw.fingerprint() != warmer.fingerprint()
+    assert raw.fingerprint() != moved.fingerprint()
@@ -0,0 +1,41 @@
+import cPickle
+import numpy as np
+import numpy.testing as npt
+import sharppy.sharptab.profile as profile
+import sharppy.sharptab.records as records
+from sharppy.io.index_store import get_indices
+import test_profile as tp
+
+prof = profile.create_profile(profile='convective', pres=tp.pres, hght=tp.hght, tmpc=tp.tmpc,
+    dwpc=tp.dwpc, wdir=tp.wdir, wspd=tp.wspd, missing=-9999., location='OUN')
+
+
+def test_record_round_trip():
+    record = prof.to_record()
+    assert record.dtype == records.RECORD_DTYPE
+    rehydrated = records.ProfileRecord(cPickle.loads(cPickle.dumps(record, 2)))
+
+    assert rehydrated.fingerprint() == prof.fingerprint()
+    assert rehydrated.location == 'OUN'
+    assert rehydrated.watch_type == prof.watch_type
+    npt.assert_allclose(rehydrated.mlpcl.bplus, prof.mlpcl.bplus, rtol=1e-6)
+    npt.assert_allclose(rehydrated.srh1km, prof.srh1km, rtol=1e-6)
+
+    correct = get_indices(prof)
+    for name, value in get_indices(rehydrated).iteritems():
+        if isinstance(value, float):
+            npt.assert_allclose(value, correct[name], rtol=1e-6, atol=1e-6)
+        else:
+            assert value == correct[name]
+
+
+def test_record_array():
+    array = np.array([ prof.to_record() ] * 3, dtype=records.RECORD_DTYPE)
+    npt.assert_allclose(array['mupcl_bplus'], prof.mupcl.bplus, rtol=1e-6)
+    assert records.ProfileRecord(array[1]).stp_cin == np.float32(prof.stp_cin)
+
+
+def test_record_version():
+    record = prof.to_record()
+    record['version'] = records.RECORD_VERSION + 1
+    npt.assert_raises(ValueError, records.ProfileRecord, record)
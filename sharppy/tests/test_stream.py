@@ -0,0 +1,130 @@
+import os
+import bz2
+import gzip
+import shutil
+import tempfile
+import numpy.testing as npt
+from StringIO import StringIO
+from sharppy.io.stream import open_stream, lzma
+from sharppy.io.spc_decoder import SPCDecoder
+from sharppy.io.buf_decoder import BufDecoder, _MemberParser
+
+PROF_PATH = os.path.join(os.path.dirname(__file__), 'profs')
+SPC_FILE = os.path.join(PROF_PATH, '14061619.OAX')
+BUF_FILE = os.path.join(PROF_PATH, 'oax_sref.buf')
+
+tmp_dir = None
+
+def setup_module(module):
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+def teardown_module(module):
+    shutil.rmtree(tmp_dir)
+
+def gzip_data(data):
+    buf = StringIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb')
+    gz.write(data)
+    gz.close()
+    return buf.getvalue()
+
+def write_tmp(name, data):
+    path = os.path.join(tmp_dir, name)
+    open(path, 'wb').write(data)
+    return path
+
+def compressed_copies(file_name):
+    # A copy of the file in each of the compressed formats, plus a gzip file
+    #   made by concatenating two gzip files.
+    data = open(file_name, 'rb').read()
+    base = os.path.basename(file_name)
+    half = len(data) // 2
+    copies = [
+        write_tmp(base + '.gz', gzip_data(data)),
+        write_tmp(base + '.bz2', bz2.compress(data)),
+        write_tmp(base + '.multi.gz', gzip_data(data[:half]) + gzip_data(data[half:])),
+        write_tmp(base + '.multi.bz2', bz2.compress(data[:half]) + bz2.compress(data[half:])),
+    ]
+    if lzma is not None:
+        copies.append(write_tmp(base + '.xz', lzma.compress(data)))
+    return data, copies
+
+def assert_profs_equal(prof1, prof2):
+    for attr in [ 'pres', 'hght', 'tmpc', 'dwpc', 'wdir', 'wspd' ]:
+        npt.assert_equal(getattr(prof1, attr), getattr(prof2, attr))
+    npt.assert_equal(prof1.location, prof2.location)
+
+def test_stream_read():
+    data, copies = compressed_copies(SPC_FILE)
+    for path in [ SPC_FILE ] + copies:
+        stream = open_stream(path)
+        npt.assert_equal(stream.read(), data)
+        stream.close()
+
+def test_stream_lines():
+    # Chunks shorter than the magic numbers and the lines
+    data, copies = compressed_copies(SPC_FILE)
+    for path in [ SPC_FILE ] + copies:
+        stream = open_stream(path, chunk_size=5)
+        npt.assert_equal(list(stream), StringIO(data).readlines())
+        stream.close()
+
+def test_stream_short():
+    npt.assert_equal(open_stream(StringIO('abc')).read(), 'abc')
+    npt.assert_equal(open_stream(StringIO('')).read(), '')
+    npt.assert_equal(open_stream(StringIO(gzip_data(''))).read(), '')
+
+def test_spc_compressed():
+    correct = SPCDecoder(SPC_FILE).getProfile(0)
+    for path in compressed_copies(SPC_FILE)[1]:
+        prof = SPCDecoder(path).getProfile(0)
+        assert_profs_equal(prof, correct)
+
+def test_buf_compressed():
+    correct = BufDecoder(BUF_FILE)
+    for path in compressed_copies(BUF_FILE)[1]:
+        dec = BufDecoder(path)
+        npt.assert_equal(dec.getProfileTimes(), correct.getProfileTimes())
+        npt.assert_equal(sorted(dec._profiles.keys()), sorted(correct._profiles.keys()))
+        for mem_name, profs in correct._profiles.items():
+            for prof, correct_prof in zip(dec._profiles[mem_name], profs):
+                assert_profs_equal(prof, correct_prof)
+
+def test_buf_members():
+    dec = BufDecoder(BUF_FILE)
+    npt.assert_equal(sorted(dec._profiles.keys()), [ 'EM1', 'MEAN' ])
+    npt.assert_equal(len(dec.getProfileTimes()), 2)
+    npt.assert_equal(dec.getStnId(), 'OAX')
+
+    # Members are parsed a line at a time, so the result has to be the same as
+    #   parsing each member's text all at once.
+    text = open(BUF_FILE, 'rb').read()
+    for mem_text in text.split('\r\n\r\n\r\n'):
+        if mem_text.strip() == '':
+            continue
+        mem_name, profs, dates = dec._parseMember(mem_text)
+        npt.assert_equal(dates, dec.getProfileTimes())
+        for prof, correct_prof in zip(profs, dec._profiles[mem_name]):
+            assert_profs_equal(prof, correct_prof)
+
+def test_member_parser():
+    member = _MemberParser('MEAN')
+    for line in open(BUF_FILE, 'rb').read().split('\r\n')[1:]:
+        if line == '':
+            break
+        member.feed(line)
+    mem_name, profs, dates = member.finish()
+    npt.assert_equal(mem_name, 'MEAN')
+    npt.assert_equal(profs, [])
+    npt.assert_equal(dates, [])
+
+    member = _MemberParser('MEAN')
+    lines = open(BUF_FILE, 'rb').read().split('\r\n')
+    for line in lines[1:lines.index('STN YYMMDD/HHMM PMSL PRES')]:
+        member.feed(line)
+    mem_name, profs, dates = member.finish()
+    npt.assert_equal(len(profs), 2)
+    npt.assert_equal(len(profs[0].pres), 20)
+    npt.assert_equal(profs[0].location, 'OAX')
+    npt.assert_almost_equal(profs[1].tmpc[0] - profs[0].tmpc[0], 1.)
@@ -0,0 +1,64 @@
+import numpy as np
+import numpy.ma as ma
+import numpy.testing as npt
+import sharppy.sharptab.profile as profile
+import sharppy.sharptab.timeseries as timeseries
+import test_profile as tp
+
+def make_prof(dt=0.):
+    tmpc = np.where(tp.tmpc == -9999., tp.tmpc, tp.tmpc + dt)
+    return profile.create_profile(profile='raw', pres=tp.pres, hght=tp.hght, tmpc=tmpc,
+        dwpc=tp.dwpc, wdir=tp.wdir, wspd=tp.wspd, missing=-9999.)
+
+prof = make_prof()
+
+
+def test_time_height():
+    warm = make_prof(2.)
+    sections = timeseries.time_height([prof, warm], hghts=[0., 1000., 5000.])
+    basic = timeseries._basic_profile(prof)
+    agl = basic.hght - basic.hght[basic.sfc]
+    good = ~basic.thetae.mask
+    correct = np.interp([0., 1000., 5000.], agl[good], basic.thetae[good])
+    npt.assert_almost_equal(sections['thetae'][0], correct)
+    assert sections['relh'].shape == (2, 3)
+    assert np.all(sections['thetae'][1] > sections['thetae'][0])
+
+
+def test_headline_params():
+    conv = profile.ConvectiveProfile.copy(prof)
+    vals = timeseries.headline_params(prof)
+    npt.assert_almost_equal(vals['mlcape'], conv.mlpcl.bplus)
+    npt.assert_almost_equal(vals['mucape'], conv.mupcl.bplus)
+    npt.assert_almost_equal(vals['stp_cin'], conv.stp_cin)
+    npt.assert_almost_equal(vals['scp'], conv.right_scp)
+    npt.assert_almost_equal(vals['pwat'], conv.pwat)
+    assert vals['precip_type'] == conv.precip_type
+
+
+def test_run_series_recompute():
+    series = timeseries.RunSeries(hghts=[0., 3000.])
+    profs = [ prof, make_prof(-1.) ]
+    dates = [ 0, 1 ]
+    assert series.update(profs, dates) == [0, 1]
+    assert series.update(profs, dates) == []
+
+    profs[1] = make_prof(1.)
+    assert series.update(profs, dates) == [1]
+    assert series.sections['thetae'].shape == (2, 2)
+    assert len(series.series['mlcape']) == 2
+
+
+def test_run_series_snapshot():
+    # A snapshot keeps the results from before the next update
+    series = timeseries.RunSeries(hghts=[0., 3000.])
+    series.update([ prof, make_prof(-1.) ], [ 0, 1 ])
+    snap = series.snapshot()
+    mlcape = snap.series['mlcape'].copy()
+
+    series.update([ make_prof(1.) ], [ 2 ])
+    npt.assert_equal(snap.dates, [ 0, 1 ])
+    assert snap.sections['thetae'].shape == (2, 2)
+    npt.assert_equal(snap.series['mlcape'], mlcape)
+    npt.assert_equal(series.snapshot().dates, [ 2 ])
+    assert series.snapshot().sections['thetae'].shape == (1, 2)
@@ -0,0 +1,40 @@
+import numpy as np
+import numpy.testing as npt
+import sharppy.sharptab.profile as profile
+import sharppy.sharptab.uncertainty as uncertainty
+import test_profile as tp
+
+
+def make_prof(tmp_stdev, dew_stdev):
+    return profile.create_profile(profile='convective', pres=tp.pres, hght=tp.hght, tmpc=tp.tmpc,
+        dwpc=tp.dwpc, wdir=tp.wdir, wspd=tp.wspd, tmp_stdev=tmp_stdev, dew_stdev=dew_stdev, missing=-9999.)
+
+
+def test_perturb():
+    prof = make_prof(np.ones(len(tp.pres)), 2 * np.ones(len(tp.pres)))
+    tmpc, dwpc = uncertainty.perturb(prof, members=2000, seed=1)
+    assert tmpc.shape == (2000, len(tp.pres))
+    assert not (np.nan_to_num(dwpc - tmpc) > 0).any()
+
+    tmp_err = tmpc - prof.tmpc.filled(np.nan)
+    npt.assert_almost_equal(np.nanstd(tmp_err[:, 1:], axis=0), 1., decimal=1)
+
+    dz = prof.hght[6] - prof.hght[1]
+    npt.assert_almost_equal(np.corrcoef(tmp_err[:, 1], tmp_err[:, 6])[0, 1], np.exp(-dz / 1000.), decimal=1)
+
+
+def test_zero_stdev():
+    prof = make_prof(np.zeros(len(tp.pres)), np.zeros(len(tp.pres)))
+    correct = {
+        'sbcape':prof.sfcpcl.bplus, 'sbcinh':prof.sfcpcl.bminus, 'sblcl':prof.sfcpcl.lclhght,
+        'mlcape':prof.mlpcl.bplus, 'mlcinh':prof.mlpcl.bminus, 'mllcl':prof.mlpcl.lclhght,
+        'stp_cin':prof.stp_cin,
+    }
+    for name in uncertainty.UNCERTAINTY_PARAMS:
+        npt.assert_almost_equal(prof.uncertainty[name], correct[name] * np.ones(len(uncertainty.PERCENTILES)), decimal=4)
+
+
+def test_no_stdev():
+    prof = profile.create_profile(profile='convective', pres=tp.pres, hght=tp.hght, tmpc=tp.tmpc,
+        dwpc=tp.dwpc, wdir=tp.wdir, wspd=tp.wspd, missing=-9999.)
+    assert prof.uncertainty is None
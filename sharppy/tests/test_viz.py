@@ -0,0 +1,9 @@
+import numpy.testing as npt
+import sharppy.viz as viz
+from sharppy.viz.SPCWindow import SkewApp
+
+def test_insets():
+    # Every inset has a name for the menu and a class from sharppy.viz
+    npt.assert_equal(sorted(SkewApp.inset_generators.keys()), sorted(SkewApp.inset_names.keys()))
+    for inset, inset_gen in SkewApp.inset_generators.iteritems():
+        assert getattr(viz, inset_gen.__name__) is inset_gen
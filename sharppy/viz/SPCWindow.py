@@ -3,7 +3,8 @@ __author__ = 'keltonhalbert, wblumberg'
 from sharppy.viz import plotSkewT, plotHodo, plotText, plotAnalogues
 from sharppy.viz import plotThetae, plotWinds, plotSpeed, plotKinematics, plotGeneric
 from sharppy.viz import plotSlinky, plotWatch, plotAdvection, plotSTP, plotWinter
-from sharppy.viz import plotSHIP, plotSTPEF, plotFire, plotVROT
+from sharppy.viz import plotSHIP, plotSTPEF, plotFire, plotVROT, plotUncertainty, plotEnsemble
+from sharppy.viz import TimeHeightWindow, SurfaceSweepWindow, computeSweeps
 from PySide.QtCore import *
 from PySide.QtGui import *
 import sharppy.sharptab.profile as profile
@@ -12,6 +13,7 @@ import sharppy.io as io
 import sharppy.databases.sars as sars
 from datetime import datetime, timedelta
 import copy
+from collections import OrderedDict
 import numpy as np
 import ConfigParser
 import platform
@@ -33,6 +35,8 @@ class SkewApp(QWidget):
         'FIRE':plotFire,
         'SHIP':plotSHIP,
         'VROT':plotVROT,
+        'UNCERTAINTY':plotUncertainty,
+        'ENSEMBLE':plotEnsemble,
     }
 
     inset_names = {
@@ -43,6 +47,8 @@ class SkewApp(QWidget):
         'FIRE':'Fire Weather',
         'SHIP':'Sig-Hail Stats',
         'VROT':'EF-Scale Probs (V-Rot)',
+        'UNCERTAINTY':'Parameter Uncertainty',
+        'ENSEMBLE':'Ensemble Spread',
     }
 
     cfg_file_name = 'sharppy.ini'
@@ -68,12 +74,43 @@ class SkewApp(QWidget):
 
         ## these are used to display profiles
         self.current_idx = 0
+        self.pending_idx = None
         self.prof = profs[self.current_idx]
+
+        ## profiles that haven't been computed yet (or have been dropped) are
+        ## None. If a loader function is given, they're computed on the async
+        ## pool as the user steps toward them, and only the cache_size most
+        ## recently used ones are kept around.
+        self.async = kwargs.get("async", None)
+        self.loader = kwargs.get("loader", None)
+        self.cache_size = max(kwargs.get("cache_size", 8), 3)
+        self.direction = 1
+        self.prof_tasks = {}
+        self.prof_lru = OrderedDict( (idx, True) for idx, prof in enumerate(profs) if prof is not None )
         self.original_profs = self.profs[:]
         self.modified_skew = [ False for p in self.original_profs ]
         self.modified_hodo = [ False for p in self.original_profs ]
         self.parcel_type = "MU"
 
+        ## the raw (undecorated) profiles for every time, used for the
+        ## time-height sections and parameter time series of model runs
+        self.raw_profs = kwargs.get("raw_profs", None)
+        self.run_series = tab.timeseries.RunSeries()
+        self.series_window = None
+        self.series_task = None
+
+        ## the table of parcel parameters over a grid of surface temperatures
+        ## and dewpoints around the current profile's
+        self.sweep_window = None
+        self.sweep_task = None
+
+        ## the statistics over the SREF members, by time (the members can't
+        ## be modified, so these don't change once they're computed). They're
+        ## computed on the async pool, and the tasks still running are kept
+        ## by time.
+        self.ens_stats = {}
+        self.ens_tasks = {}
+
         self.config = ConfigParser.RawConfigParser()
         self.config.read(SkewApp.cfg_file_name)
         if not self.config.has_section('insets'):
@@ -178,6 +215,7 @@ class SkewApp(QWidget):
         ## initialize the data frames
         self.initData()
         self.loadWidgets()
+        self.prefetch()
 
 
     def getParcelObj(self, prof, name):
@@ -221,6 +259,54 @@ class SkewApp(QWidget):
              plot_title += "  (" + self.run + "  " + self.model + "  " + self.fhour[self.current_idx] + modified_str + ")"
         return plot_title
 
+    def setProfiles(self, profs, dates, **kwargs):
+        """
+        Replace the profiles being shown (e.g. to reuse the window for
+        another station) and show the first one. Takes the same keyword
+        arguments as the constructor; the model can't be changed.
+        """
+        for task_id, urgent in self.prof_tasks.itervalues():
+            self.async.cancel(task_id)
+        for task_id in self.ens_tasks.itervalues():
+            self.async.cancel(task_id)
+
+        self.profs = profs
+        self.dates = dates
+        self.prof_idx = kwargs.get("idx")
+        self.run = kwargs.get("run")
+        self.loc = kwargs.get("location")
+        self.fhour = kwargs.get("fhour", [ None ])
+        self.proflist = []
+        self.ens_stats = {}
+        self.ens_tasks = {}
+
+        self.pending_idx = None
+        self.original_profs = self.profs[:]
+        self.modified_skew = [ False for p in self.original_profs ]
+        self.modified_hodo = [ False for p in self.original_profs ]
+
+        self.async = kwargs.get("async", self.async)
+        self.loader = kwargs.get("loader", None)
+        self.prof_tasks = {}
+        self.prof_lru = OrderedDict( (idx, True) for idx, prof in enumerate(profs) if prof is not None )
+
+        self.raw_profs = kwargs.get("raw_profs", None)
+        if self.series_window is not None:
+            self.series_window.close()
+            self.series_window = None
+
+        self.stepTo(0)
+
+    def renderImage(self):
+        """
+        Draw the whole window into a QImage. This works whether or not the
+        window is on screen.
+        """
+        image = QImage(self.size(), QImage.Format_RGB32)
+        image.fill(0)
+        self.render(image)
+        return image
+
     def saveimage(self):
         self.home_path = expanduser('~')
         files_types = "PNG (*.png)"
@@ -241,11 +327,13 @@ class SkewApp(QWidget):
 
         if self.model == "SREF":
             self.prof = self.profs[self.current_idx][0]
+            ens_stats = self.ensembleStats()
             self.sound = plotSkewT(self.prof, pcl=self.prof.mupcl, title=self.plot_title, brand=self.brand,
-                               proflist=self.profs[self.current_idx][:], dgz=self.dgz)
+                               ens_stats=ens_stats, dgz=self.dgz)
             self.hodo = plotHodo(self.prof.hght, self.prof.u, self.prof.v, prof=self.prof,
-                                 proflist=self.profs[self.current_idx][:], parent=self)
+                                 ens_stats=ens_stats, parent=self)
         else:
+            ens_stats = None
             self.prof = self.profs[self.current_idx]
             self.sound = plotSkewT(self.prof, pcl=self.prof.mupcl, title=self.plot_title, brand=self.brand,
                                    dgz=self.dgz, proflist=self.proflist)
@@ -278,9 +366,59 @@ class SkewApp(QWidget):
 
         self.makeInsets()
         self.insets["SARS"].updatematch.connect(self.updateSARS)
+        self.insets["ENSEMBLE"].setStats(ens_stats, pending=self.current_idx in self.ens_tasks)
         self.right_inset_ob = self.insets[self.right_inset]
         self.left_inset_ob = self.insets[self.left_inset]
 
+    def ensembleStats(self):
+        """
+        The statistics over the SREF members at the current time (None if
+        there aren't enough members). They're computed on the async pool the
+        first time they're needed, and are None until they come in, when the
+        window is updated with them.
+        """
+        idx = self.current_idx
+        if idx not in self.ens_stats:
+            self.requestEnsembleStats(idx)
+        return self.ens_stats.get(idx, None)
+
+    def requestEnsembleStats(self, idx):
+        """
+        Start computing the statistics over the SREF members at idx in the
+        background, if they aren't there already.
+        """
+        if idx in self.ens_stats or idx in self.ens_tasks:
+            return
+
+        members = self.profs[idx][1:]
+        if len(members) < 2:
+            self.ens_stats[idx] = None
+            return
+
+        def finish(ret):
+            self.ens_tasks.pop(idx, None)
+            ## Don't keep trying if they can't be computed
+            self.ens_stats[idx] = None if isinstance(ret[0], Exception) else ret[0]
+            if idx == self.current_idx:
+                self.updateEnsemble()
+
+        if self.async is None:
+            self.ens_stats[idx] = tab.ensemble.EnsembleStats(members)
+        else:
+            self.ens_tasks[idx] = self.async.post(tab.ensemble.EnsembleStats, finish, members)
+
+    def updateEnsemble(self):
+        """
+        Redraw the SREF envelopes on the Skew-T and hodograph and the
+        ensemble inset with the statistics at the current time.
+        """
+        ens_stats = self.ens_stats.get(self.current_idx, None)
+        self.sound.setProf(self.prof, pcl=self.getParcelObj(self.prof, self.parcel_type), title=self.plot_title,
+                           brand=self.brand, ens_stats=ens_stats, dgz=self.dgz)
+        self.hodo.setProf(self.prof.hght, self.prof.u, self.prof.v, prof=self.prof,
+                          ens_stats=ens_stats, parent=self)
+        self.insets["ENSEMBLE"].setStats(ens_stats)
+
     def makeInsets(self):
         """
         Create the swappable insets
@@ -302,11 +440,13 @@ class SkewApp(QWidget):
         if self.model == "SREF":
             self.profs[self.current_idx][0] = prof[0]
             self.prof = self.profs[self.current_idx][0]
+            ens_stats = self.ensembleStats()
             self.sound.setProf(self.prof, pcl=self.getParcelObj(self.prof, self.parcel_type), title=self.plot_title,
-                               brand=self.brand, proflist=self.profs[self.current_idx][:], dgz=self.dgz)
+                               brand=self.brand, ens_stats=ens_stats, dgz=self.dgz)
             self.hodo.setProf(self.prof.hght, self.prof.u, self.prof.v, prof=self.prof,
-                              proflist=self.profs[self.current_idx][:], parent=self)
+                              ens_stats=ens_stats, parent=self)
         else:
+            ens_stats = None
             self.profs[self.current_idx] = prof
             self.prof = self.profs[self.current_idx]
             self.sound.setProf(self.prof, pcl=self.getParcelObj(self.prof, self.parcel_type), title=self.plot_title,
@@ -335,6 +475,10 @@ class SkewApp(QWidget):
 
         for inset in self.insets.keys():
             self.insets[inset].setProf(self.prof)
+        self.insets["ENSEMBLE"].setStats(ens_stats, pending=self.current_idx in self.ens_tasks)
+
+        self.updateSeries()
+        self.updateSweep()
 
     @Slot(str)
     def resetProf(self, panel):
@@ -360,7 +504,7 @@ class SkewApp(QWidget):
         self.plot_title = self.getPlotTitle()
         if self.model == "SREF":
             self.sound.setProf(self.prof, pcl=self.prof.mupcl, title=self.plot_title, brand=self.brand,
-                               proflist=self.profs[self.current_idx][:], dgz=self.dgz)
+                               ens_stats=self.ens_stats.get(self.current_idx, None), dgz=self.dgz)
         else:
             self.sound.setProf(self.prof, pcl=pcl, title=self.plot_title, brand=self.brand,
                                dgz=self.dgz, proflist=self.proflist)
@@ -421,29 +565,133 @@ class SkewApp(QWidget):
         self.grid.addWidget(self.sound, 0, 0, 3, 1)
         self.grid.addWidget(self.text, 3, 0, 1, 2)
 
+    def addProfile(self, idx, prof):
+        """
+        Fill in a profile that was still being computed. If the user already
+        tried to step to it, show it now.
+        """
+        self.prof_tasks.pop(idx, None)
+        self.profs[idx] = prof
+        self.original_profs[idx] = prof
+        self.touchProfile(idx)
+
+        if self.pending_idx == idx:
+            self.pending_idx = None
+            self.stepTo(idx)
+        self.evictProfiles()
+
+    def touchProfile(self, idx):
+        self.prof_lru.pop(idx, None)
+        self.prof_lru[idx] = True
+
+    def requestProfile(self, idx, urgent=False):
+        """
+        Start computing the profile at idx in the background, if it isn't
+        there already. Urgent requests (the profile the user is waiting on)
+        go ahead of the prefetching.
+        """
+        if self.loader is None or self.profs[idx] is not None:
+            return
+
+        if idx in self.prof_tasks:
+            task_id, was_urgent = self.prof_tasks[idx]
+            if was_urgent or not urgent:
+                return
+            self.async.cancel(task_id)
+
+        def finish(ret):
+            if isinstance(ret[0], Exception):
+                self.prof_tasks.pop(idx, None)
+            else:
+                self.addProfile(idx, ret[0])
+
+        priority = self.async.PRIORITY_INTERACTIVE if urgent else self.async.PRIORITY_PREFETCH
+        task_id = self.async.post(self.loader, finish, idx, __priority__=priority)
+        self.prof_tasks[idx] = (task_id, urgent)
+
+    def prefetch(self):
+        """
+        Compute the profiles the user is likely to step to next (mostly in the
+        direction they've been stepping) and drop any queued work for the
+        ones they've stepped away from.
+        """
+        if self.loader is None:
+            return
+
+        length = len(self.profs)
+        center = self.current_idx if self.pending_idx is None else self.pending_idx
+        window = [ (center + self.direction * step) % length for step in xrange(min(self.cache_size - 1, length)) ]
+        window.append((center - self.direction) % length)
+
+        for idx in self.prof_tasks.keys():
+            if idx not in window:
+                self.async.cancel(self.prof_tasks.pop(idx)[0])
+
+        for idx in window:
+            self.requestProfile(idx, urgent=(idx == self.pending_idx))
+
+    def evictProfiles(self):
+        """
+        Drop the least recently used profiles until at most cache_size are
+        left. The current profile and any the user has modified are kept.
+        """
+        if self.loader is None:
+            return
+
+        keep = [ self.current_idx, self.pending_idx ]
+        while len(self.prof_lru) > self.cache_size:
+            for idx in self.prof_lru.iterkeys():
+                if idx not in keep and not (self.modified_skew[idx] or self.modified_hodo[idx]):
+                    break
+            else:
+                break
+
+            del self.prof_lru[idx]
+            self.ens_stats.pop(idx, None)
+            if idx in self.ens_tasks:
+                self.async.cancel(self.ens_tasks.pop(idx))
+            self.profs[idx] = None
+            self.original_profs[idx] = None
+
+    def stepTo(self, idx):
+        """
+        Show the profile at idx. If it hasn't been computed yet, stay on
+        the current one and jump to it when it arrives.
+        """
+        if self.profs[idx] is None:
+            self.pending_idx = idx
+            self.prefetch()
+            return
+
+        self.pending_idx = None
+        self.current_idx = idx
+        self.touchProfile(idx)
+        self.parcel_types = self.convective.pcl_types
+        self.updateProfs(self.profs[self.current_idx], 'none', False)
+        self.updateSARS("")
+        self.insets['SARS'].clearSelection()
+        self.prefetch()
+
     def keyPressEvent(self, e):
         key = e.key()
         length = len(self.profs)
+        idx = self.current_idx if self.pending_idx is None else self.pending_idx
         if key == Qt.Key_Right:
-            if self.current_idx != length - 1:
-                self.current_idx += 1
-            else:
-                self.current_idx = 0
-            self.parcel_types = self.convective.pcl_types
-            self.updateProfs(self.profs[self.current_idx], 'none', False)
-            self.updateSARS("")
-            self.insets['SARS'].clearSelection()
+            self.direction = 1
+            self.stepTo((idx + 1) % length)
             return
 
         if key == Qt.Key_Left:
-            if self.current_idx != 0:
-                self.current_idx -= 1
-            elif self.current_idx == 0:
-                self.current_idx = length -1
-            self.parcel_types = self.convective.pcl_types
-            self.updateProfs(self.profs[self.current_idx], 'none', False)
-            self.updateSARS("")
-            self.insets['SARS'].clearSelection()
+            self.direction = -1
+            self.stepTo((idx - 1) % length)
+            return
+
+        if key == Qt.Key_T:
+            self.showTimeSeries()
+            return
+
+        if key == Qt.Key_W:
+            self.showSweep()
             return
 
         if e.matches(QKeySequence.Save):
@@ -451,10 +699,116 @@ class SkewApp(QWidget):
             self.saveimage()
             return
 
+    def seriesProfiles(self):
+        """
+        The profiles for the time-height sections and time series: the ones
+        the user has modified, and the raw profiles everywhere else (so the
+        rest of the run doesn't have to be fully computed).
+        """
+        profs = []
+        for idx, raw_prof in enumerate(self.raw_profs):
+            if self.modified_skew[idx] or self.modified_hodo[idx]:
+                profs.append(self.profs[idx])
+            else:
+                profs.append(raw_prof)
+        return profs
+
+    def showTimeSeries(self):
+        """
+        Open the time-height window for the model run. Only available for
+        deterministic runs with more than one time.
+        """
+        if self.raw_profs is None or self.model == "SREF" or len(self.raw_profs) < 2:
+            return
+
+        if self.series_window is None:
+            self.series_window = TimeHeightWindow(current_idx=self.current_idx, fhours=self.fhour)
+        self.series_window.show()
+        self.series_window.raise_()
+        self.updateSeries()
+
+    def updateSeries(self):
+        """
+        Recompute the time-height sections and time series (only the times
+        that changed are redone) and update the window, if it's open.
+        """
+        if self.series_window is None or not self.series_window.isVisible():
+            return
+
+        profs = self.seriesProfiles()
+        current_idx = self.current_idx
+
+        def finish(ret):
+            self.series_task = None
+            if not isinstance(ret[0], Exception) and self.series_window is not None:
+                self.series_window.setSeries(self.run_series.snapshot(), current_idx=current_idx, fhours=self.fhour)
+
+        if self.series_task is not None:
+            self.async.cancel(self.series_task)
+
+        if self.async is None:
+            self.run_series.update(profs, self.dates)
+            finish((None,))
+        else:
+            self.series_task = self.async.post(self.run_series.update, finish, profs, self.dates)
+
+    def showSweep(self):
+        """
+        Open the surface temperature and dewpoint sensitivity table for the
+        current profile.
+        """
+        if self.sweep_window is None:
+            self.sweep_window = SurfaceSweepWindow()
+        self.sweep_window.show()
+        self.sweep_window.raise_()
+        self.updateSweep()
+
+    def updateSweep(self):
+        """
+        Recompute the surface temperature and dewpoint sensitivity table for
+        the current profile and update the window, if it's open.
+        """
+        if self.sweep_window is None or not self.sweep_window.isVisible():
+            return
+
+        prof = self.prof
+
+        def finish(ret):
+            self.sweep_task = None
+            if not isinstance(ret[0], Exception) and self.sweep_window is not None:
+                self.sweep_window.setSweeps(prof, *ret)
+
+        if self.sweep_task is not None:
+            self.async.cancel(self.sweep_task)
+
+        if self.async is None:
+            finish(computeSweeps(prof))
+        else:
+            self.sweep_task = self.async.post(computeSweeps, finish, prof)
+
     def closeEvent(self, e):
         self.config.write(open(SkewApp.cfg_file_name, 'w'))
         self.sound.closeEvent(e)
 
+        for task_id, urgent in self.prof_tasks.itervalues():
+            self.async.cancel(task_id)
+        self.prof_tasks = {}
+        for task_id in self.ens_tasks.itervalues():
+            self.async.cancel(task_id)
+        self.ens_tasks = {}
+
+        if self.series_task is not None:
+            self.async.cancel(self.series_task)
+            self.series_task = None
+        if self.series_window is not None:
+            self.series_window.close()
+
+        if self.sweep_task is not None:
+            self.async.cancel(self.sweep_task)
+            self.sweep_task = None
+        if self.sweep_window is not None:
+            self.sweep_window.close()
+
     def makeInsetMenu(self, *exclude):
 
         # This will make the menu of the available insets.
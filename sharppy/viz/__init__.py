@@ -19,5 +19,10 @@ from ship import *
 from stpef import *
 from vrot import *
 from map import *
+from timeheight import *
+from sweep import *
+from uncertainty import *
+from ensemble import *
 from SPCWindow import *
+from render import *
 __all__ = []
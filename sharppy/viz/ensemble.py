@@ -0,0 +1,48 @@
+import sharppy.sharptab as tab
+from sharppy.viz.uncertainty import plotUncertainty
+
+__all__ = ['plotEnsemble']
+
+## The rows of the table, as (label, parameter name, format)
+ENSEMBLE_ROWS = [
+    ('SBCAPE', 'sbcape', tab.utils.INT2STR),
+    ('SBCINH', 'sbcinh', tab.utils.INT2STR),
+    ('SBLCL', 'sblcl', tab.utils.INT2STR),
+    ('MLCAPE', 'mlcape', tab.utils.INT2STR),
+    ('MLCINH', 'mlcinh', tab.utils.INT2STR),
+    ('MLLCL', 'mllcl', tab.utils.INT2STR),
+    ('0-6km Shr', 'shr06', tab.utils.INT2STR),
+]
+
+class plotEnsemble(plotUncertainty):
+    '''
+    Plot the percentiles of the parameters over the members of an ensemble
+    (see sharppy.sharptab.ensemble.EnsembleStats), in the same table as the
+    parameter uncertainty inset. The statistics don't come from the profile,
+    so they're set with setStats().
+    '''
+    title = 'Ensemble Spread'
+    subtitle = '(members; percentiles)'
+    rows = ENSEMBLE_ROWS
+    no_data = 'No Ensemble Data'
+
+    def __init__(self, prof):
+        super(plotEnsemble, self).__init__(prof)
+        self.pctls = None
+
+    def setProf(self, prof):
+        self.redraw()
+
+    def setStats(self, ens_stats, pending=False):
+        '''
+        Show the statistics for the members at the current time. If they're
+        None and pending is True, they're still being computed.
+        '''
+        if ens_stats is None:
+            self.pctls = None
+            self.subtitle = plotEnsemble.subtitle
+            self.no_data = 'Computing Ensemble Statistics...' if pending else plotEnsemble.no_data
+        else:
+            self.pctls = ens_stats.percentiles
+            self.subtitle = '(%d members; percentiles)' % len(ens_stats.members['sbcape'])
+        self.redraw()
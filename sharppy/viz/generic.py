@@ -5,6 +5,7 @@ __all__ = ['backgroundGeneric', 'plotGeneric']
 import numpy as np
 from sharppy.sharptab.constants import *
 import sharppy.sharptab as tab
+from sharppy.viz.paths import array_to_path
 from PySide import QtGui, QtCore
 from PySide.QtGui import *
 from PySide.QtCore import *
@@ -332,8 +333,6 @@ class plotGeneric(backgroundGeneric):
         pen = QtGui.QPen(QtGui.QColor(self.color), self.width)
         pen.setStyle(QtCore.Qt.SolidLine)
         qp.setPen(pen)
-        ## initialize a painter path
-        path = QPainterPath()
 
         ## get the data mask if there is one
         try:
@@ -348,21 +347,12 @@ class plotGeneric(backgroundGeneric):
             y = self.y
             x = self.x
 
-        ## start the path at the first data value
-        path.moveTo(self.x_to_pix(x[0]), self.y_to_pix(y[0]))
-        ## now we need to loop through the array
-        for i in xrange( 1, y.shape[0] ):
-            ## make sure we are plotting in our minimum and maximum bounds
-            if y[i] > self.ymin and y[i] < self.ymax:
-                xp = x[i]; yp = y[i]
-                ## convert from unit space to pixel space
-                x1 = self.x_to_pix(xp)
-                y1 = self.y_to_pix(yp)
-                ## set the pen and draw a line between the two points
-                path.lineTo(x1, y1)
-
-            ## if we are outside our bounds, stop drawing
-            else:
-                continue
-        qp.drawPath(path)
+        ## start the path at the first data value, then skip any values
+        ## outside our minimum and maximum bounds
+        in_bounds = np.array((y > self.ymin) & (y < self.ymax), dtype=bool)
+        in_bounds[0] = True
+        x = x[in_bounds]
+        y = y[in_bounds]
+        ## convert from unit space to pixel space and draw the line
+        qp.drawPath(array_to_path(self.x_to_pix(x), self.y_to_pix(y)))
 
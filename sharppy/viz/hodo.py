@@ -3,6 +3,7 @@ from PySide import QtGui, QtCore
 import sharppy.sharptab as tab
 from sharppy.sharptab.profile import Profile, create_profile
 from sharppy.sharptab.constants import *
+from sharppy.viz.paths import array_to_path
 from PySide.QtGui import *
 from PySide.QtCore import *
 
@@ -320,6 +321,7 @@ class plotHodo(backgroundHodo):
 
         self.prof = kwargs.get('prof', None)
         self.proflist = kwargs.get("proflist", [])
+        self.ens_stats = kwargs.get('ens_stats', None)
         self.original_prof = self.prof
 
         self.centered = kwargs.get('centered', (0,0))
@@ -439,6 +441,7 @@ class plotHodo(backgroundHodo):
         ## provide the profile.
         self.prof = kwargs.get('prof', None)
         self.proflist = kwargs.get("proflist", [])
+        self.ens_stats = kwargs.get('ens_stats', None)
 #       self.centered = kwargs.get('centered', self.centered)
         self.srwind = self.prof.srwind
         self.ptop = self.prof.etop
@@ -921,8 +924,11 @@ class plotHodo(backgroundHodo):
         qp.begin(self.plotBitMap)
         qp.setRenderHint(qp.Antialiasing)
         qp.setRenderHint(qp.TextAntialiasing)
-        for prof in self.proflist:
-            self.draw_profile(prof, qp)
+        if self.ens_stats is not None:
+            self.draw_envelope(qp)
+        else:
+            for prof in self.proflist:
+                self.draw_profile(prof, qp)
         ## draw the hodograph
         self.draw_hodo(qp)
         ## draw the storm motion vector
@@ -1172,13 +1178,46 @@ class plotHodo(backgroundHodo):
             pen.setStyle(QtCore.Qt.SolidLine)
             qp.setPen(pen)
 
-            path = QPainterPath()
-            path.moveTo(seg_x[idx], seg_y[idx])
-            for z_idx in xrange(seg_idxs[idx] + 1, seg_idxs[idx + 1]):
-                path.lineTo(xx[z_idx], yy[z_idx])
-            path.lineTo(seg_x[idx + 1], seg_y[idx + 1])
+            seg_xs = np.ma.concatenate(([ seg_x[idx] ], xx[seg_idxs[idx] + 1:seg_idxs[idx + 1]], [ seg_x[idx + 1] ]))
+            seg_ys = np.ma.concatenate(([ seg_y[idx] ], yy[seg_idxs[idx] + 1:seg_idxs[idx + 1]], [ seg_y[idx + 1] ]))
+            qp.drawPath(array_to_path(seg_xs, seg_ys))
+
+    def draw_envelope(self, qp, color="#6666CC"):
+        '''
+        Plot the spread of the ensemble winds as a shaded envelope: the union
+        of ellipses around the mean wind at each height, with the standard
+        deviations of u and v as the semi-axes. The median hodograph is drawn
+        on top as a thin line.
+
+        Parameters
+        ----------
+        qp: QtGui.QPainter object
+
+        '''
+        stats = self.ens_stats
+        mask = np.ma.getmaskarray(stats.u['mean']) | np.ma.getmaskarray(stats.v['mean']) | \
+            np.ma.getmaskarray(stats.u['spread']) | np.ma.getmaskarray(stats.v['spread'])
+        cx, cy = self.uv_to_pix(stats.u['mean'][~mask], stats.v['mean'][~mask])
+        ## The semi-axes in pixels
+        rx = stats.u['spread'][~mask] * self.scale
+        ry = stats.v['spread'][~mask] * self.scale
+
+        path = QPainterPath()
+        path.setFillRule(Qt.WindingFill)
+        for x, y, sx, sy in zip(cx, cy, rx, ry):
+            path.addEllipse(QPointF(x, y), sx, sy)
+        fill = QtGui.QColor(color)
+        fill.setAlpha(90)
+        qp.setPen(Qt.NoPen)
+        qp.setBrush(QtGui.QBrush(fill))
+        qp.drawPath(path)
 
-            qp.drawPath(path)
+        pen = QtGui.QPen(QtGui.QColor(color), 1)
+        pen.setStyle(QtCore.Qt.SolidLine)
+        qp.setPen(pen)
+        qp.setBrush(Qt.NoBrush)
+        xx, yy = self.uv_to_pix(stats.u['median'], stats.v['median'])
+        qp.drawPath(array_to_path(xx, yy))
 
     def draw_profile(self, prof, qp, color="#6666CC"):
         '''
@@ -1216,10 +1255,6 @@ class plotHodo(backgroundHodo):
         seg_idxs = np.searchsorted(z, seg_bnds)
         for idx in xrange(len(seg_bnds) - 1):
 
-            path = QPainterPath()
-            path.moveTo(seg_x[idx], seg_y[idx])
-            for z_idx in xrange(seg_idxs[idx] + 1, seg_idxs[idx + 1]):
-                path.lineTo(xx[z_idx], yy[z_idx])
-            path.lineTo(seg_x[idx + 1], seg_y[idx + 1])
-
-            qp.drawPath(path)
\ No newline at end of file
+            seg_xs = np.ma.concatenate(([ seg_x[idx] ], xx[seg_idxs[idx] + 1:seg_idxs[idx + 1]], [ seg_x[idx + 1] ]))
+            seg_ys = np.ma.concatenate(([ seg_y[idx] ], yy[seg_idxs[idx] + 1:seg_idxs[idx + 1]], [ seg_y[idx + 1] ]))
+            qp.drawPath(array_to_path(seg_xs, seg_ys))
\ No newline at end of file
@@ -1,14 +1,54 @@
 
 import numpy as np
+import numpy.ma as ma
 import sharppy
+from sharppy.viz.paths import array_to_path
+from sharppy.io.map_params import StationParams, barnes_analysis, contour_segments
+from sharppy.io.decoder import CancelToken
 from PySide import QtGui, QtCore
 
 import sys, os
 import re
 import urllib2
+import cPickle
+from os.path import expanduser
+
+## The Douglas-Peucker tolerances (in map units) for the levels of detail for
+## the boundaries. The first is the full-resolution data.
+LOD_TOLERANCES = [ 0., 0.05, 0.2, 0.8 ]
+
+## Bump this when the cached geometry changes format.
+GEOMETRY_VERSION = 1
+
+## The colors for the parameter overlay. Stations below the lowest level get
+## the first color, stations between the first and second levels get the
+## second, and so on.
+PARAM_COLORS = [ '#555555', '#3399ff', '#00cc00', '#ffff00', '#ff9900', '#ff0000', '#ff00ff' ]
+
+## The levels for each parameter in the overlay (see
+## sharppy.io.map_params.MAP_PARAMS), which are also the contour levels
+PARAM_LEVELS = {
+    'MUCAPE':[ 100, 500, 1000, 2000, 3000, 4000 ],
+    'STP':[ 0.5, 1, 2, 4, 6, 8 ],
+    'SCP':[ 1, 2, 4, 8, 12, 16 ],
+    'SHIP':[ 0.5, 1, 1.5, 2, 3, 4 ],
+    '0-6 km Shear':[ 20, 30, 40, 50, 60, 70 ],
+    'PW':[ 0.5, 0.75, 1, 1.25, 1.5, 2 ],
+}
+
+## How to show each parameter's value in the station readout
+PARAM_FORMATS = {
+    'MUCAPE':"%d J/kg",
+    'STP':"%.1f",
+    'SCP':"%.1f",
+    'SHIP':"%.1f",
+    '0-6 km Shear':"%d kt",
+    'PW':"%.2f in",
+}
 
 class Mapper(object):
     data_dir = os.path.join(os.path.dirname(sharppy.__file__), 'databases', 'shapefiles')
+    cache_dir = os.path.join(expanduser('~'), '.sharppy', 'maps')
     min_lat = {'npstere':0., 'merc':-30., 'spstere':-90.}
     max_lat = {'npstere':90., 'merc':30., 'spstere':0.}
 
@@ -52,11 +92,14 @@ class Mapper(object):
         """
         Code shamelessly lifted from Basemap's data file parser by Jeff Whitaker.
         http://matplotlib.org/basemap/
+
+        Returns the projected points and the index in those arrays where each
+        line starts (plus the end of the last line).
         """
         bdatfile = open(os.path.join(Mapper.data_dir, name + '_' + res + '.dat'), 'rb')
         bdatmetafile = open(os.path.join(Mapper.data_dir, name + 'meta_' + res + '.dat'), 'r')
 
-        paths = [ ] 
+        all_xs, all_ys, all_breaks = [], [], []
 
         for line in bdatmetafile:
             lats, lons = [], []
@@ -85,33 +128,67 @@ class Mapper(object):
                 if len(idxs) < 2:
                     continue
 
-                segs = (np.diff(idxs) == 1)
-                try:
-                    breaks = np.where(segs == 0)[0] + 1
-                except IndexError:
-                    breaks = []
-                breaks = [ 0 ] + list(breaks) + [ -1 ]
- 
-                for idx in xrange(len(breaks) - 1):
-                    if breaks[idx + 1] == -1:
-                        seg_idxs = idxs[breaks[idx]:]
-                    else:
-                        seg_idxs = idxs[breaks[idx]:breaks[idx + 1]]
+                ## Break the line wherever points were skipped
+                breaks = np.ones(idxs.shape, dtype=bool)
+                breaks[1:] = (np.diff(idxs) != 1)
 
-                    path = QtGui.QPainterPath()
+                poly_xs, poly_ys = self(b[idxs, 1], b[idxs, 0])
+                all_xs.append(poly_xs)
+                all_ys.append(poly_ys)
+                all_breaks.append(breaks)
 
-                    poly_xs, poly_ys = self(b[seg_idxs, 1], b[seg_idxs, 0])
-                    if len(poly_xs) < 2 or len(poly_ys) < 2:
-                        continue
+        bdatfile.close()
+        bdatmetafile.close()
 
-                    path.moveTo(poly_xs[0], poly_ys[0])
-                    for px, py in zip(poly_xs, poly_ys)[1:]:
-                        path.lineTo(px, py)
+        if len(all_xs) == 0:
+            return np.zeros((0,)), np.zeros((0,)), np.zeros((1,), dtype=int)
 
-                    paths.append(path)
+        breaks = np.concatenate(all_breaks)
+        offsets = np.append(np.where(breaks)[0], len(breaks))
+        return np.concatenate(all_xs), np.concatenate(all_ys), offsets
 
-        return paths
+    def _cacheName(self, name, res):
+        return os.path.join(Mapper.cache_dir, "%s_%s_%s_%g_%g.pkl" % (name, res, self.proj, self.lambda_0, self.phi_0))
 
+    def loadGeometry(self, name, res):
+        """
+        Get the projected lines for a boundary file, along with which points
+        to keep at each level of detail. These are cached on disk (per
+        projection), so they're only computed the first time.
+        """
+        dat_stat = os.stat(os.path.join(Mapper.data_dir, name + '_' + res + '.dat'))
+        stamp = (GEOMETRY_VERSION, LOD_TOLERANCES, dat_stat.st_mtime, dat_stat.st_size)
+
+        cache_name = self._cacheName(name, res)
+        try:
+            cache_file = open(cache_name, 'rb')
+            geometry = cPickle.load(cache_file)
+            cache_file.close()
+            if geometry['stamp'] == stamp:
+                return geometry
+        except Exception:
+            pass
+
+        xs, ys, offsets = self._loadDat(name, res)
+        keep = {}
+        for tol in LOD_TOLERANCES:
+            keep[tol] = np.concatenate([ np.zeros((0,), dtype=bool) ] +
+                [ simplify_line(xs[start:end], ys[start:end], tol) for start, end in zip(offsets[:-1], offsets[1:]) ])
+        geometry = {'stamp':stamp, 'xs':xs, 'ys':ys, 'offsets':offsets, 'keep':keep}
+
+        # The cache is just a speedup, so don't worry if it can't be written.
+        try:
+            if not os.path.exists(Mapper.cache_dir):
+                os.makedirs(Mapper.cache_dir)
+            tmp_name = "%s.%d.tmp" % (cache_name, os.getpid())
+            cache_file = open(tmp_name, 'wb')
+            cPickle.dump(geometry, cache_file, cPickle.HIGHEST_PROTOCOL)
+            cache_file.close()
+            os.rename(tmp_name, cache_name)
+        except (IOError, OSError):
+            pass
+
+        return geometry
 
     def loadBoundary(self, name):
         if name == 'coastlines':
@@ -124,13 +201,169 @@ class Mapper(object):
         else:
             res = 'i'
 
-        bndy = self._loadDat(name, res)
+        bndy = BoundaryLayer(self.loadGeometry(name, res))
         return bndy
 
+def simplify_line(xs, ys, tol):
+    """
+    Simplify a line with the Douglas-Peucker algorithm.
+
+    Parameters
+    ----------
+    xs, ys : numpy arrays
+    The points on the line
+    tol : number
+    The farthest a point can be from the simplified line and still be left out
+
+    Returns
+    -------
+    A boolean array that's True for the points to keep
+    """
+    keep = np.ones(xs.shape, dtype=bool)
+    if tol <= 0 or len(xs) < 3:
+        return keep
+
+    keep[1:-1] = False
+    stack = [ (0, len(xs) - 1) ]
+    while len(stack) > 0:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        line_x, line_y = xs[end] - xs[start], ys[end] - ys[start]
+        pt_x, pt_y = xs[(start + 1):end] - xs[start], ys[(start + 1):end] - ys[start]
+        line_len = np.hypot(line_x, line_y)
+        if line_len == 0:
+            dists = np.hypot(pt_x, pt_y)
+        else:
+            dists = np.abs(pt_x * line_y - pt_y * line_x) / line_len
+
+        far_idx = np.argmax(dists)
+        if dists[far_idx] > tol:
+            mid = start + 1 + far_idx
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return keep
+
+class BoundaryLayer(object):
+    """
+    The paths for a boundary file at each level of detail. The lines are
+    grouped into tiles, so the map can skip drawing the ones off screen.
+    """
+    def __init__(self, geometry, n_tiles=8):
+        xs, ys, offsets = geometry['xs'], geometry['ys'], geometry['offsets']
+        line_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+        ## Put each line in the tile holding its first point
+        if len(xs) > 0:
+            starts = offsets[:-1]
+            x_tiles = self._tileIndex(xs[starts], xs.min(), xs.max(), n_tiles)
+            y_tiles = self._tileIndex(ys[starts], ys.min(), ys.max(), n_tiles)
+            tiles = (y_tiles * n_tiles + x_tiles)[line_ids]
+        else:
+            tiles = np.zeros((0,), dtype=int)
+
+        self._levels = []
+        for tol in sorted(geometry['keep'].iterkeys()):
+            keep = geometry['keep'][tol]
+            ## Lines simplified down to a single point aren't drawn at all.
+            keep_lines = np.bincount(line_ids[keep], minlength=len(offsets) - 1) >= 2
+            keep = keep & keep_lines[line_ids]
+
+            lvl_ids = line_ids[keep]
+            breaks = np.ones(lvl_ids.shape, dtype=bool)
+            breaks[1:] = (lvl_ids[1:] != lvl_ids[:-1])
+
+            lvl_xs, lvl_ys, lvl_tiles = xs[keep], ys[keep], tiles[keep]
+            paths = []
+            for tile in np.unique(lvl_tiles):
+                in_tile = (lvl_tiles == tile)
+                paths.append(array_to_path(lvl_xs[in_tile], lvl_ys[in_tile], breaks=breaks[in_tile]))
+            self._levels.append((tol, paths))
+
+    def _tileIndex(self, vals, vmin, vmax, n_tiles):
+        if vmax == vmin:
+            return np.zeros(vals.shape, dtype=int)
+        return np.minimum(((vals - vmin) / (vmax - vmin) * n_tiles).astype(int), n_tiles - 1)
+
+    def getPaths(self, scale, max_error=0.5):
+        """
+        Get the coarsest paths that are still within max_error pixels of the
+        full-resolution lines when drawn at the given map scale.
+        """
+        paths = self._levels[0][1]
+        for tol, lvl_paths in self._levels:
+            if tol <= max_error * scale:
+                paths = lvl_paths
+        return paths
+
+class GridIndex(object):
+    """
+    A uniform grid over a set of points, for finding the points near a
+    location or inside a rectangle without checking every one of them.
+    Points with non-finite coordinates are left out.
+    """
+    def __init__(self, xs, ys, cell_size=5.):
+        self._xs = np.asarray(xs, dtype=float)
+        self._ys = np.asarray(ys, dtype=float)
+        self._cell_size = cell_size
+
+        cells = {}
+        good = np.where(np.isfinite(self._xs) & np.isfinite(self._ys))[0]
+        cell_xs = np.floor(self._xs[good] / cell_size).astype(int)
+        cell_ys = np.floor(self._ys[good] / cell_size).astype(int)
+        for idx, cell_x, cell_y in zip(good, cell_xs, cell_ys):
+            cells.setdefault((cell_x, cell_y), []).append(idx)
+        self._cells = dict( (cell, np.array(idxs, dtype=int)) for cell, idxs in cells.iteritems() )
+
+    def queryRect(self, x_min, y_min, x_max, y_max):
+        """
+        Find the points inside a rectangle.
+
+        Returns
+        -------
+        A sorted array of point indexes
+        """
+        cx_min, cx_max = int(np.floor(x_min / self._cell_size)), int(np.floor(x_max / self._cell_size))
+        cy_min, cy_max = int(np.floor(y_min / self._cell_size)), int(np.floor(y_max / self._cell_size))
+
+        if (cx_max - cx_min + 1) * (cy_max - cy_min + 1) > len(self._cells):
+            cells = [ c for c in self._cells.iterkeys() if cx_min <= c[0] <= cx_max and cy_min <= c[1] <= cy_max ]
+        else:
+            cells = [ (cx, cy) for cx in xrange(cx_min, cx_max + 1) for cy in xrange(cy_min, cy_max + 1) ]
+
+        idxs = [ self._cells[c] for c in cells if c in self._cells ]
+        if len(idxs) == 0:
+            return np.zeros((0,), dtype=int)
+
+        idxs = np.concatenate(idxs)
+        xs, ys = self._xs[idxs], self._ys[idxs]
+        inside = (xs >= x_min) & (xs <= x_max) & (ys >= y_min) & (ys <= y_max)
+        return np.sort(idxs[inside])
+
+    def nearest(self, x, y, radius):
+        """
+        Find the closest point to (x, y) that's within radius of it.
+
+        Returns
+        -------
+        The index of the point, or None if there isn't one
+        """
+        idxs = self.queryRect(x - radius, y - radius, x + radius, y + radius)
+        if len(idxs) == 0:
+            return None
+
+        dists = np.hypot(self._xs[idxs] - x, self._ys[idxs] - y)
+        closest = np.argmin(dists)
+        if dists[closest] > radius:
+            return None
+        return idxs[closest]
+
 class MapWidget(QtGui.QWidget):
     clicked = QtCore.Signal(dict)
 
-    def __init__(self, data_source, init_time, async, **kwargs):
+    def __init__(self, data_source, init_time, async, params=None, **kwargs):
         super(MapWidget, self).__init__(**kwargs)
         self.scale = 0.60
         self.trans_x, self.trans_y = 0., 0.
@@ -145,6 +378,10 @@ class MapWidget(QtGui.QWidget):
         self.stn_lats = np.array([])
         self.stn_lons = np.array([])
         self.stn_ids = []
+        self.stn_xs = np.array([])
+        self.stn_ys = np.array([])
+        self.stn_in_bounds = np.array([], dtype=bool)
+        self.stn_index = GridIndex([], [])
         self.stn_names = []
 
         self.default_width, self.default_height = 800, 800
@@ -164,7 +401,19 @@ class MapWidget(QtGui.QWidget):
         self.load_readout.show()
         self.load_readout.move(self.width(), self.height())
 
+        ## The parameter overlay (see setParameter()). The StationParams object
+        ## can be shared with other widgets; one is made when it's needed if
+        ## not given.
+        self.params = params
+        self.param = None
+        self.fhour = 0
+        self.param_values = {}
+        self.param_pending = set()
+        self._param_task = None
+        self._contours = []
+
         self.async = async
+        self._points_task = None
         self.setDataSource(data_source, init_time, init=True)
 
 #       self.setGeometry(300, 300, self.default_width, self.default_height)
@@ -172,6 +421,22 @@ class MapWidget(QtGui.QWidget):
 
         self.map_center_x, self.map_center_y = self.width() / 2, -8 * self.height() / 10
 
+        ## The grid and boundaries are drawn into an oversized layer that's
+        ## reused (just shifted) while the map is panned; see drawMap().
+        self.layerBitMap = None
+        self.layer_dirty = True
+        self.zoom_timer = QtCore.QTimer(self)
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.setInterval(150)
+        self.zoom_timer.timeout.connect(self.finishZoom)
+
+        ## The contours are redone at most every so often as the parameter
+        ## values come in.
+        self.contour_timer = QtCore.QTimer(self)
+        self.contour_timer.setSingleShot(True)
+        self.contour_timer.setInterval(250)
+        self.contour_timer.timeout.connect(self.finishContours)
+
         self.initMap()
         self.initUI()
 
@@ -182,19 +447,23 @@ class MapWidget(QtGui.QWidget):
         self.drawMap()
 
     def initMap(self):
-        self._coast_path = self.mapper.loadBoundary('coastlines')
-        self._country_path = self.mapper.loadBoundary('countries')
-        self._state_path = self.mapper.loadBoundary('states')
-        self._county_path = self.mapper.loadBoundary('uscounties')
-
-        path = QtGui.QPainterPath()
-        for lon in xrange(0, 360, 20):
-            lats = np.linspace(0, 90, 2)
-            lx, ly = self.mapper(lats, lon)
-
-            path.moveTo(lx[0], ly[0])
-            for x, y in zip(lx, ly)[1:]:
-                path.lineTo(x, y)
+        ## Load the boundaries in the background, biggest features first, and
+        ## draw each one as it comes in.
+        self._boundaries = {}
+        for name in [ 'coastlines', 'countries', 'states', 'uscounties' ]:
+            def update(ret, name=name):
+                if not isinstance(ret[0], Exception):
+                    self._boundaries[name] = ret[0]
+                    self.layer_dirty = True
+                    self.drawMap()
+                    self.update()
+
+            self.async.post(self.mapper.loadBoundary, update, name, __priority__=self.async.PRIORITY_PREFETCH)
+
+        lons = np.repeat(np.arange(0, 360, 20), 2)
+        lats = np.tile(np.linspace(0, 90, 2), len(lons) / 2)
+        lx, ly = self.mapper(lats, lons)
+        path = array_to_path(lx, ly, breaks=(lats == 0))
 
         for lat in xrange(0, 90, 15):
             lons = np.arange(self.mapper.getLambda0(), self.mapper.getLambda0() + 360, 90)
@@ -213,9 +482,12 @@ class MapWidget(QtGui.QWidget):
         self.clicked_stn = None
         self.clicked.emit(None)
 
+        self.load_readout.setText("Loading ...")
+        self.load_readout.setFixedWidth(100)
         self.load_readout.move(10, self.height() - 25)
 
-        getPoints = lambda: self.cur_source.getAvailableAtTime(self.current_time)
+        cur_source, cur_time = self.cur_source, self.current_time
+        getPoints = lambda: cur_source.getAvailableAtTime(cur_time)
 
         def update(points):
             self.points = points[0]
@@ -223,6 +495,7 @@ class MapWidget(QtGui.QWidget):
             self.stn_lats = np.array([ p['lat'] for p in self.points ])
             self.stn_lons = np.array([ p['lon'] for p in self.points ])
             self.stn_ids = [ p['srcid'] for p in self.points ]
+            self.projectStations()
             self.stn_names = []
             for p in self.points:
                 if p['icao'] != "":
@@ -245,6 +518,7 @@ class MapWidget(QtGui.QWidget):
             self.load_readout.move(self.width(), self.height())
 
             if not init:
+                self.loadParameters()
                 self.drawMap()
                 self.update()
 
@@ -252,21 +526,257 @@ class MapWidget(QtGui.QWidget):
             points = getPoints()
             update([ points ])
         else:
-            self.async.post(getPoints, update)
+            # If the user has moved on from the cycle we were loading, there's no
+            #   point in finishing that load.
+            if self._points_task is not None:
+                self.async.cancel(self._points_task)
+            self._points_task = self.async.post(getPoints, update,
+                __key__=('points', cur_source.getName(), cur_time))
+
+    def setParameter(self, param, fhour=None):
+        """
+        Show a parameter for every station on the map.
+
+        Parameters
+        ----------
+        param : string
+        One of the names in sharppy.io.map_params.MAP_PARAMS, or None to just
+        show the stations
+        fhour : int (optional)
+        The forecast hour to show (defaults to the current one)
+        """
+        self.param = param
+        if fhour is not None:
+            self.fhour = fhour
+        self.loadParameters()
+        self.drawMap()
+        self.update()
+
+    def setForecastHour(self, fhour):
+        self.fhour = fhour
+        if self.param is not None:
+            self.loadParameters()
+            self.drawMap()
+            self.update()
+
+    def paramKey(self):
+        fcst_hours = self.cur_source.getForecastHours()
+        if self.fhour not in fcst_hours:
+            self.fhour = fcst_hours[0]
+        return (self.cur_source.getName(), self.current_time, self.fhour)
+
+    def loadParameters(self):
+        """
+        Start computing the overlay parameter for all the stations that
+        aren't in the cache yet. They're done in small batches, one after the
+        other, starting with the stations in view, and the map is updated as
+        each batch comes in.
+        """
+        if self._param_task is not None:
+            self.async.cancel(self._param_task)
+            self._param_task = None
+
+        self.param_values = {}
+        self.param_pending = set()
+        if self.param is not None:
+            if self.params is None:
+                self.params = StationParams()
+
+            self.param_values = self.params.get(self.paramKey())
+            self.param_pending = set( idx for idx, srcid in enumerate(self.stn_ids) if srcid not in self.param_values )
+
+        self.contourStations()
+        self.loadParameterBatch()
+
+    def loadParameterBatch(self, batch_size=16):
+        if len(self.param_pending) == 0:
+            self._param_task = None
+            self.load_readout.move(self.width(), self.height())
+            return
+
+        map_x_min, map_y_min = self.pixToMap(0, 0)
+        map_x_max, map_y_max = self.pixToMap(self.width(), self.height())
+        visible = self.stn_index.queryRect(map_x_min, map_y_min, map_x_max, map_y_max)
+        batch = [ idx for idx in visible if idx in self.param_pending ][:batch_size]
+        if len(batch) < batch_size:
+            batch += sorted(self.param_pending.difference(batch))[:(batch_size - len(batch))]
+
+        n_stns = len(self.stn_ids)
+        self.load_readout.setText("Computing %s (%d/%d)" % (self.param, n_stns - len(self.param_pending), n_stns))
+        self.load_readout.setFixedWidth(240)
+        self.load_readout.move(10, self.height() - 25)
+
+        key = self.paramKey()
+        points = [ self.points[idx] for idx in batch ]
+
+        def update(ret):
+            if key != self.paramKey():
+                return
+
+            if isinstance(ret[0], Exception):
+                # Couldn't even figure out where to get the data, so skip these.
+                self.param_values.update( (p['srcid'], None) for p in points )
+            else:
+                self.param_values.update(ret[0])
+            self.param_pending.difference_update(batch)
+
+            self.contour_timer.start()
+            self.loadParameterBatch()
+            self.drawMap()
+            self.update()
+
+        token = CancelToken()
+        self._param_task = self.async.post(self.params.compute, update, self.cur_source, points,
+            self.current_time, self.fhour, cancel=token, __token__=token,
+            __priority__=self.async.PRIORITY_PREFETCH, __key__=('params',) + key + (tuple(p['srcid'] for p in points),))
+
+    def stationValues(self, stn_idxs):
+        """
+        Get the overlay parameter for some stations (NaN where it's missing or
+        hasn't come in yet).
+        """
+        vals = np.empty((len(stn_idxs),))
+        for idx, stn_idx in enumerate(stn_idxs):
+            values = self.param_values.get(self.stn_ids[stn_idx], None)
+            val = None if values is None else values[self.param]
+            vals[idx] = np.nan if val is None else val
+        return vals
+
+    def contourStations(self):
+        """
+        Analyze the overlay parameter to a grid and contour it at the overlay
+        levels.
+        """
+        self._contours = []
+        if self.param is None or len(self.stn_ids) == 0:
+            return
+
+        stn_idxs = np.arange(len(self.stn_ids))
+        vals = self.stationValues(stn_idxs)
+        good = np.isfinite(vals) & self.stn_in_bounds
+        if good.sum() < 3:
+            return
+
+        xs, ys, vals = self.stn_xs[good], self.stn_ys[good], vals[good]
+        n_cells = 100
+        cell_size = max(xs.max() - xs.min(), ys.max() - ys.min()) / n_cells
+        grid_xs = np.arange(xs.min(), xs.max() + cell_size, cell_size)
+        grid_ys = np.arange(ys.min(), ys.max() + cell_size, cell_size)
+        grid = barnes_analysis(xs, ys, vals, grid_xs, grid_ys)
+
+        for level, color in zip(PARAM_LEVELS[self.param], PARAM_COLORS[1:]):
+            x0s, y0s, x1s, y1s = contour_segments(grid_xs, grid_ys, grid, level)
+            if len(x0s) == 0:
+                continue
+
+            seg_xs = np.column_stack((x0s, x1s)).ravel()
+            seg_ys = np.column_stack((y0s, y1s)).ravel()
+            breaks = np.tile([ True, False ], len(x0s))
+            self._contours.append((color, array_to_path(seg_xs, seg_ys, breaks=breaks)))
+
+    def finishContours(self):
+        self.contourStations()
+        self.drawMap()
+        self.update()
+
+    def projectStations(self):
+        ## Project the stations once and index them in map coordinates.
+        ##   Stations outside the projection's latitude bounds aren't indexed.
+        self.stn_xs, self.stn_ys = self.mapper(self.stn_lats, self.stn_lons)
+        lb_lat, ub_lat = self.mapper.getLatBounds()
+        self.stn_in_bounds = (self.stn_lats >= lb_lat) & (self.stn_lats <= ub_lat)
+        self.stn_index = GridIndex(np.where(self.stn_in_bounds, self.stn_xs, np.nan),
+            np.where(self.stn_in_bounds, self.stn_ys, np.nan))
+
+    def pixToMap(self, x, y):
+        """
+        Convert a pixel location to map coordinates (the inverse of the
+        current transform).
+        """
+        return (x - self.transform.dx()) / self.transform.m11(), (y - self.transform.dy()) / self.transform.m22()
+
+    def findStation(self, x, y, radius=5):
+        """
+        Find the index of the station closest to a pixel location, if there's
+        one within radius pixels.
+        """
+        map_x, map_y = self.pixToMap(x, y)
+        return self.stn_index.nearest(map_x, map_y, radius * self.scale)
+
+    def drawMap(self, quick=False):
+        """
+        Draw the map. The background layers come from the cached layer
+        pixmap, which is only redrawn when the view moves off of it, the
+        scale changes, or new boundaries come in. The stations are drawn on
+        top every time.
+
+        If quick is True, a layer drawn at another scale is stretched to fit
+        instead of being redrawn (e.g. while the user is still zooming).
+        """
+        map_center_x = self.map_center_x + self.trans_x
+        map_center_y = self.map_center_y + self.trans_y
+
+        if not self.layerValid(map_center_x, map_center_y, quick):
+            self.drawLayers(map_center_x, map_center_y)
 
-    def drawMap(self):
         qp = QtGui.QPainter()
         qp.begin(self.plotBitMap)
 
         self.plotBitMap.fill(QtCore.Qt.black)
 
-        map_center_x = self.map_center_x + self.trans_x
-        map_center_y = self.map_center_y + self.trans_y
+        layer_scale = self.layer_scale / self.scale
+        qp.translate(map_center_x, map_center_y)
+        qp.scale(layer_scale, layer_scale)
+        qp.translate(-self.layer_center_x - self.layer_margin_x, -self.layer_center_y - self.layer_margin_y)
+        qp.drawPixmap(0, 0, self.layerBitMap)
+        qp.resetTransform()
 
         qp.translate(map_center_x, map_center_y)
         qp.scale(1. / self.scale, 1. / self.scale)
         self.transform = qp.transform()
-        window_rect = QtCore.QRect(0, 0, self.width(), self.height())
+
+        for color, path in self._contours:
+            qp.setPen(QtGui.QPen(QtGui.QColor(color)))
+            qp.drawPath(path)
+
+        self.drawStations(qp)
+
+        if self.param is not None:
+            qp.resetTransform()
+            self.drawLegend(qp)
+        qp.end()
+
+    def layerValid(self, map_center_x, map_center_y, quick=False):
+        if self.layerBitMap is None or self.layer_dirty:
+            return False
+        if self.layer_size != (self.width(), self.height()):
+            return False
+        if self.layer_scale != self.scale:
+            return quick
+
+        return abs(map_center_x - self.layer_center_x) <= self.layer_margin_x and \
+            abs(map_center_y - self.layer_center_y) <= self.layer_margin_y
+
+    def drawLayers(self, map_center_x, map_center_y):
+        """
+        Draw the grid and boundaries into the layer pixmap, which extends half
+        the window size past each edge of the window.
+        """
+        self.layer_size = (self.width(), self.height())
+        self.layer_margin_x, self.layer_margin_y = self.width() / 2, self.height() / 2
+        self.layer_center_x, self.layer_center_y = map_center_x, map_center_y
+        self.layer_scale = self.scale
+        self.layer_dirty = False
+
+        self.layerBitMap = QtGui.QPixmap(self.width() + 2 * self.layer_margin_x, self.height() + 2 * self.layer_margin_y)
+        self.layerBitMap.fill(QtCore.Qt.black)
+
+        qp = QtGui.QPainter()
+        qp.begin(self.layerBitMap)
+
+        qp.translate(map_center_x + self.layer_margin_x, map_center_y + self.layer_margin_y)
+        qp.scale(1. / self.scale, 1. / self.scale)
+        window_rect = QtCore.QRect(0, 0, self.layerBitMap.width(), self.layerBitMap.height())
 
         qp.setPen(QtGui.QPen(QtGui.QColor('#333333'))) #, self.scale, QtCore.Qt.DashLine
         qp.drawPath(self._grid_path)
@@ -285,55 +795,96 @@ class MapWidget(QtGui.QWidget):
             color = '#' + ("{0:02x}".format(int(round(comp)))) * 3
 
             qp.setPen(QtGui.QPen(QtGui.QColor(color)))
-            for cp in self._county_path:
-                if self.transform.mapRect(cp.boundingRect()).intersects(window_rect):
-                    qp.drawPath(cp)
+            self.drawBoundary('uscounties', qp, window_rect)
 
         qp.setPen(QtGui.QPen(QtGui.QColor('#999999')))
-        for sp in self._state_path:
-            if self.transform.mapRect(sp.boundingRect()).intersects(window_rect):
-                qp.drawPath(sp)
+        self.drawBoundary('states', qp, window_rect)
 
         qp.setPen(QtGui.QPen(QtCore.Qt.white))
-        for cp in self._coast_path:
-            if self.transform.mapRect(cp.boundingRect()).intersects(window_rect):
-                qp.drawPath(cp)
+        self.drawBoundary('coastlines', qp, window_rect)
+        self.drawBoundary('countries', qp, window_rect)
 
-        for cp in self._country_path:
-            if self.transform.mapRect(cp.boundingRect()).intersects(window_rect):
-                qp.drawPath(cp)
-
-        self.drawStations(qp)
         qp.end()
 
+    def drawBoundary(self, name, qp, window_rect):
+        if name not in self._boundaries:
+            return
+
+        transform = qp.transform()
+        for path in self._boundaries[name].getPaths(self.scale):
+            if transform.mapRect(path.boundingRect()).intersects(window_rect):
+                qp.drawPath(path)
+
     def drawStations(self, qp):
-        stn_xs, stn_ys = self.mapper(self.stn_lats, self.stn_lons)
-        lb_lat, ub_lat = self.mapper.getLatBounds()
         size = 3 * self.scale
 
         unselected_color = QtCore.Qt.red
         selected_color = QtCore.Qt.green
 
-        window_rect = QtCore.QRect(0, 0, self.width(), self.height())
-        clicked_x, clicked_y, clicked_lat, clicked_id = None, None, None, None
-        color = unselected_color
-        for stn_x, stn_y, stn_lat, stn_id in zip(stn_xs, stn_ys, self.stn_lats, self.stn_ids):
-            if self.clicked_stn == stn_id:
-                clicked_x = stn_x
-                clicked_y = stn_y
-                clicked_lat = stn_lat
-                clicked_id = stn_id
-            else:
-               if lb_lat <= stn_lat and stn_lat <= ub_lat and window_rect.contains(*self.transform.map(stn_x, stn_y)):
-                    qp.setPen(QtGui.QPen(color))
-                    qp.setBrush(QtGui.QBrush(color))
-                    qp.drawEllipse(QtCore.QPointF(stn_x, stn_y), size, size)
-        
-        color = selected_color
-        if lb_lat <= clicked_lat and clicked_lat <= ub_lat and window_rect.contains(*self.transform.map(clicked_x, clicked_y)):
+        map_x_min, map_y_min = self.pixToMap(0, 0)
+        map_x_max, map_y_max = self.pixToMap(self.width(), self.height())
+        visible = self.stn_index.queryRect(map_x_min, map_y_min, map_x_max, map_y_max)
+
+        clicked_idx = None
+        for stn_idx in visible:
+            if self.clicked_stn == self.stn_ids[stn_idx]:
+                clicked_idx = stn_idx
+
+        if self.param is None:
+            color = unselected_color
             qp.setPen(QtGui.QPen(color))
             qp.setBrush(QtGui.QBrush(color))
-            qp.drawEllipse(QtCore.QPointF(clicked_x, clicked_y), size, size)
+            for stn_idx in visible:
+                if stn_idx != clicked_idx:
+                    qp.drawEllipse(QtCore.QPointF(self.stn_xs[stn_idx], self.stn_ys[stn_idx]), size, size)
+        else:
+            ## Stations without a value (yet) are drawn as small open circles.
+            vals = self.stationValues(visible)
+            colors = np.where(np.isfinite(vals), np.searchsorted(PARAM_LEVELS[self.param], vals, side='right'), -1)
+
+            for color_idx in np.unique(colors):
+                if color_idx == -1:
+                    qp.setPen(QtGui.QPen(QtGui.QColor('#777777')))
+                    qp.setBrush(QtCore.Qt.NoBrush)
+                    stn_size = 0.67 * size
+                else:
+                    qp.setPen(QtGui.QPen(QtCore.Qt.black))
+                    qp.setBrush(QtGui.QBrush(QtGui.QColor(PARAM_COLORS[color_idx])))
+                    stn_size = 1.33 * size
+
+                for stn_idx in visible[colors == color_idx]:
+                    qp.drawEllipse(QtCore.QPointF(self.stn_xs[stn_idx], self.stn_ys[stn_idx]), stn_size, stn_size)
+
+        color = selected_color
+        if clicked_idx is not None:
+            qp.setPen(QtGui.QPen(color))
+            if self.param is None:
+                qp.setBrush(QtGui.QBrush(color))
+            else:
+                ## Keep the parameter color visible inside the selection ring
+                qp.setBrush(QtCore.Qt.NoBrush)
+                size *= 2
+            qp.drawEllipse(QtCore.QPointF(self.stn_xs[clicked_idx], self.stn_ys[clicked_idx]), size, size)
+
+    def drawLegend(self, qp):
+        levels = PARAM_LEVELS[self.param]
+        labels = [ "%g+" % lev for lev in levels ]
+        fm = qp.fontMetrics()
+        box_size = fm.height()
+        text_width = max([ fm.width(self.param) ] + [ fm.width(label) for label in labels ])
+
+        x = self.width() - text_width - box_size - 15
+        y = 10
+        qp.setPen(QtGui.QPen(QtCore.Qt.white))
+        qp.drawText(x, y + fm.ascent(), self.param)
+
+        for label, color in reversed(zip(labels, PARAM_COLORS[1:])):
+            y += box_size + 2
+            qp.setPen(QtGui.QPen(QtCore.Qt.black))
+            qp.setBrush(QtGui.QBrush(QtGui.QColor(color)))
+            qp.drawRect(x, y, box_size, box_size)
+            qp.setPen(QtGui.QPen(QtCore.Qt.white))
+            qp.drawText(x + box_size + 5, y + fm.ascent(), label)
 
     def paintEvent(self, e):
         qp = QtGui.QPainter()
@@ -372,13 +923,8 @@ class MapWidget(QtGui.QWidget):
         self.trans_x, self.trans_y = 0, 0
 
         if not self.dragging:
-            stn_xs, stn_ys = self.mapper(self.stn_lats, self.stn_lons)
-            stn_xs, stn_ys = zip(*[ self.transform.map(sx, sy) for sx, sy in zip(stn_xs, stn_ys)  ])
-            stn_xs = np.array(stn_xs)
-            stn_ys = np.array(stn_ys)
-            dists = np.hypot(stn_xs - e.x(), stn_ys - e.y())
-            stn_idx = np.argmin(dists)
-            if dists[stn_idx] <= 5:
+            stn_idx = self.findStation(e.x(), e.y())
+            if stn_idx is not None:
                 self.clicked_stn = self.stn_ids[stn_idx]
                 self.clicked.emit(self.points[stn_idx])
 
@@ -400,29 +946,34 @@ class MapWidget(QtGui.QWidget):
         self.map_center_x = self.center_x - (self.center_x - self.map_center_x) / scale_fac
         self.map_center_y = self.center_y - (self.center_y - self.map_center_y) / scale_fac
 
-        self.drawMap()
+        ## Stretch the layers we have for now, and redraw them properly once
+        ## the user stops scrolling.
+        self.drawMap(quick=True)
+        self.zoom_timer.start()
         self._checkStations(e)
         self.update()
 
-    def _checkStations(self, e):
-        stn_xs, stn_ys = self.mapper(self.stn_lats, self.stn_lons)
-        if len(stn_xs) == 0 or len(stn_ys) == 0:
-            return
+    def finishZoom(self):
+        self.drawMap()
+        self.update()
 
-        stn_xs, stn_ys = zip(*[ self.transform.map(sx, sy) for sx, sy in zip(stn_xs, stn_ys) ])
-        stn_xs = np.array(stn_xs)
-        stn_ys = np.array(stn_ys)
-        dists = np.hypot(stn_xs - e.x(), stn_ys - e.y())
-        stn_idx = np.argmin(dists)
-        if dists[stn_idx] <= 5:
-            stn_x, stn_y = stn_xs[stn_idx], stn_ys[stn_idx]
+    def _checkStations(self, e):
+        stn_idx = self.findStation(e.x(), e.y())
+        if stn_idx is not None:
+            stn_x, stn_y = self.transform.map(self.stn_xs[stn_idx], self.stn_ys[stn_idx])
             fm = QtGui.QFontMetrics(QtGui.QFont(self.font().rawName(), 16))
 
+            stn_name = self.stn_names[stn_idx]
+            if self.param is not None:
+                val = self.stationValues([ stn_idx ])[0]
+                if np.isfinite(val):
+                    stn_name = "%s: %s %s" % (stn_name, self.param, PARAM_FORMATS[self.param] % val)
+
             label_offset = 5
             align = 0
             if stn_x > self.width() / 2:
                 sgn_x = -1
-                label_x = stn_x - fm.width(self.stn_names[stn_idx])
+                label_x = stn_x - fm.width(stn_name)
                 align |= QtCore.Qt.AlignRight
             else:
                 sgn_x = 1
@@ -438,9 +989,9 @@ class MapWidget(QtGui.QWidget):
                 label_y = stn_y
                 align |= QtCore.Qt.AlignTop
 
-            self.stn_readout.setText(self.stn_names[stn_idx])
+            self.stn_readout.setText(stn_name)
             self.stn_readout.move(label_x + sgn_x * label_offset, label_y + sgn_y * label_offset)
-            self.stn_readout.setFixedWidth(fm.width(self.stn_names[stn_idx]))
+            self.stn_readout.setFixedWidth(fm.width(stn_name))
             self.stn_readout.setAlignment(align)
             self.setCursor(QtCore.Qt.PointingHandCursor)
         else:
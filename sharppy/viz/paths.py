@@ -0,0 +1,94 @@
+''' Bulk conversion of NumPy coordinate arrays to Qt paths '''
+import numpy as np
+import numpy.ma as ma
+from PySide import QtGui, QtCore
+
+__all__ = ['array_to_path', 'array_to_polygon']
+
+## Element types in the serialized form of a QPainterPath
+_MOVE_TO = 0
+_LINE_TO = 1
+
+def array_to_path(xs, ys, breaks=None, path=None):
+    '''
+    Build a QPainterPath of connected lines from arrays of pixel coordinates.
+    Rather than calling lineTo() once per point, the whole path is written
+    out in QPainterPath's serialized form with NumPy and read back in with a
+    single QDataStream call, which is much faster for long lines.
+
+    Parameters
+    ----------
+    xs : array_like
+    The x coordinates
+    ys : array_like
+    The y coordinates
+    breaks : array_like of bools (optional)
+    True where a new line starts (i.e. the point isn't connected to the one
+    before it). Masked and non-finite points are left out, and the line is
+    also broken around them.
+    path : QPainterPath (optional)
+    A path to add the lines to. A new one is made if not given.
+
+    Returns
+    -------
+    A QPainterPath
+    '''
+    xs = ma.filled(ma.asanyarray(xs, dtype=float), np.nan)
+    ys = ma.filled(ma.asanyarray(ys, dtype=float), np.nan)
+    good = np.isfinite(xs) & np.isfinite(ys)
+
+    if breaks is None:
+        starts = np.zeros(xs.shape, dtype=bool)
+    else:
+        starts = np.array(breaks, dtype=bool)
+    if len(starts) > 0:
+        starts[0] = True
+        starts[1:] |= ~good[:-1]
+
+    xs, ys, starts = xs[good], ys[good], starts[good]
+
+    new_path = QtGui.QPainterPath()
+    if len(xs) > 0:
+        elements = np.empty(xs.shape, dtype=[('type', '>i4'), ('x', '>f8'), ('y', '>f8')])
+        elements['type'] = np.where(starts, _MOVE_TO, _LINE_TO)
+        elements['x'] = xs
+        elements['y'] = ys
+
+        ## The element count, the elements, the start of the last subpath, and
+        ## the fill rule (Qt.OddEvenFill)
+        last_start = np.where(starts)[0][-1]
+        data = np.array([ len(xs) ], dtype='>i4').tostring() + elements.tostring() + \
+            np.array([ last_start, 0 ], dtype='>i4').tostring()
+
+        stream = QtCore.QDataStream(QtCore.QByteArray(data))
+        stream >> new_path
+
+    if path is None:
+        return new_path
+    path.addPath(new_path)
+    return path
+
+def array_to_polygon(xs, ys):
+    '''
+    Build a QPolygonF from arrays of pixel coordinates. Masked and non-finite
+    points are left out.
+
+    Parameters
+    ----------
+    xs : array_like
+    The x coordinates
+    ys : array_like
+    The y coordinates
+
+    Returns
+    -------
+    A QPolygonF
+    '''
+    xs = ma.filled(ma.asanyarray(xs, dtype=float), np.nan)
+    ys = ma.filled(ma.asanyarray(ys, dtype=float), np.nan)
+    good = np.isfinite(xs) & np.isfinite(ys)
+
+    polygons = array_to_path(xs[good], ys[good]).toSubpathPolygons()
+    if len(polygons) == 0:
+        return QtGui.QPolygonF()
+    return polygons[0]
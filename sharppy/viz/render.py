@@ -0,0 +1,213 @@
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+import os
+import multiprocessing
+
+from sharppy.viz.SPCWindow import SkewApp
+from sharppy.io.spc_decoder import SPCDecoder
+from sharppy.io.buf_decoder import BufDecoder
+
+__all__ = ['SoundingRenderer', 'render_files']
+
+## The models of the BUFKIT files, by the prefix of the file name (e.g.
+## gfs3_koax.buf), as named in the data sources
+_BUFKIT_MODELS = { 'gfs3':'GFS', 'nam':'NAM', 'namm':'NAM', 'rap':'RAP', 'hrrr':'HRRR',
+    'nam4km':'4km NAM', 'nam4kmm':'4km NAM', 'sref':'SREF' }
+
+class SoundingRenderer(object):
+    """
+    Draws the full SPC-style window (Skew-T, hodograph, and all the insets)
+    into QImages without putting anything on screen.
+
+    Qt 4 has no offscreen platform plugin, so this still needs a display
+    connection; on a headless machine, run it under Xvfb (e.g. xvfb-run).
+    The windows are never mapped.
+
+    One window is kept for deterministic profiles and one for ensembles, and
+    they're reused from image to image, so the widgets and their background
+    pixmaps are only built once.
+    """
+    def __init__(self, width=1180, height=800):
+        self._app = QApplication.instance()
+        if self._app is None:
+            self._app = QApplication([])
+
+        self._size = QSize(width, height)
+        self._windows = {}
+
+    def render(self, profs, dates, model, idx=0, **kwargs):
+        """
+        Render one profile to a QImage.
+
+        Parameters
+        ----------
+        profs : list of profiles
+        The profiles, as passed to SkewApp
+        dates : list of datetime objects
+        The valid times of the profiles
+        model : string
+        The model name, as passed to SkewApp ("SREF" for ensembles)
+        idx : int (optional; default 0)
+        The index of the profile to draw
+        **kwargs : the rest of the SkewApp keyword arguments (location,
+        run, fhour, etc.)
+
+        Returns
+        -------
+        A QImage
+        """
+        ensemble = (model == "SREF")
+        skew = self._windows.get(ensemble, None)
+        if skew is None or skew.model != model:
+            if skew is not None:
+                skew.deleteLater()
+
+            skew = SkewApp(profs, dates, model, **kwargs)
+            skew.setAttribute(Qt.WA_DontShowOnScreen)
+            skew.resize(self._size)
+            skew.show()
+            self._windows[ensemble] = skew
+        else:
+            skew.setProfiles(profs, dates, **kwargs)
+
+        if idx != skew.current_idx:
+            skew.stepTo(idx)
+
+        ## Let the layout and resize events go through before drawing
+        self._app.processEvents()
+        return skew.renderImage()
+
+    def renderFile(self, file_name, out_dir, model=None):
+        """
+        Render every profile in a sounding file (SPC or BUFKIT format) to PNG
+        files in out_dir, named <station>.<YYYYMMDDHH>.png.
+
+        The titles carry the model, run, and forecast hour like the ones in
+        the GUI. The run is the first time in the file.
+
+        Parameters
+        ----------
+        file_name : string
+        The sounding file (local path or URL)
+        out_dir : string
+        The directory to put the images in
+        model : string (optional)
+        The model name for the titles (e.g. "GFS"). By default, it's worked
+        out from the file: "Observed" for SPC files, "SREF" for ensembles,
+        and otherwise from the BUFKIT file name (e.g. gfs3_koax.buf). If
+        that doesn't work, the titles read "User Selected".
+
+        Returns
+        -------
+        The list of image file names
+        """
+        dec = _decode(file_name)
+        profs = dec.getProfiles(range(len(dec.getProfileTimes())))
+        dates = dec.getProfileTimes()
+        stn_id = dec.getStnId()
+
+        if model is None:
+            model = _model_name(file_name, dec, profs)
+
+        run = "%02dZ" % dates[0].hour
+        fhours = [ "F%03d" % ((date - dates[0]).total_seconds() // 3600) for date in dates ]
+
+        image_names = []
+        for idx, date in enumerate(dates):
+            image = self.render(profs, dates, model, idx=idx, location=stn_id, run=run, fhour=fhours)
+
+            image_name = os.path.join(out_dir, "%s.%s.png" % (stn_id, date.strftime("%Y%m%d%H")))
+            image.save(image_name, 'PNG')
+            image_names.append(image_name)
+        return image_names
+
+def _model_name(file_name, dec, profs):
+    # The model a sounding file came from, as best as can be told from the file
+    if type(profs[0]) == list:
+        return "SREF"
+    elif isinstance(dec, SPCDecoder):
+        return "Observed"
+
+    prefix = os.path.basename(file_name).split('_')[0].lower()
+    return _BUFKIT_MODELS.get(prefix, "Archive")
+
+def _decode(file_name):
+    try:
+        dec = SPCDecoder(file_name)
+    except Exception as spc_err:
+        try:
+            dec = BufDecoder(file_name)
+        except Exception as buf_err:
+            raise IOError("Could not figure out the format of '%s'! (SPC: %s; BUFKIT: %s)" %
+                (file_name, spc_err, buf_err))
+    return dec
+
+## The renderer for this worker process (see render_files())
+_renderer = None
+
+def _init_worker(width, height):
+    global _renderer
+    _renderer = SoundingRenderer(width=width, height=height)
+
+def _render_file(args):
+    file_name, out_dir, model = args
+    try:
+        return _renderer.renderFile(file_name, out_dir, model=model)
+    except Exception as e:
+        return e
+
+def render_files(file_names, out_dir, processes=None, width=1180, height=800, model=None):
+    """
+    Render every profile in a batch of sounding files to PNGs, in parallel.
+    Each worker process sets up its own QApplication and SoundingRenderer
+    once and reuses them for all the files it's given, so don't call this
+    from a process that already has a QApplication.
+
+    Parameters
+    ----------
+    file_names : list of strings
+    The sounding files (local paths or URLs)
+    out_dir : string
+    The directory to put the images in
+    processes : int (optional)
+    The number of worker processes (defaults to the number of CPUs)
+    width, height : int (optional)
+    The size of the images
+    model : string (optional)
+    The model name for the titles (see SoundingRenderer.renderFile())
+
+    Returns
+    -------
+    A list with, for each file, either the list of image file names or the
+    exception raised while rendering it
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(width, height))
+    try:
+        results = pool.map(_render_file, [ (file_name, out_dir, model) for file_name in file_names ], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 3:
+        print "Usage: python render.py <output directory> <sounding file> [<sounding file> ...]"
+        sys.exit(1)
+
+    start = time.time()
+    results = render_files(sys.argv[2:], sys.argv[1])
+
+    n_images = 0
+    for file_name, result in zip(sys.argv[2:], results):
+        if isinstance(result, Exception):
+            print "%s: %s" % (file_name, result)
+        else:
+            n_images += len(result)
+    print "Rendered %d images in %.2f s" % (n_images, time.time() - start)
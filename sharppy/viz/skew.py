@@ -1,17 +1,31 @@
 import numpy as np
+import numpy.ma as ma
 import sharppy.sharptab as tab
 from sharppy.sharptab.constants import *
 from sharppy.sharptab.profile import Profile, create_profile
 from sharppy.viz.barbs import drawBarb
+from sharppy.viz.paths import array_to_path, array_to_polygon
 from PySide import QtGui, QtCore
 from PySide.QtGui import *
 from PySide.QtCore import *
 from PySide.QtOpenGL import *
 
 from datetime import datetime, timedelta
+from collections import OrderedDict
 
 __all__ = ['backgroundSkewT', 'plotSkewT']
 
+## The pressure levels the background lines are drawn through, and the
+## dry adiabat factor (1000 / p) ** (Rd / Cp) at each one. These don't depend
+## on the window, so they're computed once and shared by all the Skew-Ts.
+_adiabat_pres = np.arange(1050., 100. - 10., -10.)
+_adiabat_factor = np.power(1000. / _adiabat_pres, ROCP)
+
+## Rendered backgrounds for the unzoomed Skew-T, keyed by size and style, so
+## resizing back and forth or opening more windows doesn't redraw them.
+_background_cache = OrderedDict()
+_BACKGROUND_CACHE_SIZE = 8
+
 class backgroundSkewT(QtGui.QWidget):
     def __init__(self, plot_omega=False):
         super(backgroundSkewT, self).__init__()
@@ -53,12 +67,30 @@ class backgroundSkewT(QtGui.QWidget):
         self.esrh_font = QtGui.QFont('Helvetica', fsize + 2)
         self.esrh_metrics = QtGui.QFontMetrics( self.esrh_font )
         self.esrh_height = self.esrh_metrics.xHeight() + 9
+        self.zoomed = False
         self.plotBitMap = QtGui.QPixmap(self.width(), self.height())
         self.saveBitMap = None
         self.plotBitMap.fill(QtCore.Qt.black)
         self.plotBackground()
-    
+
+    def backgroundKey(self):
+        '''
+        The key for this Skew-T's background in the shared cache, or None if
+        it shouldn't be cached (i.e. it's zoomed in).
+
+        '''
+        if self.zoomed:
+            return None
+        return (self.width(), self.height(), self.plot_omega, self.label_font.pointSize())
+
     def plotBackground(self, plot_omega=False):
+        key = self.backgroundKey()
+        if key in _background_cache:
+            self.backgroundBitMap = _background_cache.pop(key)
+            _background_cache[key] = self.backgroundBitMap
+            self.plotBitMap = self.backgroundBitMap.copy(0, 0, self.width(), self.height())
+            return
+
         qp = QtGui.QPainter()
         qp.begin(self.plotBitMap)
         qp.setRenderHint(qp.Antialiasing)
@@ -66,7 +98,7 @@ class backgroundSkewT(QtGui.QWidget):
         for t in np.arange(self.bltmpc-100, self.brtmpc+self.dt, self.dt):
             self.draw_isotherm(t, qp)
         #for tw in range(self.bltmpc, self.brtmpc, 10): self.draw_moist_adiabat(tw, qp)
-        for theta in np.arange(self.bltmpc, 80, 20): self.draw_dry_adiabat(theta, qp)
+        self.draw_dry_adiabats(np.arange(self.bltmpc, 80, 20), qp)
         for w in [2] + np.arange(4, 33, 4): self.draw_mixing_ratios(w, 600, qp)
         self.draw_frame(qp)
         for p in [1000, 850, 700, 500, 300, 200, 100]:
@@ -105,6 +137,11 @@ class backgroundSkewT(QtGui.QWidget):
         qp.end()
         self.backgroundBitMap = self.plotBitMap.copy(0, 0, self.width(), self.height())
 
+        if key is not None:
+            _background_cache[key] = self.backgroundBitMap
+            while len(_background_cache) > _BACKGROUND_CACHE_SIZE:
+                _background_cache.popitem(last=False)
+
     def resizeEvent(self, e):
         '''
         Resize the plot based on adjusting the main window.
@@ -157,29 +194,30 @@ class backgroundSkewT(QtGui.QWidget):
         self.log_pmax = np.log(self.pmax)
         self.xrange = int(self.brtmpc) - int(self.bltmpc)
         self.yrange = np.tan(np.deg2rad(self.xskew)) * self.xrange
+        self.zoomed = True
         self.update()
 
     def draw_dry_adiabat(self, theta, qp):
         '''
-        Draw the given moist adiabat.
+        Draw the given dry adiabat.
+
+        '''
+        self.draw_dry_adiabats([ theta ], qp)
+
+    def draw_dry_adiabats(self, thetas, qp):
+        '''
+        Draw the given dry adiabats.
 
         '''
         pen = QtGui.QPen(QtGui.QColor("#333333"), 1)
         pen.setStyle(QtCore.Qt.SolidLine)
         qp.setPen(pen)
-        dp = -10
-        presvals = np.arange(int(self.pmax), int(self.pmin)+dp, dp)
-        thetas = ((theta + ZEROCNK) / (np.power((1000. / presvals),ROCP))) - ZEROCNK
-        xvals = self.tmpc_to_pix(thetas, presvals)
+        in_plot = (_adiabat_pres <= self.pmax) & (_adiabat_pres >= self.pmin)
+        presvals = _adiabat_pres[in_plot]
+        tmpcs = ((np.asarray(thetas, dtype=float)[:, np.newaxis] + ZEROCNK) / _adiabat_factor[in_plot]) - ZEROCNK
         yvals = self.pres_to_pix(presvals)
-        path = QPainterPath()
-        path.moveTo(xvals[0], yvals[0])
-        for i in xrange(1, len(presvals) ):
-            p = presvals[i]
-            x = xvals[i]
-            y = yvals[i]
-            path.lineTo(x, y)
-        qp.drawPath(path)
+        for tmpc in tmpcs:
+            qp.drawPolyline(array_to_polygon(self.tmpc_to_pix(tmpc, presvals), yvals))
 
     def draw_moist_adiabat(self, tw, qp):
         '''
@@ -350,6 +388,7 @@ class plotSkewT(backgroundSkewT):
         self.logp = np.log10(prof.pres)
         self.pcl = kwargs.get('pcl', None)
         self.proflist = kwargs.get('proflist', None)
+        self.ens_stats = kwargs.get('ens_stats', None)
         self.plotdgz = kwargs.get('dgz', False)
         self.interpWinds = kwargs.get('interpWinds', True)
         ## ui stuff
@@ -496,6 +535,7 @@ class plotSkewT(backgroundSkewT):
         self.logp = np.log10(prof.pres)
         self.pcl = kwargs.get('pcl', None)
         self.proflist = kwargs.get('proflist', None)
+        self.ens_stats = kwargs.get('ens_stats', None)
         self.plotdgz = kwargs.get('dgz', False)
         self.interpWinds = kwargs.get('interpWinds', True)
         self.title = kwargs.get('title', '')
@@ -758,7 +798,10 @@ class plotSkewT(backgroundSkewT):
         qp.setRenderHint(qp.Antialiasing)
         qp.setRenderHint(qp.TextAntialiasing)
         self.drawTitle(qp)
-        if self.proflist is not None:
+        if self.ens_stats is not None:
+            self.drawEnvelope(self.ens_stats.tmpc, self.temp_color, qp)
+            self.drawEnvelope(self.ens_stats.dwpc, self.dewp_color, qp)
+        elif self.proflist is not None:
             for profile in self.proflist:
                 #purple #666699
                 self.drawTrace(profile.tmpc, QtGui.QColor("#6666CC"), qp, p=profile.pres)
@@ -987,19 +1030,22 @@ class plotSkewT(backgroundSkewT):
         brush = QtGui.QBrush(QtCore.Qt.NoBrush)
         qp.setPen(pen)
         qp.setBrush(brush)
-        path = QPainterPath()
         if not tab.utils.QC(ptrace):
             return
         yvals = self.pres_to_pix(ptrace)
         xvals = self.tmpc_to_pix(ttrace, ptrace)
-        path.moveTo(xvals[0], yvals[0])
-        for i in xrange(1, len(yvals)):
-            x = xvals[i]; y = yvals[i]
-            if y < self.tpad:
-                break
-            else:
-                path.lineTo(x, y)
-        qp.drawPath(path)
+        end = self.traceEnd(yvals)
+        qp.drawPath(array_to_path(xvals[:end], yvals[:end]))
+
+    def traceEnd(self, yvals):
+        '''
+        The index where a trace goes above the top of the plot (or its
+        length, if it doesn't). The first point is always drawn.
+        '''
+        above = np.where(np.asarray(yvals)[1:] < self.tpad)[0]
+        if len(above) == 0:
+            return len(yvals)
+        return above[0] + 1
 
     def drawTrace(self, data, color, qp, width=3, p=None, stdev=None, label=True):
         '''
@@ -1024,19 +1070,14 @@ class plotSkewT(backgroundSkewT):
         if stdev is not None:
             stdev = stdev[~mask]
 
-        path = QPainterPath()
         x = self.tmpc_to_pix(data, pres)
         y = self.pres_to_pix(pres)
-        path.moveTo(x[0], y[0])
-        for i in xrange(1, x.shape[0]):
-            if y[i] < self.tpad:
-                break
-
-            path.lineTo(x[i], y[i])
-            if stdev is not None:
+        end = self.traceEnd(y)
+        if stdev is not None:
+            for i in xrange(1, end):
                 self.drawSTDEV(pres[i], data[i], stdev[i], color, qp)
 
-        qp.drawPath(path)
+        qp.drawPath(array_to_path(x[:end], y[:end]))
 
         if label is True:
             label = (1.8 * data[0]) + 32.
@@ -1051,6 +1092,42 @@ class plotSkewT(backgroundSkewT):
             qp.setFont(self.environment_trace_font)
             qp.drawText(rect, QtCore.Qt.AlignCenter, tab.utils.INT2STR(label))
 
+    def drawEnvelope(self, stats, color, qp):
+        '''
+        Draw the spread of an ensemble as a shaded envelope between the 10th
+        and 90th percentiles of the members, with a thin line for the median.
+
+        Parameters
+        ----------
+        stats : dictionary
+            Statistic name to a masked array on the pressure grid of the
+            ensemble statistics (see sharppy.sharptab.ensemble.EnsembleStats)
+        color : str
+            The color of the trace the envelope goes with
+        qp : QtGui.QPainter object
+
+        '''
+        pres = self.ens_stats.pres
+        good = ~(ma.getmaskarray(stats['p10']) | ma.getmaskarray(stats['p90'])) & (pres >= self.pmin)
+        pres = pres[good]
+        if len(pres) < 2:
+            return
+
+        ## Up the 10th percentile and back down the 90th
+        xs = np.concatenate((self.tmpc_to_pix(stats['p10'][good], pres),
+            self.tmpc_to_pix(stats['p90'][good], pres)[::-1]))
+        ys = np.concatenate((self.pres_to_pix(pres), self.pres_to_pix(pres)[::-1]))
+        fill = QtGui.QColor(color)
+        fill.setAlpha(70)
+        qp.setPen(QtCore.Qt.NoPen)
+        qp.setBrush(QtGui.QBrush(fill))
+        qp.drawPolygon(array_to_polygon(xs, ys))
+
+        pen = QtGui.QPen(QtGui.QColor(color), 1, QtCore.Qt.DashLine)
+        qp.setPen(pen)
+        qp.setBrush(QtCore.Qt.NoBrush)
+        qp.drawPath(array_to_path(self.tmpc_to_pix(stats['median'][good], pres), self.pres_to_pix(pres)))
+
     def drawSTDEV(self, pres, data, stdev, color, qp, width=1):
         '''
         Draw the error bars on the profile.
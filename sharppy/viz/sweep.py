@@ -0,0 +1,139 @@
+import numpy as np
+import numpy.ma as ma
+from collections import OrderedDict
+from PySide import QtGui, QtCore
+import sharppy.sharptab as tab
+
+__all__ = ['SWEEP_PARCELS', 'computeSweeps', 'SurfaceSweepWindow']
+
+## The parcels in the table, as display name to DefineParcel flag
+SWEEP_PARCELS = OrderedDict([
+    ('Surface', 1),
+    ('Mixed Layer', 4),
+])
+
+## The parameters in the table, as (display name, parameter name, format)
+SWEEP_DISPLAY = [
+    ("CAPE (J/kg)", 'bplus', tab.utils.INT2STR),
+    ("CINH (J/kg)", 'bminus', tab.utils.INT2STR),
+    ("LCL (m AGL)", 'lclhght', tab.utils.INT2STR),
+    ("LFC (m AGL)", 'lfchght', tab.utils.INT2STR),
+]
+
+## The temperature and dewpoint changes (C) from the current surface values
+## along the sides of the table
+SWEEP_OFFSETS = np.arange(-10., 10.1, 2.)
+
+def computeSweeps(prof, offsets=SWEEP_OFFSETS):
+    """
+    Compute the surface temperature and dewpoint sweeps for all the parcels
+    in the table (see sharppy.sharptab.batch.surface_sweep).
+
+    Parameters
+    ----------
+    prof : Profile object
+    offsets : array_like (optional)
+    The temperature and dewpoint changes (C) from the current surface values
+
+    Returns
+    -------
+    The surface temperatures (C), the surface dewpoints (C), and a dictionary
+    of parcel display name to the sweep for that parcel
+    """
+    tmpcs = prof.tmpc[prof.sfc] + np.asarray(offsets, dtype=float)
+    dwpcs = prof.dwpc[prof.sfc] + np.asarray(offsets, dtype=float)
+    sweeps = dict( (name, tab.batch.surface_sweep(prof, tmpcs, dwpcs, flag=flag))
+        for name, flag in SWEEP_PARCELS.iteritems() )
+    return tmpcs, dwpcs, sweeps
+
+class SurfaceSweepWindow(QtGui.QWidget):
+    """
+    A table of a parcel parameter over a grid of surface temperatures (rows)
+    and dewpoints (columns) around the current surface values, with menus to
+    pick the parcel and the parameter. Shown from the SPC window (see
+    SkewApp.showSweep()).
+    """
+    def __init__(self, **kwargs):
+        super(SurfaceSweepWindow, self).__init__(**kwargs)
+        self.setWindowTitle("SHARPpy: Surface T/Td Sensitivity")
+        self.setStyleSheet("QWidget {background-color: rgb(0, 0, 0);}")
+        self.resize(800, 420)
+
+        self.tmpcs = None
+        self.dwpcs = None
+        self.sweeps = None
+        self.sfc_tmpc = None
+        self.sfc_dwpc = None
+
+        self.parcel_dropdown = QtGui.QComboBox()
+        self.parcel_dropdown.setStyleSheet("QComboBox {color: #FFFFFF;}")
+        for name in SWEEP_PARCELS.iterkeys():
+            self.parcel_dropdown.addItem(name)
+        self.parcel_dropdown.activated.connect(self.fillTable)
+
+        self.param_dropdown = QtGui.QComboBox()
+        self.param_dropdown.setStyleSheet("QComboBox {color: #FFFFFF;}")
+        for title, name, fmt in SWEEP_DISPLAY:
+            self.param_dropdown.addItem(title)
+        self.param_dropdown.activated.connect(self.fillTable)
+
+        self.table = QtGui.QTableWidget()
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionMode(QtGui.QAbstractItemView.NoSelection)
+        self.table.setStyleSheet("QTableWidget {color: #FFFFFF; gridline-color: #333333;} " +
+            "QHeaderView::section {background-color: #000000; color: #FFFFFF;}")
+        self.table.horizontalHeader().setResizeMode(QtGui.QHeaderView.Stretch)
+        self.table.verticalHeader().setResizeMode(QtGui.QHeaderView.Stretch)
+
+        self.label = QtGui.QLabel("Rows: surface temperature (F)   Columns: surface dewpoint (F)")
+        self.label.setStyleSheet("QLabel {color: #FFFFFF;}")
+
+        layout = QtGui.QGridLayout()
+        layout.setContentsMargins(2, 2, 2, 2)
+        layout.addWidget(self.parcel_dropdown, 0, 0)
+        layout.addWidget(self.param_dropdown, 0, 1)
+        layout.addWidget(self.label, 0, 2)
+        layout.addWidget(self.table, 1, 0, 1, 3)
+        layout.setColumnStretch(2, 1)
+        layout.setRowStretch(1, 1)
+        self.setLayout(layout)
+
+    def setSweeps(self, prof, tmpcs, dwpcs, sweeps):
+        """
+        Set the sweeps to show (see computeSweeps()) for a profile. The
+        profile's surface conditions are highlighted.
+        """
+        self.tmpcs = tmpcs
+        self.dwpcs = dwpcs
+        self.sweeps = sweeps
+        self.sfc_tmpc = prof.tmpc[prof.sfc]
+        self.sfc_dwpc = prof.dwpc[prof.sfc]
+        self.fillTable()
+
+    def fillTable(self, *args):
+        if self.sweeps is None:
+            return
+
+        title, name, fmt = SWEEP_DISPLAY[self.param_dropdown.currentIndex()]
+        values = self.sweeps[self.parcel_dropdown.currentText()][name]
+
+        ## Warmer temperatures at the top, drier dewpoints on the left
+        rows = np.argsort(self.tmpcs)[::-1]
+        self.table.clear()
+        self.table.setRowCount(len(self.tmpcs))
+        self.table.setColumnCount(len(self.dwpcs))
+        self.table.setVerticalHeaderLabels([ tab.utils.INT2STR(tab.thermo.ctof(self.tmpcs[row])) for row in rows ])
+        self.table.setHorizontalHeaderLabels([ tab.utils.INT2STR(tab.thermo.ctof(dwpc)) for dwpc in self.dwpcs ])
+
+        cur_row = np.argmin(np.abs(self.tmpcs[rows] - self.sfc_tmpc))
+        cur_col = np.argmin(np.abs(self.dwpcs - self.sfc_dwpc))
+        for irow, row in enumerate(rows):
+            for col in xrange(len(self.dwpcs)):
+                value = values[row, col]
+                text = '' if value is ma.masked else fmt(value)
+                item = QtGui.QTableWidgetItem(text)
+                item.setTextAlignment(QtCore.Qt.AlignCenter)
+                if irow == cur_row and col == cur_col:
+                    ## The current surface conditions
+                    item.setBackground(QtGui.QColor("#333399"))
+                self.table.setItem(irow, col, item)
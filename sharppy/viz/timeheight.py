@@ -0,0 +1,390 @@
+import numpy as np
+import numpy.ma as ma
+from PySide import QtGui, QtCore
+import sharppy.sharptab as tab
+from sharppy.sharptab.timeseries import SECTION_FIELDS
+from sharppy.viz.barbs import drawBarb
+from sharppy.viz.paths import array_to_path
+
+__all__ = ['plotTimeHeight', 'TimeHeightWindow']
+
+## The display name, shading levels, and colors (one more than the levels;
+## the first is for values below the lowest level) of each section field
+SECTION_SHADING = {
+    'thetae':("Theta-E (K)", np.arange(300., 371., 5.),
+        [ "#2B1F5C", "#31358F", "#2E59B6", "#3482C4", "#43A9C4", "#5EC7AD", "#8AD88A", "#B6E36B",
+          "#DDE852", "#F5D743", "#F8B13A", "#F38630", "#E65A27", "#CF3320", "#A9151B", "#7C0516" ]),
+    'relh':("Relative Humidity (%)", np.arange(10., 100., 10.),
+        [ "#5C3A12", "#7F5420", "#A47636", "#C69C5A", "#E0C48E", "#C8DCA4", "#92C77E", "#5DA95D",
+          "#2F8845", "#0F6535" ]),
+    'omeg':("Omega", np.array([ -2., -1.5, -1., -0.5, -0.2, 0.2, 0.5, 1., 1.5, 2. ]),
+        [ "#FF3333", "#FF6666", "#FF9999", "#FFCCCC", "#553333", "#000000", "#333355", "#CCCCFF",
+          "#9999FF", "#6666FF", "#3333FF" ]),
+}
+
+## The fields that can be shaded
+SHADED_FIELDS = [ name for name in SECTION_FIELDS if name in SECTION_SHADING ]
+
+## The time series strips, as (title, [ (parameter, color), ... ])
+SERIES_STRIPS = [
+    ("MLCAPE / MLCIN (J/kg)", [ ('mlcape', "#FF0000"), ('mlcinh', "#996600") ]),
+    ("Eff. SRH (m2/s2)", [ ('esrh', "#00CCFF") ]),
+    ("STP / SCP", [ ('stp_cin', "#FF00FF"), ('scp', "#00FF00") ]),
+    ("PW (in)", [ ('pwat', "#00FF00") ]),
+]
+
+## The colors of the best-guess precip types
+PRECIP_COLORS = [
+    ("Freezing", "#FF3333"),
+    ("Sleet", "#FF66FF"),
+    ("Snow", "#66CCFF"),
+    ("Rain", "#33CC33"),
+    ("Unknown", "#999999"),
+]
+
+def _shade(grid, levels, colors):
+    '''
+    Convert a 2D (masked) array of values to 32-bit RGB pixel values for the
+    bins between the levels. Masked values come out black.
+    '''
+    rgb = np.array([ QtGui.QColor(c).rgb() & 0xFFFFFFFF for c in colors ], dtype=np.uint32)
+    vals = ma.filled(ma.asanyarray(grid, dtype=float), np.nan)
+    with np.errstate(invalid='ignore'):
+        pixels = rgb[np.digitize(np.where(np.isfinite(vals), vals, levels[0]), levels)]
+    pixels[~np.isfinite(vals)] = 0xFF000000
+    return pixels
+
+class plotTimeHeight(QtGui.QFrame):
+    '''
+    Plots a time-height section of one field (theta-e, relative humidity,
+    or omega) with wind barbs, and strips of the headline parameters below
+    it, for all the times in a model run.
+    '''
+    def __init__(self, series=None, current_idx=0, fhours=None):
+        super(plotTimeHeight, self).__init__()
+        self.series = series
+        self.current_idx = current_idx
+        self.fhours = fhours
+        self.field = 'thetae'
+        self.barbs = True
+        self.initUI()
+
+    def initUI(self):
+        self.setStyleSheet("QFrame {"
+            "  background-color: rgb(0, 0, 0);"
+            "  border-width: 1px;"
+            "  border-style: solid;"
+            "  border-color: #3399CC;}")
+        if self.physicalDpiX() > 75:
+            fsize = 7
+        else:
+            fsize = 8
+        self.label_font = QtGui.QFont('Helvetica', fsize)
+        self.title_font = QtGui.QFont('Helvetica', fsize + 2)
+        self.label_metrics = QtGui.QFontMetrics(self.label_font)
+        self.label_height = self.label_metrics.xHeight() + 5
+
+        self.lpad = 45.; self.rpad = 10.
+        self.tpad = 20.; self.bpad = 20.
+        self.strip_pad = 6.
+        self.wid = self.size().width() - self.rpad
+        self.hgt = self.size().height() - self.bpad
+        self.tlx = self.lpad; self.tly = self.tpad
+        self.brx = self.wid; self.bry = self.hgt
+
+        ## The section gets the top 55% of the plot, and the strips (including
+        ## the precip type) split the rest
+        nstrips = len(SERIES_STRIPS) + 1
+        self.section_bry = self.tly + 0.55 * (self.bry - self.tly)
+        self.strip_hgt = (self.bry - self.section_bry) / nstrips
+
+        self.plotBitMap = QtGui.QPixmap(self.width(), self.height())
+        self.plotBitMap.fill(QtCore.Qt.black)
+
+    def resizeEvent(self, e):
+        '''
+        Handles the event the window is resized
+        '''
+        self.initUI()
+        self.plotData()
+
+    def paintEvent(self, e):
+        super(plotTimeHeight, self).paintEvent(e)
+        qp = QtGui.QPainter()
+        qp.begin(self)
+        qp.drawPixmap(0, 0, self.plotBitMap)
+        qp.end()
+
+    def setSeries(self, series, current_idx=None, fhours=None):
+        '''
+        Plot the results of a RunSeries. Pass a snapshot (see
+        RunSeries.snapshot()) if the RunSeries is updated on another thread.
+        '''
+        self.series = series
+        if current_idx is not None:
+            self.current_idx = current_idx
+        if fhours is not None:
+            self.fhours = fhours
+        self.clearData()
+        self.plotData()
+        self.update()
+
+    def setCurrentIdx(self, idx):
+        self.current_idx = idx
+        self.clearData()
+        self.plotData()
+        self.update()
+
+    def setField(self, field):
+        self.field = field
+        self.clearData()
+        self.plotData()
+        self.update()
+
+    def setBarbs(self, barbs):
+        self.barbs = barbs
+        self.clearData()
+        self.plotData()
+        self.update()
+
+    def clearData(self):
+        '''
+        Handles the clearing of the pixmap
+        in the frame.
+        '''
+        self.plotBitMap = QtGui.QPixmap(self.width(), self.height())
+        self.plotBitMap.fill(QtCore.Qt.black)
+
+    def ntimes(self):
+        if self.series is None:
+            return 0
+        return len(self.series.dates)
+
+    def idx_to_pix(self, idx):
+        '''
+        Convert a time index to the X pixel at the center of its column.
+        '''
+        return self.tlx + (np.asarray(idx) + 0.5) * (self.brx - self.tlx) / max(self.ntimes(), 1)
+
+    def hght_to_pix(self, h):
+        '''
+        Convert a height (m AGL) to a Y pixel in the section.
+        '''
+        hmax = self.series.hghts[-1]; hmin = self.series.hghts[0]
+        return self.section_bry - (np.asarray(h) - hmin) / (hmax - hmin) * (self.section_bry - self.tly)
+
+    def plotData(self):
+        if self.ntimes() == 0:
+            return
+
+        qp = QtGui.QPainter()
+        qp.begin(self.plotBitMap)
+        qp.setRenderHint(qp.Antialiasing)
+        qp.setRenderHint(qp.TextAntialiasing)
+        self.drawSection(qp)
+        if self.barbs:
+            self.drawBarbs(qp)
+        self.drawHeightAxis(qp)
+
+        top = self.section_bry
+        for title, params in SERIES_STRIPS:
+            self.drawStrip(qp, top, title, params)
+            top += self.strip_hgt
+        self.drawPrecipType(qp, top)
+
+        self.drawTimeAxis(qp)
+        self.drawCurrentTime(qp)
+        qp.end()
+
+    def drawSection(self, qp):
+        '''
+        Shade the section. The whole thing is colored with NumPy into an
+        image with one pixel per time and height, which is then stretched
+        over the plot.
+        '''
+        name, levels, colors = SECTION_SHADING[self.field]
+        section = self.series.sections[self.field]
+
+        ## Rows of an image go top to bottom, so flip the heights
+        pixels = np.ascontiguousarray(_shade(section, levels, colors).T[::-1])
+        nh, nt = pixels.shape
+        image = QtGui.QImage(pixels.tostring(), nt, nh, QtGui.QImage.Format_RGB32).copy()
+
+        dh = (self.series.hghts[1] - self.series.hghts[0]) / 2. if nh > 1 else 0.
+        top = self.hght_to_pix(self.series.hghts[-1] + dh)
+        bot = self.hght_to_pix(self.series.hghts[0] - dh)
+        target = QtCore.QRectF(self.tlx, max(top, self.tly), self.brx - self.tlx, min(bot, self.section_bry) - max(top, self.tly))
+        source = QtCore.QRectF(0, 0, nt, nh)
+        qp.drawImage(target, image, source)
+
+        qp.setPen(QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.SolidLine))
+        qp.setBrush(QtCore.Qt.NoBrush)
+        qp.drawRect(QtCore.QRectF(self.tlx, self.tly, self.brx - self.tlx, self.section_bry - self.tly))
+        qp.setFont(self.title_font)
+        qp.drawText(QtCore.QRectF(self.tlx, 0, self.brx - self.tlx, self.tpad),
+            QtCore.Qt.AlignCenter, "Time-Height: " + name)
+
+    def drawBarbs(self, qp):
+        '''
+        Draw wind barbs every 1 km, thinned in time so they don't run into
+        each other.
+        '''
+        hghts = self.series.hghts
+        u = self.series.sections['u']; v = self.series.sections['v']
+        nt = self.ntimes()
+        col_wid = (self.brx - self.tlx) / nt
+        tstep = max(int(np.ceil(30. / col_wid)), 1)
+        hidx = np.where((hghts % 1000. == 0) & (hghts > 0))[0]
+
+        qp.setRenderHint(qp.Antialiasing, False)
+        for tidx in xrange(0, nt, tstep):
+            x = self.idx_to_pix(tidx)
+            for h in hidx:
+                if u[tidx, h] is ma.masked or v[tidx, h] is ma.masked:
+                    continue
+                wdir, wspd = tab.utils.comp2vec(u[tidx, h], v[tidx, h])
+                drawBarb(qp, x, self.hght_to_pix(hghts[h]), wdir, wspd, color='#FFFFFF')
+        qp.setRenderHint(qp.Antialiasing)
+
+    def drawHeightAxis(self, qp):
+        qp.setPen(QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.SolidLine))
+        qp.setFont(self.label_font)
+        for h in np.arange(0., self.series.hghts[-1] + 1., 2000.):
+            y = self.hght_to_pix(h)
+            qp.drawLine(QtCore.QPointF(self.tlx - 4, y), QtCore.QPointF(self.tlx, y))
+            qp.drawText(QtCore.QRectF(0, y - self.label_height / 2., self.tlx - 6, self.label_height),
+                QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter, "%d km" % (h / 1000.))
+
+    def drawStrip(self, qp, top, title, params):
+        '''
+        Draw a strip of one or more parameter time series, scaled to the
+        range of the data (always including 0).
+        '''
+        bot = top + self.strip_hgt - self.strip_pad
+        top = top + self.strip_pad
+        values = [ self.series.series[param] for param, color in params ]
+
+        vmin = min([ 0. ] + [ float(vals.min()) for vals in values if vals.count() > 0 ])
+        vmax = max([ 1. ] + [ float(vals.max()) for vals in values if vals.count() > 0 ])
+        to_pix = lambda val: bot - (val - vmin) / (vmax - vmin) * (bot - top)
+
+        qp.setPen(QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.SolidLine))
+        qp.setBrush(QtCore.Qt.NoBrush)
+        qp.drawRect(QtCore.QRectF(self.tlx, top, self.brx - self.tlx, bot - top))
+        if vmin < 0:
+            qp.setPen(QtGui.QPen(QtGui.QColor("#666666"), 1, QtCore.Qt.DashLine))
+            qp.drawLine(QtCore.QPointF(self.tlx, to_pix(0.)), QtCore.QPointF(self.brx, to_pix(0.)))
+
+        precision = 0 if vmax - vmin >= 10 else 1
+        qp.setPen(QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.SolidLine))
+        qp.setFont(self.label_font)
+        qp.drawText(QtCore.QRectF(0, top, self.tlx - 6, self.label_height),
+            QtCore.Qt.AlignRight | QtCore.Qt.AlignTop, tab.utils.FLOAT2STR(vmax, precision))
+        qp.drawText(QtCore.QRectF(0, bot - self.label_height, self.tlx - 6, self.label_height),
+            QtCore.Qt.AlignRight | QtCore.Qt.AlignBottom, tab.utils.FLOAT2STR(vmin, precision))
+        qp.drawText(QtCore.QRectF(self.tlx + 4, top + 1, self.brx - self.tlx, self.label_height),
+            QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop, title)
+
+        xs = self.idx_to_pix(np.arange(self.ntimes()))
+        for (param, color), vals in zip(params, values):
+            qp.setPen(QtGui.QPen(QtGui.QColor(color), 2, QtCore.Qt.SolidLine))
+            qp.drawPath(array_to_path(xs, to_pix(vals)))
+
+    def drawPrecipType(self, qp, top):
+        '''
+        Draw the best-guess precip type at each time as a colored block.
+        '''
+        bot = top + self.strip_hgt - self.strip_pad
+        top = top + self.strip_pad
+        col_wid = (self.brx - self.tlx) / self.ntimes()
+
+        qp.setPen(QtCore.Qt.NoPen)
+        for idx, ptype in enumerate(self.series.series['precip_type']):
+            for name, color in PRECIP_COLORS:
+                if ptype is not None and ptype.startswith(name):
+                    qp.setBrush(QtGui.QBrush(QtGui.QColor(color)))
+                    qp.drawRect(QtCore.QRectF(self.idx_to_pix(idx) - col_wid / 2., top, col_wid, bot - top))
+                    break
+
+        qp.setPen(QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.SolidLine))
+        qp.setBrush(QtCore.Qt.NoBrush)
+        qp.drawRect(QtCore.QRectF(self.tlx, top, self.brx - self.tlx, bot - top))
+        qp.setFont(self.label_font)
+        qp.drawText(QtCore.QRectF(0, top, self.tlx - 6, bot - top),
+            QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter, "Precip")
+
+        ## The legend goes across the top of the strip
+        x = self.tlx + 4
+        for name, color in PRECIP_COLORS:
+            qp.setPen(QtGui.QPen(QtGui.QColor(color), 1, QtCore.Qt.SolidLine))
+            qp.drawText(QtCore.QPointF(x, top + self.label_height), name)
+            x += self.label_metrics.width(name) + 8
+
+    def drawTimeAxis(self, qp):
+        nt = self.ntimes()
+        col_wid = (self.brx - self.tlx) / nt
+        step = max(int(np.ceil(40. / col_wid)), 1)
+
+        qp.setPen(QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.SolidLine))
+        qp.setFont(self.label_font)
+        for idx in xrange(0, nt, step):
+            x = self.idx_to_pix(idx)
+            if self.fhours is not None and self.fhours[idx] is not None:
+                label = self.fhours[idx]
+            else:
+                label = self.series.dates[idx].strftime("%d/%HZ")
+            qp.drawLine(QtCore.QPointF(x, self.bry), QtCore.QPointF(x, self.bry + 3))
+            qp.drawText(QtCore.QRectF(x - 30, self.bry + 3, 60, self.bpad - 3),
+                QtCore.Qt.AlignHCenter | QtCore.Qt.AlignTop, label)
+
+    def drawCurrentTime(self, qp):
+        if self.current_idx >= self.ntimes():
+            return
+        x = self.idx_to_pix(self.current_idx)
+        qp.setPen(QtGui.QPen(QtGui.QColor("#FFFF00"), 1, QtCore.Qt.DashLine))
+        qp.drawLine(QtCore.QPointF(x, self.tly), QtCore.QPointF(x, self.bry))
+
+class TimeHeightWindow(QtGui.QWidget):
+    '''
+    A window with the time-height plot and a menu to pick the shaded
+    field. Shown from the SPC window (see SkewApp.showTimeSeries()).
+    '''
+    def __init__(self, series=None, current_idx=0, fhours=None, **kwargs):
+        super(TimeHeightWindow, self).__init__(**kwargs)
+        self.setWindowTitle("SHARPpy: Time-Height")
+        self.setStyleSheet("QWidget {background-color: rgb(0, 0, 0);}")
+        self.resize(900, 700)
+
+        self.field_dropdown = QtGui.QComboBox()
+        self.field_dropdown.setStyleSheet("QComboBox {color: #FFFFFF;}")
+        for name in SHADED_FIELDS:
+            self.field_dropdown.addItem(SECTION_SHADING[name][0])
+        self.field_dropdown.activated.connect(self.setField)
+
+        self.barb_box = QtGui.QCheckBox("Wind Barbs")
+        self.barb_box.setStyleSheet("QCheckBox {color: #FFFFFF;}")
+        self.barb_box.setChecked(True)
+        self.barb_box.toggled.connect(self.setBarbs)
+
+        self.plot = plotTimeHeight(series, current_idx=current_idx, fhours=fhours)
+
+        layout = QtGui.QGridLayout()
+        layout.setContentsMargins(2, 2, 2, 2)
+        layout.addWidget(self.field_dropdown, 0, 0)
+        layout.addWidget(self.barb_box, 0, 1)
+        layout.addWidget(self.plot, 1, 0, 1, 3)
+        layout.setColumnStretch(2, 1)
+        layout.setRowStretch(1, 1)
+        self.setLayout(layout)
+
+    def setSeries(self, series, current_idx=None, fhours=None):
+        self.plot.setSeries(series, current_idx=current_idx, fhours=fhours)
+
+    def setCurrentIdx(self, idx):
+        self.plot.setCurrentIdx(idx)
+
+    def setField(self, idx):
+        self.plot.setField(SHADED_FIELDS[idx])
+
+    def setBarbs(self, barbs):
+        self.plot.setBarbs(barbs)
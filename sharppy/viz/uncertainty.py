@@ -0,0 +1,165 @@
+import numpy as np
+from PySide import QtGui, QtCore
+import sharppy.sharptab as tab
+from sharppy.sharptab.uncertainty import PERCENTILES
+from sharppy.sharptab.constants import *
+
+__all__ = ['backgroundUncertainty', 'plotUncertainty']
+
+## The rows of the table, as (label, parameter name, format)
+UNCERTAINTY_ROWS = [
+    ('SBCAPE', 'sbcape', tab.utils.INT2STR),
+    ('SBCINH', 'sbcinh', tab.utils.INT2STR),
+    ('SBLCL', 'sblcl', tab.utils.INT2STR),
+    ('MLCAPE', 'mlcape', tab.utils.INT2STR),
+    ('MLCINH', 'mlcinh', tab.utils.INT2STR),
+    ('MLLCL', 'mllcl', tab.utils.INT2STR),
+    ('STP(cin)', 'stp_cin', lambda val: tab.utils.FLOAT2STR(val, 1)),
+]
+
+class backgroundUncertainty(QtGui.QFrame):
+    '''
+    Draw the background frame, title, and column headers for the parameter
+    uncertainty inset. Subclasses can change the title, subtitle, and rows
+    to show other tables of percentiles.
+    '''
+    title = 'Parameter Uncertainty'
+    subtitle = '(from T/Td std. dev.; percentiles)'
+    rows = UNCERTAINTY_ROWS
+
+    def __init__(self):
+        super(backgroundUncertainty, self).__init__()
+        self.initUI()
+
+    def initUI(self):
+        self.setStyleSheet("QFrame {"
+            "  background-color: rgb(0, 0, 0);"
+            "  border-width: 1px;"
+            "  border-style: solid;"
+            "  border-color: #3399CC;}")
+        if self.physicalDpiX() > 75:
+            fsize = 7
+        else:
+            fsize = 8
+        self.plot_font = QtGui.QFont('Helvetica', fsize + 1)
+        self.label_font = QtGui.QFont('Helvetica', fsize)
+        self.plot_metrics = QtGui.QFontMetrics(self.plot_font)
+        self.label_metrics = QtGui.QFontMetrics(self.label_font)
+        self.plot_height = self.plot_metrics.xHeight() + 5
+        self.label_height = self.label_metrics.xHeight() + 5
+        self.tpad = 5.; self.lpad = 5.
+        self.wid = self.size().width()
+        self.hgt = self.size().height()
+
+        ## One column for the row labels and one for each percentile
+        self.col_width = (self.wid - 2 * self.lpad) / (len(PERCENTILES) + 1.)
+        self.row_top = self.tpad + 3 * self.plot_height
+        self.row_height = (self.hgt - self.row_top - self.tpad) / (len(self.rows) + 1.)
+
+        self.plotBitMap = QtGui.QPixmap(self.width()-2, self.height()-2)
+        self.plotBitMap.fill(QtCore.Qt.black)
+        self.plotBackground()
+
+    def resizeEvent(self, e):
+        self.initUI()
+
+    def plotBackground(self):
+        qp = QtGui.QPainter()
+        qp.begin(self.plotBitMap)
+        qp.setRenderHint(qp.Antialiasing)
+        qp.setRenderHint(qp.TextAntialiasing)
+        self.draw_frame(qp)
+        qp.end()
+
+    def draw_frame(self, qp):
+        pen = QtGui.QPen(QtCore.Qt.white, 2, QtCore.Qt.SolidLine)
+        qp.setPen(pen)
+        qp.setFont(self.plot_font)
+        rect = QtCore.QRectF(1.5, self.tpad, self.wid, self.plot_height)
+        qp.drawText(rect, QtCore.Qt.TextDontClip | QtCore.Qt.AlignCenter, self.title)
+        rect = QtCore.QRectF(1.5, self.tpad + 1.5 * self.plot_height, self.wid, self.plot_height)
+        qp.setFont(self.label_font)
+        qp.drawText(rect, QtCore.Qt.TextDontClip | QtCore.Qt.AlignCenter, self.subtitle)
+
+        pen = QtGui.QPen(QtGui.QColor("#0080FF"), 1, QtCore.Qt.SolidLine)
+        qp.setPen(pen)
+        qp.drawLine(self.lpad, self.row_top + self.row_height, self.wid - self.lpad, self.row_top + self.row_height)
+
+        pen = QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.SolidLine)
+        qp.setPen(pen)
+        for col, pctl in enumerate(PERCENTILES):
+            qp.drawText(self.cell(-1, col), QtCore.Qt.TextDontClip | QtCore.Qt.AlignCenter, '%dth' % pctl)
+        for row, (label, name, fmt) in enumerate(self.rows):
+            qp.drawText(self.cell(row, -1), QtCore.Qt.TextDontClip | QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter, label)
+
+    def cell(self, row, col):
+        '''
+        The rectangle for a cell of the table. Row -1 is the column headers,
+        and column -1 is the row labels.
+        '''
+        x = self.lpad + (col + 1) * self.col_width
+        y = self.row_top + (row + 1) * self.row_height
+        return QtCore.QRectF(x, y, self.col_width, self.row_height)
+
+
+class plotUncertainty(backgroundUncertainty):
+    '''
+    Plot the percentiles of the parameters over the profiles perturbed by
+    the temperature and dewpoint standard deviations (see
+    sharppy.sharptab.uncertainty). Inherits the background class that plots
+    the frame.
+    '''
+    no_data = 'No T/Td Uncertainty Data'
+
+    def __init__(self, prof):
+        super(plotUncertainty, self).__init__()
+        self.pctls = prof.uncertainty
+
+    def setProf(self, prof):
+        self.pctls = prof.uncertainty
+        self.redraw()
+
+    def redraw(self):
+        self.clearData()
+        self.plotBackground()
+        self.plotData()
+        self.update()
+
+    def resizeEvent(self, e):
+        super(plotUncertainty, self).resizeEvent(e)
+        self.plotData()
+
+    def paintEvent(self, e):
+        super(plotUncertainty, self).paintEvent(e)
+        qp = QtGui.QPainter()
+        qp.begin(self)
+        qp.drawPixmap(1, 1, self.plotBitMap)
+        qp.end()
+
+    def clearData(self):
+        self.plotBitMap = QtGui.QPixmap(self.width(), self.height())
+        self.plotBitMap.fill(QtCore.Qt.black)
+
+    def plotData(self):
+        qp = QtGui.QPainter()
+        qp.begin(self.plotBitMap)
+        qp.setRenderHint(qp.Antialiasing)
+        qp.setRenderHint(qp.TextAntialiasing)
+        qp.setFont(self.label_font)
+
+        if self.pctls is None:
+            pen = QtGui.QPen(QtGui.QColor(LBROWN), 1, QtCore.Qt.SolidLine)
+            qp.setPen(pen)
+            rect = QtCore.QRectF(0, self.row_top, self.wid, self.hgt - self.row_top)
+            qp.drawText(rect, QtCore.Qt.TextDontClip | QtCore.Qt.AlignCenter, self.no_data)
+            qp.end()
+            return
+
+        for row, (label, name, fmt) in enumerate(self.rows):
+            for col, value in enumerate(self.pctls[name]):
+                ## Highlight the median
+                color = YELLOW if PERCENTILES[col] == 50 else WHITE
+                pen = QtGui.QPen(QtGui.QColor(color), 1, QtCore.Qt.SolidLine)
+                qp.setPen(pen)
+                qp.drawText(self.cell(row, col), QtCore.Qt.TextDontClip | QtCore.Qt.AlignCenter, fmt(value))
+        qp.end()